@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "gis"
+
+    def ready(self):
+        from gis import signals  # noqa: F401
@@ -0,0 +1,392 @@
+import json
+import platform
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from gis.benchmarks.synthetic import BOUNDS, CATEGORIES
+from gis.models import (
+    Directory,
+    Layer,
+    LayerFeature,
+    LayerProperty,
+    Project,
+    ProjectLayer,
+)
+from gis.pagination import encode_cursor
+from gis.partitions import (
+    attach_layer_partition,
+    create_detached_partition,
+    delete_layers,
+)
+from gis.tasks import finish_layer
+from gis.tiles import tile_columns, tile_rows
+
+BENCHMARK_USER = "api-benchmark@spatiallab.local"
+FEATURES_LAYER = "benchmark-features"
+EXPORT_LAYER = "benchmark-export"
+PAGE_SIZE = 50
+# Zoom of the tile requested, at the middle of the seeded bounds
+TILE_ZOOM = 10
+# Feature ids posted to features/by-ids/
+BY_IDS_COUNT = 1000
+
+FEATURE_PROPERTIES = {"name": "string", "value": "float", "category": "category"}
+
+
+def benchmark_user():
+    user = User.objects.filter(email=BENCHMARK_USER).first()
+    if user is None:
+        user = User.objects.create_user(BENCHMARK_USER)
+    return user
+
+
+def clear(user):
+    """Deletes everything seeded for the benchmark user."""
+    Project.objects.filter(owner=user).delete()
+    delete_layers(Layer.objects.filter(user=user))
+    Directory.objects.filter(user=user).delete()
+
+
+def seed_features(user, name, count):
+    """Creates a layer of ``count`` random points, loaded set-based in SQL."""
+    layer = Layer.objects.create(name=name, user=user)
+    minx, miny, maxx, maxy = BOUNDS
+    with transaction.atomic():
+        table = create_detached_partition(layer.id)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (layer_id, geometry, properties)
+                SELECT
+                    %(layer_id)s,
+                    ST_SetSRID(ST_MakePoint(
+                        %(minx)s + random() * %(width)s,
+                        %(miny)s + random() * %(height)s
+                    ), 4326) AS geom,
+                    jsonb_build_object(
+                        'name', 'Feature ' || i,
+                        'value', round((random() * 200)::numeric, 3),
+                        'category', (%(categories)s::text[])[1 + i %% %(kinds)s]
+                    )
+                FROM generate_series(1, %(count)s) AS i
+                ORDER BY geom
+            """,
+                {
+                    "layer_id": layer.id,
+                    "minx": minx,
+                    "miny": miny,
+                    "width": maxx - minx,
+                    "height": maxy - miny,
+                    "categories": CATEGORIES,
+                    "kinds": len(CATEGORIES),
+                    "count": count,
+                },
+            )
+        attach_layer_partition(layer.id)
+        LayerProperty.objects.bulk_create(
+            LayerProperty(layer=layer, name=name, type=type_)
+            for name, type_ in FEATURE_PROPERTIES.items()
+        )
+    finish_layer(layer.id, ["value"])
+    return layer
+
+
+def seed_directories(user, depth, branching):
+    """Creates a directory tree ``depth`` levels deep, level by level."""
+    level = Directory.objects.bulk_create(
+        Directory(name=f"dir-{index}", user=user) for index in range(branching)
+    )
+    directories = list(level)
+    for _ in range(depth - 1):
+        level = Directory.objects.bulk_create(
+            Directory(name=f"{parent.name}-{index}", parent=parent, user=user)
+            for parent in level
+            for index in range(branching)
+        )
+        directories.extend(level)
+    return directories
+
+
+def seed(
+    user,
+    layers=2000,
+    directory_depth=6,
+    directory_branching=3,
+    projects=50,
+    layers_per_project=20,
+    features=1_000_000,
+    export_features=50_000,
+    log=None,
+):
+    """Seeds the benchmark user's layers, directories, projects and features.
+
+    Layers are spread over the directory tree, with one in ten at the root.
+    Only the two feature layers hold features.
+    """
+
+    def step(message):
+        if log is not None:
+            log(message)
+
+    step(f"Seeding a {directory_depth} level directory tree")
+    directories = seed_directories(user, directory_depth, directory_branching)
+    step(f"Seeding {layers} layers")
+    empty_layers = Layer.objects.bulk_create(
+        Layer(
+            name=f"layer-{index}.geojson",
+            user=user,
+            directory=None
+            if index % 10 == 0
+            else directories[index % len(directories)],
+        )
+        for index in range(layers)
+    )
+    step(f"Seeding {features} features")
+    feature_layer = seed_features(user, FEATURES_LAYER, features)
+    step(f"Seeding {export_features} features to export")
+    seed_features(user, EXPORT_LAYER, export_features)
+
+    step(f"Seeding {projects} projects")
+    project_rows = Project.objects.bulk_create(
+        Project(name=f"project-{index}", owner=user) for index in range(projects)
+    )
+    ProjectLayer.objects.bulk_create(
+        ProjectLayer(
+            project=project,
+            layer=(
+                feature_layer
+                if order == 0
+                else empty_layers[(index * layers_per_project + order) % layers]
+            ),
+            order=order,
+        )
+        for index, project in enumerate(project_rows)
+        for order in range(layers_per_project)
+    )
+
+
+def fixtures(user):
+    """Returns the ids and parameters the scenarios request."""
+    feature_layer = Layer.objects.get(user=user, name=FEATURES_LAYER)
+    export_layer = Layer.objects.get(user=user, name=EXPORT_LAYER)
+    count = feature_layer.stats.feature_count
+    ids = LayerFeature.objects.filter(layer=feature_layer).order_by("id")
+    # The feature 90% of the way through the layer
+    deep_id = ids.values_list("id", flat=True)[int(count * 0.9)]
+    middle = ids.filter(id__gte=ids.values_list("id", flat=True)[count // 2])
+    return {
+        "feature_layer": feature_layer.id,
+        "export_layer": export_layer.id,
+        "project": Project.objects.filter(owner=user).order_by("id").first().id,
+        "feature_ids": list(middle.values_list("id", flat=True)[:BY_IDS_COUNT]),
+        "deep_page": max(int(count / PAGE_SIZE * 0.9), 1),
+        "deep_cursor": encode_cursor({"id": deep_id, "sort": None, "prev": False}),
+    }
+
+
+def middle_tile(z):
+    minx, miny, maxx, maxy = BOUNDS
+    x = tile_columns(np.array([(minx + maxx) / 2]), z)[0]
+    y = tile_rows(np.array([(miny + maxy) / 2]), z)[0]
+    return int(x), int(y)
+
+
+def scenarios(fixtures):
+    """Returns the requests to measure, as ``name: (method, path, data)``."""
+    layer = reverse("layer-detail", args=[fixtures["feature_layer"]])
+    tile_x, tile_y = middle_tile(TILE_ZOOM)
+    return {
+        "layers": ("get", reverse("layer-list"), None),
+        "directories": ("get", reverse("directory-list"), None),
+        "projects": ("get", reverse("project-list"), None),
+        "project": ("get", reverse("project-detail", args=[fixtures["project"]]), None),
+        "project_bootstrap": (
+            "get",
+            reverse("project-bootstrap", args=[fixtures["project"]]),
+            None,
+        ),
+        "layer_first_page": ("get", f"{layer}?page=1&page_size={PAGE_SIZE}", None),
+        "layer_deep_page": (
+            "get",
+            f"{layer}?page={fixtures['deep_page']}&page_size={PAGE_SIZE}",
+            None,
+        ),
+        "layer_deep_cursor": (
+            "get",
+            f"{layer}?cursor={fixtures['deep_cursor']}&page_size={PAGE_SIZE}",
+            None,
+        ),
+        "layer_sorted_page": (
+            "get",
+            f"{layer}?page=1&page_size={PAGE_SIZE}&sort=-value",
+            None,
+        ),
+        "features_by_ids": (
+            "post",
+            f"{reverse('features-by-ids')}?page_size={PAGE_SIZE}",
+            {
+                "layer_id": fixtures["feature_layer"],
+                "feature_ids": fixtures["feature_ids"],
+            },
+        ),
+        "layer_tile": (
+            "get",
+            reverse(
+                "layer-tile",
+                args=[fixtures["feature_layer"], TILE_ZOOM, tile_x, tile_y],
+            ),
+            None,
+        ),
+        "export_geojson": (
+            "get",
+            reverse("export_layer_geojson", args=[fixtures["export_layer"]]),
+            None,
+        ),
+    }
+
+
+def request(client, method, path, data):
+    """Makes one request and returns its status code and body size."""
+    if data is None:
+        response = getattr(client, method)(path)
+    else:
+        response = getattr(client, method)(
+            path, json.dumps(data), content_type="application/json"
+        )
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response.status_code, size
+
+
+def summarize(name, latencies, queries, sizes):
+    ms = np.array(latencies[1:] or latencies) * 1000
+    return {
+        "endpoint": name,
+        "requests": len(ms),
+        "first_ms": round(latencies[0] * 1000, 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "queries": int(np.median(queries)),
+        "queries_max": max(queries),
+        "bytes": int(np.median(sizes)),
+        # What one synchronous gunicorn worker can serve back to back
+        "requests_per_second_per_worker": round(1000 / float(ms.mean()), 1),
+    }
+
+
+def measure(scenarios, user, iterations=50, log=None):
+    """Requests each scenario ``iterations + 1`` times and summarizes them.
+
+    Requests go through the full middleware and view stack in process,
+    authenticated with a JWT like the frontend's. The first request of each
+    scenario is reported separately as ``first_ms``, since it runs with
+    cold caches.
+    """
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    results = []
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        for name, (method, path, data) in scenarios.items():
+            latencies, queries, sizes = [], [], []
+            for _ in range(iterations + 1):
+                with CaptureQueriesContext(connection) as captured:
+                    start = perf_counter()
+                    status_code, size = request(client, method, path, data)
+                    latencies.append(perf_counter() - start)
+                if status_code >= 400:
+                    raise RuntimeError(f"{name}: {method.upper()} {path} {status_code}")
+                queries.append(len(captured))
+                sizes.append(size)
+            result = summarize(name, latencies, queries, sizes)
+            results.append(result)
+            if log is not None:
+                log(result)
+    return results
+
+
+def seeded_user(reseed=False, seed_options=None, log=None):
+    """Returns the benchmark user, seeding its data on the first run."""
+    user = benchmark_user()
+    if reseed:
+        clear(user)
+    if not Layer.objects.filter(user=user).exists():
+        seed(user, log=log, **(seed_options or {}))
+    return user
+
+
+def select(requests, endpoints):
+    """Returns the scenarios named in ``endpoints``, or all of them."""
+    if not endpoints:
+        return requests
+    unknown = set(endpoints) - set(requests)
+    if unknown:
+        raise ValueError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    return {name: requests[name] for name in endpoints}
+
+
+def run_benchmark(
+    iterations=50, endpoints=None, reseed=False, seed_options=None, log=None
+):
+    """Seeds the benchmark data if needed, measures the API and returns
+    the results as a dict."""
+    user = seeded_user(reseed, seed_options, log)
+    requests = select(scenarios(fixtures(user)), endpoints)
+
+    def log_result(result):
+        if log is not None:
+            log(
+                f"{result['endpoint']}: p50 {result['p50_ms']} ms, "
+                f"p95 {result['p95_ms']} ms, {result['queries']} queries, "
+                f"{result['bytes']} bytes"
+            )
+
+    return {
+        "benchmark": "api",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "debug": settings.DEBUG,
+        },
+        "data": {
+            "layers": Layer.objects.filter(user=user).count(),
+            "directories": Directory.objects.filter(user=user).count(),
+            "projects": Project.objects.filter(owner=user).count(),
+        },
+        "iterations": iterations,
+        "results": measure(requests, user, iterations, log_result),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns the endpoints that got slower at p95 by more than
+    ``tolerance``, or that run more queries, as ``(endpoint, metric,
+    baseline, current)`` rows."""
+    previous = {result["endpoint"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        before = previous.get(result["endpoint"])
+        if before is None:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                (result["endpoint"], "p95_ms", before["p95_ms"], result["p95_ms"])
+            )
+        if result["queries"] > before["queries"]:
+            regressions.append(
+                (result["endpoint"], "queries", before["queries"], result["queries"])
+            )
+    return regressions
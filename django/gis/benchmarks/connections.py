@@ -0,0 +1,154 @@
+import platform
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from gis.benchmarks.api import (
+    fixtures,
+    request,
+    scenarios,
+    seeded_user,
+    select,
+    summarize,
+)
+
+# The tile and the small JSON endpoints, where opening a connection is a
+# large share of the request
+DEFAULT_ENDPOINTS = ["layer_tile", "layers", "directories", "project"]
+
+# Each mode's CONN_MAX_AGE: closed at the end of every request, as without
+# persistent connections, or kept for the whole run
+MODES = {"per_request": 0, "persistent": None}
+
+
+def measure_connect(iterations):
+    """Returns the p50 and p95 time to open a database connection."""
+    latencies = []
+    for _ in range(iterations):
+        connection.close()
+        start = perf_counter()
+        connection.ensure_connection()
+        latencies.append(perf_counter() - start)
+    ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+    }
+
+
+def serve(client, method, path, data):
+    """Makes one request the way a server does.
+
+    The test client leaves connections open across requests, so the
+    connection handling a server runs at the start and end of each
+    request is run here.
+    """
+    close_old_connections()
+    try:
+        return request(client, method, path, data)
+    finally:
+        close_old_connections()
+
+
+def measure(requests, user, iterations, max_age, log=None):
+    """Serves each scenario ``iterations + 1`` times with connections kept
+    for ``max_age`` seconds, and summarizes them with the number of
+    connections opened."""
+    opened = []
+
+    def count(sender, connection, **kwargs):
+        opened.append(connection.alias)
+
+    client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    configured = connection.settings_dict["CONN_MAX_AGE"]
+    connection.close()
+    connection.settings_dict["CONN_MAX_AGE"] = max_age
+    connection_created.connect(count)
+    results = []
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, (method, path, data) in requests.items():
+                opened.clear()
+                latencies, queries, sizes = [], [], []
+                for _ in range(iterations + 1):
+                    with CaptureQueriesContext(connection) as captured:
+                        start = perf_counter()
+                        status_code, size = serve(client, method, path, data)
+                        latencies.append(perf_counter() - start)
+                    if status_code >= 400:
+                        raise RuntimeError(
+                            f"{name}: {method.upper()} {path} {status_code}"
+                        )
+                    queries.append(len(captured))
+                    sizes.append(size)
+                result = {
+                    **summarize(name, latencies, queries, sizes),
+                    "connections": len(opened),
+                }
+                results.append(result)
+                if log is not None:
+                    log(result)
+    finally:
+        connection_created.disconnect(count)
+        connection.close()
+        connection.settings_dict["CONN_MAX_AGE"] = configured
+    return results
+
+
+def run_benchmark(iterations=200, endpoints=None, log=None):
+    """Measures the endpoints with a connection opened per request and
+    with persistent connections, and returns the results as a dict.
+
+    Persistent connections are health checked once per request, as
+    ``CONN_HEALTH_CHECKS`` configures them.
+    """
+    user = seeded_user(log=log)
+    requests = select(scenarios(fixtures(user)), endpoints or DEFAULT_ENDPOINTS)
+
+    results = {}
+    for mode, max_age in MODES.items():
+
+        def log_result(result):
+            if log is not None:
+                log(
+                    f"{mode} {result['endpoint']}: p50 {result['p50_ms']} ms, "
+                    f"p95 {result['p95_ms']} ms, "
+                    f"{result['connections']} connections"
+                )
+
+        results[mode] = measure(requests, user, iterations, max_age, log_result)
+
+    savings = []
+    for before, after in zip(results["per_request"], results["persistent"]):
+        savings.append(
+            {
+                "endpoint": before["endpoint"],
+                "p50_ms_saved": round(before["p50_ms"] - after["p50_ms"], 2),
+                "p95_ms_saved": round(before["p95_ms"] - after["p95_ms"], 2),
+                "speedup": round(before["mean_ms"] / after["mean_ms"], 2),
+            }
+        )
+
+    return {
+        "benchmark": "connections",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "debug": settings.DEBUG,
+            "db_role": settings.DB_ROLE,
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "conn_health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+        },
+        "iterations": iterations,
+        "connect": measure_connect(iterations),
+        "results": results,
+        "savings": savings,
+    }
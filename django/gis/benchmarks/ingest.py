@@ -0,0 +1,269 @@
+import os
+import platform
+import resource
+import sys
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from time import perf_counter
+
+import fiona
+import shapely
+from django.db import connection, connections
+
+from accounts.models import User
+from gis.benchmarks.synthetic import write_synthetic_layer
+from gis.generalize import build_feature_levels
+from gis.models import Layer, LayerFeature
+from gis.partitions import delete_layers
+from gis.storage import LocalStorage, Storage
+from gis.tasks import FileIngestor, finish_layer
+
+BENCHMARK_USER = "benchmark@spatiallab.local"
+BENCHMARK_BUCKET = "benchmark"
+
+
+class StageTimer:
+    """Accumulates wall time per named stage."""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    @contextmanager
+    def __call__(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += perf_counter() - start
+
+
+class TimedFile:
+    """Wraps a file object, timing its reads as the download stage."""
+
+    def __init__(self, file_obj, timer):
+        self.file_obj = file_obj
+        self.timer = timer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file_obj.close()
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+    def __getattr__(self, name):
+        attribute = getattr(self.file_obj, name)
+        if name not in ("read", "read1", "readinto", "readline", "seek"):
+            return attribute
+
+        def timed(*args, **kwargs):
+            with self.timer("download"):
+                return attribute(*args, **kwargs)
+
+        return timed
+
+
+class TimedStorage(Storage):
+    """Wraps a storage so reads through ``open`` are timed."""
+
+    def __init__(self, storage, timer):
+        self.storage = storage
+        self.timer = timer
+
+    def open(self, name):
+        with self.timer("download"):
+            file_obj = self.storage.open(name)
+        return TimedFile(file_obj, self.timer)
+
+    def size(self, name):
+        return self.storage.size(name)
+
+    def gdal_path(self, name):
+        return self.storage.gdal_path(name)
+
+    def gdal_options(self):
+        return self.storage.gdal_options()
+
+
+class TimedIngestor(FileIngestor):
+    """A FileIngestor that times each stage of a load.
+
+    Time spent pulling features from the reader is ``read``, which
+    includes the ``download`` of the bytes behind them.
+    """
+
+    def __init__(self, *args, timer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timer = timer
+
+    def load_features(self, layer, features):
+        super().load_features(layer, self.timed_features(features))
+
+    def timed_features(self, features):
+        features = iter(features)
+        while True:
+            with self.timer("read"):
+                feature = next(features, None)
+            if feature is None:
+                return
+            yield feature
+
+    def reproject(self, geoms):
+        with self.timer("reproject"):
+            return super().reproject(geoms)
+
+    def write_batch(self, feature_batch, geoms):
+        with self.timer("insert"):
+            super().write_batch(feature_batch, geoms)
+
+    def finish_load(self, layer):
+        with self.timer("insert"):
+            super().finish_load(layer)
+
+
+def rss_mb():
+    """Returns the process's current resident set size in MiB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+def peak_rss_mb():
+    """Returns the process's peak resident set size in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def case_name(case):
+    return "{geometry}-{count}-{crs}-{format}".format(**case)
+
+
+def run_case(case, directory, loader, keep=False):
+    """Ingests one synthetic file end to end and returns its measurements.
+
+    Meant to run in a fresh process, so the peak RSS is the case's own.
+    """
+    baseline_rss = rss_mb()
+    timer = StageTimer()
+    user = User.objects.filter(email=BENCHMARK_USER).first()
+    if user is None:
+        user = User.objects.create_user(BENCHMARK_USER)
+    ingestor = TimedIngestor(
+        f"gs://{BENCHMARK_BUCKET}/{case['file_name']}",
+        f"benchmark-{uuid.uuid4().hex[:8]}-{case['file_name']}",
+        None,
+        user.email,
+        task_id=f"benchmark-{uuid.uuid4()}",
+        loader=loader,
+        timer=timer,
+    )
+    ingestor.storage = TimedStorage(LocalStorage(directory), timer)
+
+    start = perf_counter()
+    layer_id = ingestor.ingest_file_to_db()
+    load_seconds = perf_counter() - start
+    with timer("finalize"):
+        finish_layer(layer_id)
+    # Queued after the ingest in production, and timed here as its own stage
+    with timer("levels"):
+        build_feature_levels(layer_id)
+    seconds = perf_counter() - start
+
+    loaded = LayerFeature.objects.filter(layer_id=layer_id).count()
+    if keep:
+        ingestor.checkpoint.delete()
+    else:
+        delete_layers(Layer.objects.filter(id=layer_id))
+
+    stages = dict(timer.seconds)
+    read = stages.pop("read", 0.0)
+    download = stages.setdefault("download", 0.0)
+    stages["parse"] = max(read - download, 0.0)
+    accounted = read + stages.get("reproject", 0.0) + stages.get("insert", 0.0)
+    # Building geometries, inferring the schema and reporting progress
+    stages["other"] = max(load_seconds - accounted, 0.0)
+    return {
+        "case": case_name(case),
+        **{key: case[key] for key in ("geometry", "count", "crs", "format")},
+        "file_bytes": os.path.getsize(os.path.join(directory, case["file_name"])),
+        "loaded_features": loaded,
+        "seconds": round(seconds, 4),
+        "features_per_second": round(loaded / load_seconds, 1),
+        "baseline_rss_mb": baseline_rss and round(baseline_rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": {stage: round(value, 4) for stage, value in sorted(stages.items())},
+    }
+
+
+def environment():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version(), postgis_full_version()")
+        postgres, postgis = cursor.fetchone()
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "gdal": fiona.__gdal_version__,
+        "geos": shapely.geos_version_string,
+        "postgres": postgres,
+        "postgis": postgis,
+    }
+
+
+def run_benchmark(cases, data_dir, loader="copy", repeat=1, keep=False, log=None):
+    """Runs the ingest benchmark and returns its results as a dict.
+
+    ``cases`` are dicts of ``geometry``, ``count``, ``crs`` and ``format``.
+    Synthetic files are written to ``data_dir``, and reused across runs.
+    Each case runs ``repeat`` times, each time in a forked process.
+    """
+    directory = os.path.join(data_dir, BENCHMARK_BUCKET)
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    for case in cases:
+        case = {**case, "file_name": write_synthetic_layer(directory, **case)}
+        for run in range(repeat):
+            # A forked process must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(1, mp_context=get_context("fork")) as executor:
+                result = executor.submit(
+                    run_case, case, directory, loader, keep
+                ).result()
+            result["run"] = run
+            results.append(result)
+            if log is not None:
+                log(result)
+    return {
+        "benchmark": "ingest",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "environment": environment(),
+        "settings": {"loader": loader, "batch_size": FileIngestor.batch_size},
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns the cases whose throughput fell more than ``tolerance`` below
+    the baseline, as ``(case, baseline, current)`` rows."""
+
+    def throughput(report):
+        runs = defaultdict(list)
+        for result in report["results"]:
+            runs[result["case"]].append(result["features_per_second"])
+        # The best run is the least disturbed by noise
+        return {case: max(values) for case, values in runs.items()}
+
+    current, previous = throughput(results), throughput(baseline)
+    return [
+        (case, previous[case], value)
+        for case, value in current.items()
+        if case in previous and value < previous[case] * (1 - tolerance)
+    ]
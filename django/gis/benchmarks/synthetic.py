@@ -0,0 +1,153 @@
+import datetime
+import json
+import os
+import tempfile
+import zipfile
+
+import fiona
+import numpy as np
+import shapely
+from pyproj import Transformer
+
+# Synthetic features fall in this EPSG:4326 box, which every CRS offered
+# below can represent
+BOUNDS = (-105.0, 35.0, -95.0, 45.0)
+CATEGORIES = ["residential", "commercial", "industrial", "park", "water"]
+
+GEOMETRY_TYPES = {"point": "Point", "line": "LineString", "polygon": "Polygon"}
+FORMATS = {"geojson": ".geojson", "shapefile": ".zip"}
+
+# Features generated and written at a time
+CHUNK_SIZE = 10_000
+
+
+def random_geometries(rng, geometry, count):
+    """Returns ``count`` random EPSG:4326 geometries of one type."""
+    minx, miny, maxx, maxy = BOUNDS
+    centers = rng.uniform((minx, miny), (maxx, maxy), size=(count, 2))
+    if geometry == "point":
+        return shapely.points(centers)
+    if geometry == "line":
+        # Random walks of 10 vertices, about 1 km per step
+        steps = rng.normal(scale=0.01, size=(count, 9, 2))
+        coords = np.concatenate([centers[:, None], steps], axis=1).cumsum(axis=1)
+        return shapely.linestrings(coords)
+    if geometry == "polygon":
+        # Star-shaped 16-gons, so the rings never self-intersect
+        angles = np.sort(rng.uniform(0, 2 * np.pi, size=(count, 16)), axis=1)
+        radii = rng.uniform(0.002, 0.005, size=(count, 1)) * rng.uniform(
+            0.7, 1.0, size=(count, 16)
+        )
+        ring = centers[:, None] + np.stack(
+            [radii * np.cos(angles), radii * np.sin(angles)], axis=-1
+        )
+        return shapely.polygons(np.concatenate([ring, ring[:, :1]], axis=1))
+    raise ValueError(f"Unknown geometry type: {geometry}")
+
+
+def random_properties(rng, start, count):
+    days = rng.integers(0, 365, size=count)
+    values = rng.normal(100, 25, size=count)
+    categories = rng.integers(0, len(CATEGORIES), size=count)
+    return [
+        {
+            "id": start + i,
+            "name": f"Feature {start + i}",
+            "value": round(float(values[i]), 3),
+            "category": CATEGORIES[categories[i]],
+            "observed": datetime.date(2024, 1, 1) + datetime.timedelta(int(days[i])),
+        }
+        for i in range(count)
+    ]
+
+
+def synthetic_chunks(geometry, count, crs, seed=0):
+    """Yields ``(geoms, properties)`` chunks of a synthetic layer.
+
+    The same arguments always give the same features.
+    """
+    rng = np.random.default_rng(seed)
+    transformer = None
+    if crs != "EPSG:4326":
+        transformer = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    for start in range(0, count, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, count - start)
+        geoms = random_geometries(rng, geometry, size)
+        if transformer is not None:
+            geoms = shapely.transform(
+                geoms, lambda xy: np.column_stack(transformer.transform(*xy.T))
+            )
+        yield geoms, random_properties(rng, start, size)
+
+
+def write_geojson(path, chunks, crs):
+    """Writes a FeatureCollection, with a ``crs`` member unless EPSG:4326."""
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection",\n')
+        if crs != "EPSG:4326":
+            f.write(f'"crs": {{"type": "name", "properties": {{"name": "{crs}"}}}},\n')
+        f.write('"features": [\n')
+        separator = ""
+        for geoms, properties in chunks:
+            f.write(separator)
+            f.write(
+                ",\n".join(
+                    f'{{"type": "Feature", "geometry": {geometry}, '
+                    f'"properties": {json.dumps(props, default=str)}}}'
+                    for geometry, props in zip(shapely.to_geojson(geoms), properties)
+                )
+            )
+            separator = ",\n"
+        f.write("\n]}\n")
+
+
+def write_zipped_shapefile(path, chunks, geometry, crs):
+    """Writes a shapefile and zips it with its sidecar files."""
+    schema = {
+        "geometry": GEOMETRY_TYPES[geometry],
+        "properties": {
+            "id": "int",
+            "name": "str",
+            "value": "float",
+            "category": "str",
+            "observed": "date",
+        },
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        shapefile = os.path.join(directory, f"{stem}.shp")
+        with fiona.open(
+            shapefile, "w", driver="ESRI Shapefile", crs=crs, schema=schema
+        ) as collection:
+            for geoms, properties in chunks:
+                collection.writerecords(
+                    {"geometry": shapely.geometry.mapping(geom), "properties": props}
+                    for geom, props in zip(geoms, properties)
+                )
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name in sorted(os.listdir(directory)):
+                archive.write(os.path.join(directory, name), name)
+
+
+def synthetic_file_name(geometry, count, crs, format):
+    return f"{geometry}_{count}_{crs.replace(':', '').lower()}{FORMATS[format]}"
+
+
+def write_synthetic_layer(directory, geometry, count, crs, format, seed=0):
+    """Writes a synthetic layer file into ``directory`` and returns its name.
+
+    Files are named after their arguments and reused if they already exist.
+    """
+    name = synthetic_file_name(geometry, count, crs, format)
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return name
+    chunks = synthetic_chunks(geometry, count, crs, seed)
+    # Written under a temporary name, so an interrupted run leaves no file
+    partial = f"{path}.partial{FORMATS[format]}"
+    if format == "geojson":
+        write_geojson(partial, chunks, crs)
+    else:
+        write_zipped_shapefile(partial, chunks, geometry, crs)
+    os.replace(partial, path)
+    return name
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from gis.models import Directory, Layer
+from gis.serializers import DirectoryNodeSerializer, LayerSerializer
+from gis.versions import get_version, user_scope
+
+
+def build_directory_tree(user_id):
+    """Returns a user's directories nested with their subdirectories and
+    layers, each sorted by name.
+
+    The directories and layers are loaded with one query each and nested
+    in memory, however deep the tree is. A directory or layer inside
+    another user's directory is left out, since it cannot be reached from
+    the user's top-level directories.
+    """
+    directories = DirectoryNodeSerializer(
+        Directory.objects.filter(user_id=user_id).order_by("name", "id"), many=True
+    ).data
+    layers = LayerSerializer(
+        Layer.objects.filter(user_id=user_id, directory__isnull=False).order_by(
+            "name", "id"
+        ),
+        many=True,
+    ).data
+
+    nodes = {
+        directory["id"]: {**directory, "subdirectories": [], "layers": []}
+        for directory in directories
+    }
+    roots = []
+    for node in nodes.values():
+        if node["parent"] is None:
+            roots.append(node)
+        elif node["parent"] in nodes:
+            nodes[node["parent"]]["subdirectories"].append(node)
+    for layer in layers:
+        if layer["directory"] in nodes:
+            nodes[layer["directory"]]["layers"].append(layer)
+    return roots
+
+
+def get_directory_tree(user_id):
+    """Returns a user's directory tree from the cache, or builds and caches it.
+
+    The version is part of the key, so any change to the user's directories
+    or layers orphans the cached tree at once.
+    """
+    scope = user_scope(user_id)
+    key = f"{scope}:directory_tree:{get_version(scope)}"
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_directory_tree(user_id)
+        cache.set(key, tree, timeout=settings.VERSIONED_CACHE_TIMEOUT)
+    return tree
+
+
+def subtree_ids(directory_id):
+    """Returns the ids of a directory and every directory below it."""
+    ids = [directory_id]
+    level = ids
+    while level:
+        level = list(
+            Directory.objects.filter(parent_id__in=level).values_list("id", flat=True)
+        )
+        ids.extend(level)
+    return ids
+
+
+def find_directory(tree, directory_id):
+    """Returns the node of a directory in a tree, or None."""
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        if node["id"] == directory_id:
+            return node
+        stack.extend(node["subdirectories"])
+    return None
@@ -0,0 +1,57 @@
+import redis.asyncio as redis
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from gis.progress import events_channel
+
+
+async def event_stream(user_id):
+    """Yields a user's task events as Server-Sent Events.
+
+    Each subscriber holds one Redis connection, and is sent a comment while
+    idle so proxies keep the stream open.
+    """
+    client = redis.from_url(settings.CACHES["default"]["LOCATION"])
+    pubsub = client.pubsub()
+    await pubsub.subscribe(events_channel(user_id))
+    try:
+        yield f"retry: {settings.TASK_EVENT_RETRY_MS}\n\n"
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.TASK_EVENT_KEEPALIVE,
+            )
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: task\ndata: {message['data'].decode()}\n\n"
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
+
+
+async def task_events(request):
+    """Streams the status of the user's tasks as they change.
+
+    Served by the ASGI application, where an open stream costs a coroutine
+    rather than a worker. EventSource cannot send headers, so the access
+    token is passed as the ``token`` query parameter. The polling endpoint
+    still serves clients that cannot subscribe.
+    """
+    try:
+        token = AccessToken(request.GET.get("token", ""))
+    except TokenError:
+        return JsonResponse({"error": "Invalid or expired token."}, status=401)
+
+    response = StreamingHttpResponse(
+        event_stream(token[api_settings.USER_ID_CLAIM]),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    # Otherwise nginx buffers the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,381 @@
+import csv
+import datetime
+import json
+import os
+import zipfile
+import zlib
+from pathlib import Path
+
+import fiona
+import shapely
+import shapely.geometry
+from django.db import connection, transaction
+
+from gis.models import LayerFeature
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_FETCH_SIZE = 2000
+
+# LayerProperty types as Fiona field types
+FIONA_FIELD_TYPES = {
+    "integer": "int",
+    "float": "float",
+    "boolean": "bool",
+    "date": "date",
+    "datetime": "datetime",
+    "category": "str",
+    "string": "str",
+    "json": "str",
+}
+
+MULTI_TYPE_IDS = {
+    "MultiPoint": shapely.GeometryType.MULTIPOINT,
+    "MultiLineString": shapely.GeometryType.MULTILINESTRING,
+    "MultiPolygon": shapely.GeometryType.MULTIPOLYGON,
+}
+
+# PostGIS GeometryType() names as OGC simple feature type names
+GEOMETRY_TYPES = {
+    "POINT": "Point",
+    "LINESTRING": "LineString",
+    "POLYGON": "Polygon",
+    "MULTIPOINT": "MultiPoint",
+    "MULTILINESTRING": "MultiLineString",
+    "MULTIPOLYGON": "MultiPolygon",
+    "GEOMETRYCOLLECTION": "GeometryCollection",
+}
+
+GEOJSON_FEATURES_SQL = f"""
+    SELECT json_build_object(
+        'type', 'Feature',
+        'id', id,
+        'geometry', ST_AsGeoJSON(geometry)::json,
+        'properties', properties
+    )::text
+    FROM {LayerFeature._meta.db_table}
+    WHERE layer_id = %s
+    ORDER BY id
+"""
+
+
+def iter_geojson(layer_id):
+    """Yields a layer as a GeoJSON FeatureCollection, in chunks of text.
+
+    PostGIS renders each feature as JSON, and rows are read through a
+    server-side cursor, so neither the features nor their JSON are held in
+    memory or parsed in Python.
+    """
+    yield '{"type": "FeatureCollection", "features": [\n'
+    separator = ""
+    # A server-side cursor outside a transaction is materialized in full
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(GEOJSON_FEATURES_SQL, [layer_id])
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            yield separator + ",\n".join(row[0] for row in rows)
+            separator = ",\n"
+    yield "\n]}\n"
+
+
+def gzip_stream(chunks):
+    """Gzips a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_feature_batches(layer_id):
+    """Yields ``(geoms, properties)`` batches of a layer's features.
+
+    Geometries arrive as WKB and are decoded into a shapely array per
+    batch. Rows are read through a server-side cursor, like ``iter_geojson``.
+    """
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT ST_AsBinary(geometry), properties
+            FROM {LayerFeature._meta.db_table}
+            WHERE layer_id = %s
+            ORDER BY id
+        """,
+            [layer_id],
+        )
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            geoms = shapely.from_wkb([bytes(row[0]) for row in rows])
+            properties = [
+                json.loads(row[1]) if isinstance(row[1], str) else row[1]
+                for row in rows
+            ]
+            yield geoms, properties
+
+
+def export_value(value, type_):
+    """Converts a stored property value to the Python type of its column.
+
+    Ingest keeps values as they appeared in the source file, so numbers,
+    booleans and dates may still be strings.
+    """
+    if value is None or value == "":
+        return None
+    try:
+        if type_ == "integer":
+            return int(value)
+        if type_ == "float":
+            return float(value)
+        if type_ == "boolean":
+            return value if isinstance(value, bool) else str(value).lower() == "true"
+        if type_ == "date":
+            return datetime.date.fromisoformat(str(value)[:10])
+        if type_ == "datetime":
+            return datetime.datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+    if type_ == "json" or isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+MULTI_GEOMETRIES = {
+    "MultiPoint": shapely.multipoints,
+    "MultiLineString": shapely.multilinestrings,
+    "MultiPolygon": shapely.multipolygons,
+}
+
+
+def promote_to_multi(geoms, geometry_type):
+    """Wraps the single part geometries in a batch as one part multis."""
+    single = shapely.get_type_id(geoms) != MULTI_TYPE_IDS[geometry_type]
+    geoms = geoms.copy()
+    geoms[single] = [MULTI_GEOMETRIES[geometry_type]([geom]) for geom in geoms[single]]
+    return geoms
+
+
+def schema_geometry_type(geometry_types):
+    """Returns the Fiona geometry type for a LayerStats geometry histogram.
+
+    Single and multi part geometries of one kind are declared as the multi
+    type, since Shapefile needs one type per file.
+    """
+    if len(geometry_types) == 1:
+        return GEOMETRY_TYPES.get(next(iter(geometry_types)), "Unknown")
+    kinds = {type_.replace("MULTI", "") for type_ in geometry_types}
+    if len(kinds) == 1:
+        return GEOMETRY_TYPES.get(f"MULTI{kinds.pop()}", "Unknown")
+    return "Unknown"
+
+
+class FionaExporter:
+    """Writes features to a file with a Fiona (OGR) driver."""
+
+    driver = None
+    extension = None
+    # Overrides of FIONA_FIELD_TYPES for drivers lacking some field types
+    field_types = {}
+
+    def __init__(self, layer, stats, directory):
+        self.layer = layer
+        self.properties = stats.properties
+        self.path = os.path.join(directory, f"{export_stem(layer)}.{self.extension}")
+        field_types = {**FIONA_FIELD_TYPES, **self.field_types}
+        self.geometry_type = schema_geometry_type(stats.geometry_types)
+        self.collection = fiona.open(
+            self.path,
+            "w",
+            driver=self.driver,
+            crs="EPSG:4326",
+            schema={
+                "geometry": self.geometry_type,
+                "properties": {
+                    prop["name"]: field_types[prop["type"]] for prop in self.properties
+                },
+            },
+        )
+
+    def write_batch(self, geoms, properties):
+        if self.geometry_type in MULTI_GEOMETRIES:
+            geoms = promote_to_multi(geoms, self.geometry_type)
+        self.collection.writerecords(
+            {
+                "geometry": shapely.geometry.mapping(geom),
+                "properties": {
+                    prop["name"]: self.value(values.get(prop["name"]), prop["type"])
+                    for prop in self.properties
+                },
+            }
+            for geom, values in zip(geoms, properties)
+        )
+
+    def value(self, value, type_):
+        value = export_value(value, type_)
+        if value is not None and self.field_types.get(type_) == "str":
+            return str(value)
+        return value
+
+    def finish(self):
+        """Closes the export and returns the path of the file to download."""
+        self.collection.close()
+        return self.path
+
+
+class GeoPackageExporter(FionaExporter):
+    driver = "GPKG"
+    extension = "gpkg"
+
+
+class FlatGeobufExporter(FionaExporter):
+    """FlatGeobuf with a packed Hilbert R-tree, for fast bbox reads."""
+
+    driver = "FlatGeobuf"
+    extension = "fgb"
+    field_types = {"date": "str"}
+
+
+class ShapefileExporter(FionaExporter):
+    """A Shapefile and its sidecar files, zipped into one download."""
+
+    driver = "ESRI Shapefile"
+    extension = "shp"
+    field_types = {"boolean": "str", "datetime": "str", "json": "str"}
+
+    def finish(self):
+        super().finish()
+        stem = os.path.splitext(self.path)[0]
+        zip_path = f"{stem}.zip"
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for suffix in (".shp", ".shx", ".dbf", ".prj", ".cpg"):
+                if os.path.exists(stem + suffix):
+                    archive.write(stem + suffix, os.path.basename(stem + suffix))
+        return zip_path
+
+
+class CSVExporter:
+    """CSV with the geometry as WKT in the first column."""
+
+    def __init__(self, layer, stats, directory):
+        self.properties = stats.properties
+        self.path = os.path.join(directory, f"{export_stem(layer)}.csv")
+        self.file = open(self.path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["WKT"] + [prop["name"] for prop in self.properties])
+
+    def write_batch(self, geoms, properties):
+        self.writer.writerows(
+            [wkt]
+            + [
+                export_value(values.get(prop["name"]), prop["type"])
+                for prop in self.properties
+            ]
+            for wkt, values in zip(shapely.to_wkt(geoms), properties)
+        )
+
+    def finish(self):
+        self.file.close()
+        return self.path
+
+
+class GeoParquetExporter:
+    """GeoParquet 1.0 with WKB geometries, written one row group per batch."""
+
+    def __init__(self, layer, stats, directory):
+        # pyarrow is large and only needed here
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.properties = stats.properties
+        self.path = os.path.join(directory, f"{export_stem(layer)}.parquet")
+        field_types = {
+            "integer": pa.int64(),
+            "float": pa.float64(),
+            "boolean": pa.bool_(),
+            "date": pa.date32(),
+            "datetime": pa.timestamp("us", tz="UTC"),
+            "category": pa.string(),
+            "string": pa.string(),
+            "json": pa.string(),
+        }
+        fields = [pa.field("geometry", pa.binary())] + [
+            pa.field(prop["name"], field_types[prop["type"]])
+            for prop in self.properties
+        ]
+        geo = {
+            "version": "1.0.0",
+            "primary_column": "geometry",
+            "columns": {
+                "geometry": {
+                    "encoding": "WKB",
+                    "geometry_types": sorted(
+                        GEOMETRY_TYPES[type_]
+                        for type_ in stats.geometry_types
+                        if type_ in GEOMETRY_TYPES
+                    ),
+                    "bbox": stats.extent,
+                }
+            },
+        }
+        self.schema = pa.schema(fields, metadata={"geo": json.dumps(geo)})
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+
+    def write_batch(self, geoms, properties):
+        columns = [shapely.to_wkb(geoms).tolist()] + [
+            [
+                export_value(values.get(prop["name"]), prop["type"])
+                for values in properties
+            ]
+            for prop in self.properties
+        ]
+        arrays = [
+            self.pa.array(column, type=field.type)
+            for column, field in zip(columns, self.schema)
+        ]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def finish(self):
+        self.writer.close()
+        return self.path
+
+
+EXPORTERS = {
+    "gpkg": GeoPackageExporter,
+    "fgb": FlatGeobufExporter,
+    "shapefile": ShapefileExporter,
+    "csv": CSVExporter,
+    "parquet": GeoParquetExporter,
+}
+
+
+def get_exporter(name):
+    try:
+        return EXPORTERS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown export format '{name}'. Choose from: {', '.join(EXPORTERS)}"
+        )
+
+
+def export_stem(layer):
+    return Path(layer.name).stem
+
+
+def export_layer(layer, stats, format, directory, progress=None):
+    """Writes a layer to a file in ``directory`` and returns its path.
+
+    ``progress`` is called with the number of features written so far after
+    each batch.
+    """
+    exporter = get_exporter(format)(layer, stats, directory)
+    written = 0
+    for geoms, properties in iter_feature_batches(layer.id):
+        exporter.write_batch(geoms, properties)
+        written += len(geoms)
+        if progress is not None:
+            progress(written)
+    return exporter.finish()
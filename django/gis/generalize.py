@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db import connection
+
+from gis.models import Layer, LayerFeature
+from gis.partitions import (
+    LEVEL_TABLE,
+    attach_layer_partition,
+    create_detached_partition,
+    drop_level_partition,
+)
+from gis.versions import invalidate_layers
+
+# Earth's circumference in Web Mercator meters
+WORLD_SIZE = 40075016.68
+
+# The highest zoom each level serves, finest first. Zooms above the last
+# level read full resolution geometries from LayerFeature.
+LEVEL_MAX_ZOOMS = [8, 5, 2]
+
+
+def level_tolerance(max_zoom):
+    """Returns the simplification tolerance, in meters, for a level.
+
+    This is the size of one pixel of a 256 pixel tile at the level's highest
+    zoom, so simplification is invisible at every zoom the level serves.
+    """
+    return WORLD_SIZE / (256 * 2**max_zoom)
+
+
+def level_for_zoom(z):
+    """Returns the index of the level that serves zoom z, or None."""
+    for level, max_zoom in reversed(list(enumerate(LEVEL_MAX_ZOOMS))):
+        if z <= max_zoom:
+            return level
+    return None
+
+
+def build_feature_levels(layer_id) -> bool:
+    """Builds the simplified geometry levels for a large line or polygon layer.
+
+    Each level is simplified from the next finer one, so only the finest is
+    computed from full resolution geometries. Features that simplify away
+    entirely are left out. Returns whether levels were built.
+
+    The levels are loaded into a new table attached as the layer's partition
+    of the level table, replacing the partition of a previous build. Tiles
+    read full resolution geometries until the new levels are attached.
+    """
+    if LayerFeature.objects.filter(layer_id=layer_id).count() < (
+        settings.GENERALIZE_MIN_FEATURES
+    ):
+        return False
+
+    with connection.cursor() as cursor:
+        # Points cannot be simplified
+        cursor.execute(
+            f"""
+            SELECT EXISTS (
+                SELECT 1 FROM {LayerFeature._meta.db_table}
+                WHERE layer_id = %s AND ST_Dimension(geometry) > 0
+            )
+        """,
+            [layer_id],
+        )
+        if not cursor.fetchone()[0]:
+            return False
+
+        layers = Layer.objects.filter(id=layer_id)
+        if layers.filter(generalized=True).update(generalized=False):
+            invalidate_layers(layers)
+        drop_level_partition(layer_id)
+        table = create_detached_partition(layer_id, LEVEL_TABLE)
+        for level, max_zoom in enumerate(LEVEL_MAX_ZOOMS):
+            if level == 0:
+                source = f"""
+                    SELECT id AS feature_id, ST_Transform(geometry, 3857) AS geometry
+                    FROM {LayerFeature._meta.db_table}
+                    WHERE layer_id = %(layer_id)s
+                """
+            else:
+                source = f"""
+                    SELECT feature_id, geometry FROM {table}
+                    WHERE layer_id = %(layer_id)s AND level = {level - 1}
+                """
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (layer_id, feature_id, level, geometry)
+                SELECT %(layer_id)s, feature_id, {level}, geometry
+                FROM (
+                    SELECT
+                        feature_id,
+                        ST_SimplifyPreserveTopology(geometry, %(tolerance)s)
+                            AS geometry
+                    FROM ({source}) AS source
+                ) AS simplified
+                WHERE NOT ST_IsEmpty(geometry)
+                ORDER BY geometry
+            """,
+                {"layer_id": layer_id, "tolerance": level_tolerance(max_zoom)},
+            )
+        attach_layer_partition(layer_id, LEVEL_TABLE)
+        cursor.execute(f"ANALYZE {table}")
+    layers.update(generalized=True)
+    invalidate_layers(layers)
+    return True
@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+# Expires stale leases, then takes a slot if one is free or the holder has
+# one already, so a redelivered task gets its own slot back
+ACQUIRE_SLOT = """
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", ARGV[1])
+if redis.call("ZSCORE", KEYS[1], ARGV[3])
+    or redis.call("ZCARD", KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call("ZADD", KEYS[1], ARGV[4], ARGV[3])
+    redis.call("EXPIRE", KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+
+def slots_key(kind, owner):
+    return f"slots:{kind}:{owner}"
+
+
+def acquire_slot(kind, owner, holder, limit):
+    """Takes one of an owner's ``limit`` concurrent slots for a kind of task.
+
+    Slots are leases in a Redis sorted set, scored by their expiry, so a
+    slot held by a worker that died is freed after ``TASK_SLOT_LEASE``
+    seconds. Returns whether a slot was taken.
+    """
+    now = time.time()
+    lease = settings.TASK_SLOT_LEASE
+    client = get_redis_connection("default")
+    return bool(
+        client.register_script(ACQUIRE_SLOT)(
+            keys=[slots_key(kind, owner)],
+            args=[now, limit, holder, now + lease, lease],
+        )
+    )
+
+
+def release_slot(kind, owner, holder) -> None:
+    get_redis_connection("default").zrem(slots_key(kind, owner), holder)
+
+
+def defer_task(task) -> None:
+    """Sends a task back to its queue to run once its owner has a free slot.
+
+    The copy keeps the task id and retry count, so status reporting and the
+    retry budget for real errors carry over. The delay is jittered so an
+    owner's deferred tasks do not all come back at once.
+    """
+    request = task.request
+    task.apply_async(
+        request.args,
+        request.kwargs,
+        task_id=request.id,
+        retries=request.retries,
+        queue=request.delivery_info.get("routing_key"),
+        countdown=settings.TASK_DEFER_SECONDS * random.uniform(0.5, 1.5),
+    )
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+
+import shapely
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection
+
+from gis.models import LayerFeature
+from gis.partitions import (
+    attach_layer_partition,
+    create_detached_partition,
+    create_layer_partition,
+    partition_exists,
+)
+
+
+def staging_table_name(layer_id, chunk_index=None):
+    name = f"layer_{int(layer_id)}_staging"
+    if chunk_index is not None:
+        name += f"_{int(chunk_index)}"
+    return name
+
+
+def drop_staging_tables(layer_id) -> None:
+    """Drops the CopyLoader staging tables left by a layer's ingest."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tablename FROM pg_tables "
+            "WHERE schemaname = current_schema() AND tablename LIKE %s",
+            [f"{staging_table_name(layer_id)}%"],
+        )
+        for (table,) in cursor.fetchall():
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class ORMLoader:
+    """Loads features with ``bulk_create``, one INSERT per batch."""
+
+    def __init__(self, layer, chunk_index=None):
+        self.layer = layer
+        create_layer_partition(layer.id)
+
+    def write_batch(self, feature_batch, geoms):
+        LayerFeature.objects.bulk_create(
+            [
+                LayerFeature(
+                    geometry=GEOSGeometry(memoryview(wkb), srid=4326),
+                    layer=self.layer,
+                    properties=feature["properties"],
+                )
+                for feature, wkb in zip(feature_batch, shapely.to_wkb(geoms))
+            ]
+        )
+
+    def finish(self):
+        pass
+
+
+class CopyLoader:
+    """Loads features with PostgreSQL ``COPY ... FROM STDIN``.
+
+    Each batch is encoded as CSV rows of hex WKB and JSON properties and
+    copied into a staging table. ``finish`` moves the staged rows
+    into the layer's partition with a single set-based INSERT, ordered by
+    geometry so the rows are written in spatial (Hilbert) order.
+
+    If the layer has no partition yet, the rows go into a fresh standalone
+    table that is attached as the partition afterwards, so indexes are built
+    once over the loaded data. Otherwise, as for the chunks of a parallel
+    ingest, they are inserted through the feature table.
+
+    The staging table is a regular table, one per chunk, so batches
+    committed before a worker died are still staged when the task is
+    retried.
+    """
+
+    def __init__(self, layer, chunk_index=None):
+        self.layer = layer
+        self.staging_table = staging_table_name(layer.id, chunk_index)
+        self.attach = not partition_exists(layer.id)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.staging_table} (
+                    geometry bytea NOT NULL,
+                    properties jsonb NOT NULL
+                )
+                """
+            )
+
+    def write_batch(self, feature_batch, geoms):
+        wkb = shapely.to_wkb(geoms, hex=True)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for geometry, feature in zip(wkb, feature_batch):
+            writer.writerow([f"\\x{geometry}", json.dumps(feature["properties"])])
+        buffer.seek(0)
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {self.staging_table} (geometry, properties) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+
+    def finish(self):
+        if self.attach:
+            target_table = create_detached_partition(self.layer.id)
+        else:
+            target_table = LayerFeature._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {target_table} (layer_id, geometry, properties)
+                SELECT %s, ST_GeomFromWKB(geometry, 4326) AS geom, properties
+                FROM {self.staging_table}
+                ORDER BY geom
+                """,
+                [self.layer.id],
+            )
+            cursor.execute(f"DROP TABLE {self.staging_table}")
+        if self.attach:
+            attach_layer_partition(self.layer.id)
+
+
+LOADERS = {
+    "orm": ORMLoader,
+    "copy": CopyLoader,
+}
+
+
+def get_loader(name):
+    """Returns the loader class registered under ``name``."""
+    try:
+        return LOADERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown loader: {name}")
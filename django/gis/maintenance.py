@@ -0,0 +1,77 @@
+import logging
+
+from django.db import connection
+
+from gis.models import LayerFeature
+from gis.partitions import partition_name
+
+logger = logging.getLogger(__name__)
+
+LAYER_GEOMETRY_INDEX = "gis_feature_layer_geom_gist"
+
+
+def analyze_features(layer_id=None) -> None:
+    """Refreshes planner statistics for a layer's partition, or all of them.
+
+    Run after every ingest so row estimates for the new layer are current
+    before the first tile request plans against it.
+    """
+    if layer_id is None:
+        table = LayerFeature._meta.db_table
+    else:
+        table = partition_name(layer_id)
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {table}")
+
+
+def cluster_features() -> None:
+    """Rewrites the feature table in (layer, geometry) index order.
+
+    Features of one layer that are close in space end up on the same pages,
+    so a bbox query for a tile reads few pages. CLUSTER takes an ACCESS
+    EXCLUSIVE lock on each partition while it is rewritten, so run it in a
+    maintenance window.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CLUSTER {LayerFeature._meta.db_table} USING {LAYER_GEOMETRY_INDEX}"
+        )
+
+
+def reindex_features() -> None:
+    """Rebuilds the (layer, geometry) index without blocking writes."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"REINDEX INDEX CONCURRENTLY {LAYER_GEOMETRY_INDEX}")
+
+
+def feature_table_stats():
+    """Returns the row estimate and on-disk sizes summed over all partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT
+                count(*),
+                coalesce(sum(greatest(c.reltuples, 0)), 0)::bigint,
+                coalesce(sum(pg_relation_size(c.oid)), 0)
+            FROM pg_partition_tree(%s::regclass) p
+            JOIN pg_class c ON c.oid = p.relid
+            WHERE p.isleaf
+        """,
+            [LayerFeature._meta.db_table],
+        )
+        partitions, estimated_rows, table_bytes = cursor.fetchone()
+        cursor.execute(
+            """
+            SELECT coalesce(sum(pg_relation_size(relid)), 0)
+            FROM pg_partition_tree(%s::regclass)
+            WHERE isleaf
+        """,
+            [LAYER_GEOMETRY_INDEX],
+        )
+        index_bytes = cursor.fetchone()[0]
+    return {
+        "partitions": partitions,
+        "estimated_rows": estimated_rows,
+        "table_bytes": table_bytes,
+        "index_bytes": index_bytes,
+    }
@@ -0,0 +1,88 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gis.benchmarks.api import compare, run_benchmark
+
+
+def csv_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the latency, query count and response size of the main gis "
+        "endpoints against seeded data, and reports them as JSON. The data is "
+        "seeded for a dedicated benchmark user on the first run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument(
+            "--endpoints",
+            type=csv_list,
+            help="Comma separated endpoints to measure. Defaults to all.",
+        )
+        parser.add_argument(
+            "--reseed",
+            action="store_true",
+            help="Delete and seed the benchmark data again.",
+        )
+        parser.add_argument("--layers", type=int, default=2000)
+        parser.add_argument("--directory-depth", type=int, default=6)
+        parser.add_argument("--directory-branching", type=int, default=3)
+        parser.add_argument("--projects", type=int, default=50)
+        parser.add_argument("--layers-per-project", type=int, default=20)
+        parser.add_argument("--features", type=int, default=1_000_000)
+        parser.add_argument("--export-features", type=int, default=50_000)
+        parser.add_argument("--output", help="Write the JSON results to a file.")
+        parser.add_argument(
+            "--baseline",
+            help="Results of an earlier run to compare p95 latency and queries with.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed rise in p95 latency against the baseline.",
+        )
+
+    def handle(self, *args, **options):
+        seed_options = {
+            option: options[option]
+            for option in (
+                "layers",
+                "directory_depth",
+                "directory_branching",
+                "projects",
+                "layers_per_project",
+                "features",
+                "export_features",
+            )
+        }
+        try:
+            results = run_benchmark(
+                iterations=options["iterations"],
+                endpoints=options["endpoints"],
+                reseed=options["reseed"],
+                seed_options=seed_options,
+                log=self.stderr.write,
+            )
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        report = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options["tolerance"])
+            for endpoint, metric, before, after in regressions:
+                self.stderr.write(f"{endpoint} {metric}: {before} -> {after}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions.")
@@ -0,0 +1,44 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gis.benchmarks.connections import DEFAULT_ENDPOINTS, run_benchmark
+from gis.management.commands.benchmark_api import csv_list
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the tile and small JSON endpoints with a database connection "
+        "opened per request and with persistent connections, and reports the "
+        "latency saved as JSON. Uses the data seeded by benchmark_api, seeding "
+        "it on the first run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument(
+            "--endpoints",
+            type=csv_list,
+            help=(
+                "Comma separated endpoints of benchmark_api to measure. "
+                f"Defaults to {','.join(DEFAULT_ENDPOINTS)}."
+            ),
+        )
+        parser.add_argument("--output", help="Write the JSON results to a file.")
+
+    def handle(self, *args, **options):
+        try:
+            results = run_benchmark(
+                iterations=options["iterations"],
+                endpoints=options["endpoints"],
+                log=self.stderr.write,
+            )
+        except (ValueError, RuntimeError) as e:
+            raise CommandError(str(e))
+
+        report = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,120 @@
+import itertools
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gis.benchmarks.ingest import compare, run_benchmark
+from gis.benchmarks.synthetic import FORMATS, GEOMETRY_TYPES
+from gis.loaders import LOADERS
+
+
+def csv_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks FileIngestor end to end on synthetic layers, reading from "
+        "local storage into the configured PostGIS database, and reports "
+        "throughput, peak RSS and time per stage as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--geometries",
+            type=csv_list,
+            default=list(GEOMETRY_TYPES),
+            help="Comma separated geometry types: point, line, polygon.",
+        )
+        parser.add_argument(
+            "--sizes",
+            type=lambda value: [int(size) for size in csv_list(value)],
+            default=[1_000, 10_000, 100_000],
+            help="Comma separated feature counts.",
+        )
+        parser.add_argument(
+            "--crs",
+            type=csv_list,
+            default=["EPSG:4326", "EPSG:3857"],
+            help="Comma separated CRSs the files are written in.",
+        )
+        parser.add_argument(
+            "--formats",
+            type=csv_list,
+            default=list(FORMATS),
+            help="Comma separated file formats: geojson, shapefile.",
+        )
+        parser.add_argument("--loader", choices=list(LOADERS), default="copy")
+        parser.add_argument("--repeat", type=int, default=1)
+        parser.add_argument(
+            "--data-dir",
+            default=os.path.join(tempfile.gettempdir(), "spatiallab-benchmark"),
+            help="Where synthetic files are written and reused from.",
+        )
+        parser.add_argument("--output", help="Write the JSON results to a file.")
+        parser.add_argument(
+            "--baseline",
+            help="Results of an earlier run to compare features per second with.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.1,
+            help="Allowed drop in features per second against the baseline.",
+        )
+        parser.add_argument(
+            "--keep",
+            action="store_true",
+            help="Keep the ingested layers instead of deleting them.",
+        )
+
+    def handle(self, *args, **options):
+        for option, allowed in (("geometries", GEOMETRY_TYPES), ("formats", FORMATS)):
+            unknown = set(options[option]) - set(allowed)
+            if unknown:
+                raise CommandError(f"Unknown {option}: {', '.join(sorted(unknown))}")
+
+        cases = [
+            {"geometry": geometry, "count": count, "crs": crs, "format": format}
+            for geometry, count, crs, format in itertools.product(
+                options["geometries"],
+                options["sizes"],
+                options["crs"],
+                options["formats"],
+            )
+        ]
+
+        def log(result):
+            self.stderr.write(
+                f"{result['case']}: {result['features_per_second']} features/s, "
+                f"peak RSS {result['peak_rss_mb']} MiB"
+            )
+
+        results = run_benchmark(
+            cases,
+            options["data_dir"],
+            loader=options["loader"],
+            repeat=options["repeat"],
+            keep=options["keep"],
+            log=log,
+        )
+        report = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report)
+        else:
+            self.stdout.write(report)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options["tolerance"])
+            for case, before, after in regressions:
+                self.stderr.write(f"{case}: {before} -> {after} features/s")
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} cases regressed by more than "
+                    f"{options['tolerance']:.0%}."
+                )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from gis.maintenance import (
+    analyze_features,
+    cluster_features,
+    feature_table_stats,
+    reindex_features,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintains the layer feature table: rebuilds the (layer, geometry) "
+        "index, clusters rows by layer and space, and refreshes statistics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reindex",
+            action="store_true",
+            help="Rebuild the (layer, geometry) GiST index concurrently.",
+        )
+        parser.add_argument(
+            "--cluster",
+            action="store_true",
+            help="CLUSTER the table on the (layer, geometry) index. Locks the table.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Before: {feature_table_stats()}")
+        if options["reindex"]:
+            self.stdout.write("Reindexing (layer, geometry)...")
+            reindex_features()
+        if options["cluster"]:
+            self.stdout.write("Clustering on (layer, geometry)...")
+            cluster_features()
+        self.stdout.write("Analyzing...")
+        analyze_features()
+        self.stdout.write(self.style.SUCCESS(f"After: {feature_table_stats()}"))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gis.tasks import seed_project_tiles_task, seed_tiles_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Queues pre-rendering of a layer's or a project's vector tiles into "
+        "MBTiles archives served by the tile endpoint."
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument("--layer", type=int, help="Seed one layer by id.")
+        target.add_argument(
+            "--project", type=int, help="Seed every layer of a project by id."
+        )
+        parser.add_argument("--min-zoom", type=int, default=0)
+        parser.add_argument(
+            "--max-zoom",
+            type=int,
+            default=None,
+            help="Defaults to the TILE_SEED_MAX_ZOOM setting.",
+        )
+
+    def handle(self, *args, **options):
+        if (
+            options["max_zoom"] is not None
+            and options["max_zoom"] < options["min_zoom"]
+        ):
+            raise CommandError("--max-zoom must not be below --min-zoom.")
+        if options["layer"] is not None:
+            task = seed_tiles_task.delay(
+                options["layer"], options["min_zoom"], options["max_zoom"]
+            )
+            self.stdout.write(self.style.SUCCESS(f"Queued tile seed {task.id}"))
+        else:
+            seed_project_tiles_task.delay(
+                options["project"], options["min_zoom"], options["max_zoom"]
+            )
+            self.stdout.write(self.style.SUCCESS("Queued project tile seed"))
@@ -0,0 +1,83 @@
+import gzip
+import os
+import sqlite3
+
+
+class MBTiles:
+    """A minimal reader and writer for MBTiles 1.3 vector tile archives.
+
+    Tiles are stored gzipped, and rows are flipped to the TMS scheme the
+    spec requires, so the archive can be served by any MBTiles server.
+    ``get_tile`` and ``put_tile`` take XYZ coordinates.
+    """
+
+    def __init__(self, path, mode="r"):
+        self.path = path
+        if mode == "r":
+            self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            self.db = sqlite3.connect(path)
+            self.db.executescript(
+                """
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    tile_data BLOB
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                    ON tiles (zoom_level, tile_column, tile_row);
+                """
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def metadata(self):
+        return dict(self.db.execute("SELECT name, value FROM metadata"))
+
+    def write_metadata(self, metadata):
+        self.db.execute("DELETE FROM metadata")
+        self.db.executemany(
+            "INSERT INTO metadata (name, value) VALUES (?, ?)",
+            [(name, str(value)) for name, value in metadata.items()],
+        )
+
+    def get_tile(self, z, x, y):
+        row = self.db.execute(
+            "SELECT tile_data FROM tiles"
+            " WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2**z - 1 - y),
+        ).fetchone()
+        return None if row is None else gzip.decompress(row[0])
+
+    def put_tile(self, z, x, y, data):
+        self.db.execute(
+            "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+            (z, x, 2**z - 1 - y, gzip.compress(data)),
+        )
+
+    def merge(self, path):
+        """Copies every tile of another archive into this one."""
+        self.db.commit()
+        self.db.execute("ATTACH DATABASE ? AS shard", (path,))
+        self.db.execute("INSERT OR REPLACE INTO tiles SELECT * FROM shard.tiles")
+        self.db.commit()
+        self.db.execute("DETACH DATABASE shard")
+
+
+def open_archive(path):
+    """Returns an MBTiles reader, or None if there is no archive at path."""
+    if not os.path.exists(path):
+        return None
+    return MBTiles(path)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gis", "0016_projectlayer_visible"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="layerproperty",
+            name="indexed",
+            field=models.BooleanField(default=False),
+        ),
+    ]
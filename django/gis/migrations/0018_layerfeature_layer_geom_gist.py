@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:40
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, BtreeGistExtension
+from django.db import migrations
+
+# Edited after generation: the index is built concurrently so the feature
+# table stays writable, and btree_gist is installed for the layer_id column
+# of the GiST index.
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("gis", "0017_layerproperty_indexed"),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        AddIndexConcurrently(
+            model_name="layerfeature",
+            index=django.contrib.postgres.indexes.GistIndex(
+                fields=["layer", "geometry"], name="gis_feature_layer_geom_gist"
+            ),
+        ),
+    ]
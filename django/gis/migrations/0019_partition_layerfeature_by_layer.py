@@ -0,0 +1,167 @@
+# Converts gis_layerfeature into a table LIST-partitioned by layer_id, with
+# one partition per layer. The table keeps its columns and the (layer,
+# geometry) GiST index, which covers the single-column layer_id and
+# geometry indexes, so those are dropped from the database and the model
+# state. The primary key becomes (layer_id, id) because partitioned tables
+# require the partition key in every unique constraint.
+#
+# The reverse restores the indexes and constraints under the names Django
+# gave them when the table was created as gis_feature.
+#
+# Downtime: the migration runs in one transaction. The rename at the start
+# takes an ACCESS EXCLUSIVE lock on gis_layerfeature, which is held until
+# the commit, so features can be neither read nor written while the table
+# is copied into the partitions and the primary key and GiST index are
+# rebuilt. Expect that to take about as long as copying the table once
+# and building its GiST index, growing with the number of features.
+# Run it in a maintenance window with the ingest workers stopped. A tile or
+# feature request made meanwhile waits on the lock until it times out.
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+PARTITION_SQL = """
+ALTER TABLE gis_layerfeature RENAME TO gis_layerfeature_unpartitioned;
+
+CREATE SEQUENCE gis_layerfeature_partitioned_id_seq;
+SELECT setval(
+    'gis_layerfeature_partitioned_id_seq',
+    coalesce((SELECT max(id) FROM gis_layerfeature_unpartitioned), 0) + 1,
+    false
+);
+
+CREATE TABLE gis_layerfeature (
+    id bigint NOT NULL DEFAULT nextval('gis_layerfeature_partitioned_id_seq'),
+    geometry geometry(Geometry, 4326) NOT NULL,
+    properties jsonb NOT NULL,
+    layer_id bigint NOT NULL
+) PARTITION BY LIST (layer_id);
+ALTER SEQUENCE gis_layerfeature_partitioned_id_seq OWNED BY gis_layerfeature.id;
+
+DO $$
+DECLARE
+    lid bigint;
+BEGIN
+    FOR lid IN SELECT id FROM gis_layer LOOP
+        EXECUTE format(
+            'CREATE TABLE gis_layerfeature_l%s PARTITION OF gis_layerfeature '
+            'FOR VALUES IN (%s)',
+            lid, lid
+        );
+    END LOOP;
+END $$;
+
+INSERT INTO gis_layerfeature (id, geometry, properties, layer_id)
+SELECT id, geometry, properties, layer_id
+FROM gis_layerfeature_unpartitioned
+ORDER BY layer_id, geometry;
+
+-- Also drops the layer_<id>_features views, which are recreated below
+DROP TABLE gis_layerfeature_unpartitioned CASCADE;
+
+ALTER TABLE gis_layerfeature
+    ADD CONSTRAINT gis_layerfeature_pkey PRIMARY KEY (layer_id, id);
+ALTER TABLE gis_layerfeature
+    ADD CONSTRAINT gis_layerfeature_layer_id_fk_gis_layer_id
+    FOREIGN KEY (layer_id) REFERENCES gis_layer (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX gis_feature_layer_geom_gist
+    ON gis_layerfeature USING gist (layer_id, geometry);
+
+DO $$
+DECLARE
+    lid bigint;
+BEGIN
+    FOR lid IN SELECT id FROM gis_layer LOOP
+        EXECUTE format(
+            'CREATE OR REPLACE VIEW layer_%s_features AS '
+            'SELECT f.id, f.geometry, l.name AS layer_name '
+            'FROM gis_layerfeature_l%s f JOIN gis_layer l ON f.layer_id = l.id',
+            lid, lid
+        );
+    END LOOP;
+END $$;
+
+ANALYZE gis_layerfeature;
+"""
+
+UNPARTITION_SQL = """
+ALTER TABLE gis_layerfeature RENAME TO gis_layerfeature_partitioned;
+
+CREATE TABLE gis_layerfeature (
+    id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    geometry geometry(Geometry, 4326) NOT NULL,
+    properties jsonb NOT NULL,
+    layer_id bigint NOT NULL
+);
+
+INSERT INTO gis_layerfeature (id, geometry, properties, layer_id)
+SELECT id, geometry, properties, layer_id
+FROM gis_layerfeature_partitioned;
+SELECT setval(
+    pg_get_serial_sequence('gis_layerfeature', 'id'),
+    coalesce((SELECT max(id) FROM gis_layerfeature), 0) + 1,
+    false
+);
+
+-- Also drops the partitions and the layer_<id>_features views
+DROP TABLE gis_layerfeature_partitioned CASCADE;
+
+ALTER TABLE gis_layerfeature ADD CONSTRAINT gis_feature_pkey PRIMARY KEY (id);
+ALTER TABLE gis_layerfeature
+    ADD CONSTRAINT gis_feature_layer_id_e1f0b77e_fk_gis_layer_id
+    FOREIGN KEY (layer_id) REFERENCES gis_layer (id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX gis_feature_layer_id_e1f0b77e ON gis_layerfeature (layer_id);
+CREATE INDEX gis_feature_geometry_1aba6e40_id
+    ON gis_layerfeature USING gist (geometry);
+CREATE INDEX gis_feature_layer_geom_gist
+    ON gis_layerfeature USING gist (layer_id, geometry);
+
+DO $$
+DECLARE
+    lid bigint;
+BEGIN
+    FOR lid IN SELECT DISTINCT f.layer_id FROM gis_layerfeature f LOOP
+        EXECUTE format(
+            'CREATE OR REPLACE VIEW layer_%s_features AS '
+            'SELECT f.id, f.geometry, l.name AS layer_name '
+            'FROM gis_layerfeature f JOIN gis_layer l ON f.layer_id = l.id '
+            'WHERE f.layer_id = %s',
+            lid, lid
+        );
+    END LOOP;
+END $$;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gis", "0018_layerfeature_layer_geom_gist"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name="layerfeature",
+                    name="layer",
+                    field=models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="features",
+                        to="gis.layer",
+                    ),
+                ),
+                migrations.AlterField(
+                    model_name="layerfeature",
+                    name="geometry",
+                    field=django.contrib.gis.db.models.fields.GeometryField(
+                        spatial_index=False, srid=4326
+                    ),
+                ),
+            ],
+        ),
+    ]
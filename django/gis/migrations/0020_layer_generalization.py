@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:41
+
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Edited after generation: gis_layerfeaturelevel is created LIST-partitioned
+# by layer_id, like gis_layerfeature, so a layer's levels are replaced and
+# dropped with their partition instead of deleted row by row. The (layer,
+# level, geometry) GiST index covers the single-column layer_id and
+# geometry indexes, and the primary key is (layer_id, id) because
+# partitioned tables require the partition key in every unique constraint.
+
+CREATE_SQL = """
+CREATE SEQUENCE gis_layerfeaturelevel_id_seq;
+
+CREATE TABLE gis_layerfeaturelevel (
+    id bigint NOT NULL DEFAULT nextval('gis_layerfeaturelevel_id_seq'),
+    feature_id bigint NOT NULL,
+    level smallint NOT NULL CONSTRAINT gis_layerfeaturelevel_level_check
+        CHECK (level >= 0),
+    geometry geometry(Geometry, 3857) NOT NULL,
+    layer_id bigint NOT NULL,
+    CONSTRAINT gis_layerfeaturelevel_pkey PRIMARY KEY (layer_id, id),
+    CONSTRAINT gis_layerfeaturelevel_layer_id_fk_gis_layer_id
+        FOREIGN KEY (layer_id) REFERENCES gis_layer (id)
+        DEFERRABLE INITIALLY DEFERRED
+) PARTITION BY LIST (layer_id);
+ALTER SEQUENCE gis_layerfeaturelevel_id_seq OWNED BY gis_layerfeaturelevel.id;
+
+CREATE INDEX gis_feature_level_geom_gist
+    ON gis_layerfeaturelevel USING gist (layer_id, level, geometry);
+"""
+
+# Also drops the partitions
+DROP_SQL = "DROP TABLE gis_layerfeaturelevel;"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gis", "0019_partition_layerfeature_by_layer"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="layer",
+            name="generalized",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_SQL, reverse_sql=DROP_SQL),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name="LayerFeatureLevel",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        ("feature_id", models.BigIntegerField()),
+                        ("level", models.PositiveSmallIntegerField()),
+                        (
+                            "geometry",
+                            django.contrib.gis.db.models.fields.GeometryField(
+                                spatial_index=False, srid=3857
+                            ),
+                        ),
+                        (
+                            "layer",
+                            models.ForeignKey(
+                                db_index=False,
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="feature_levels",
+                                to="gis.layer",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "indexes": [
+                            django.contrib.postgres.indexes.GistIndex(
+                                fields=["layer", "level", "geometry"],
+                                name="gis_feature_level_geom_gist",
+                            )
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
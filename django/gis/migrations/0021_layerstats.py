@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:48
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gis", "0020_layer_generalization"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LayerStats",
+            fields=[
+                (
+                    "layer",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="gis.layer",
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("feature_count", models.BigIntegerField(default=0)),
+                (
+                    "extent",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.FloatField(), blank=True, null=True, size=4
+                    ),
+                ),
+                (
+                    "extent_3857",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.FloatField(), blank=True, null=True, size=4
+                    ),
+                ),
+                ("geometry_types", models.JSONField(default=dict)),
+                ("properties", models.JSONField(default=list)),
+            ],
+        ),
+    ]
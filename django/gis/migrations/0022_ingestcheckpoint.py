@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("gis", "0021_layerstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestCheckpoint",
+            fields=[
+                (
+                    "task_id",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("offset", models.BigIntegerField(default=0)),
+                ("schema", models.JSONField(default=dict)),
+                ("finished", models.BooleanField(default=False)),
+                (
+                    "layer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ingest_checkpoints",
+                        to="gis.layer",
+                    ),
+                ),
+            ],
+        ),
+    ]
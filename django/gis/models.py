@@ -4,6 +4,7 @@ from django.db import models
 from django.contrib.gis.db import models as gis_models
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GistIndex
 from ordered_model.models import OrderedModel
 
 
@@ -38,6 +39,8 @@ class Layer(models.Model):
         null=True,
         blank=True,
     )
+    # Set once simplified LayerFeatureLevel geometries exist for low zooms
+    generalized = models.BooleanField(default=False, editable=False)
 
     class Meta:
         constraints = [
@@ -55,15 +58,93 @@ class Layer(models.Model):
         return self.name
 
 
+class LayerStats(models.Model):
+    """Summary of a layer's features, kept current by ingest.
+
+    Extents are ``[minx, miny, maxx, maxy]``, in EPSG:4326 and EPSG:3857.
+    """
+
+    layer = models.OneToOneField(
+        Layer, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    feature_count = models.BigIntegerField(default=0)
+    extent = ArrayField(models.FloatField(), size=4, null=True, blank=True)
+    extent_3857 = ArrayField(models.FloatField(), size=4, null=True, blank=True)
+    # Feature count per geometry type, e.g. {"POLYGON": 10}
+    geometry_types = models.JSONField(default=dict)
+    # [{"name": ..., "type": ...}] in LayerProperty order
+    properties = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Stats for {self.layer_id}"
+
+
+class IngestCheckpoint(models.Model):
+    """How far an ingest task has loaded its file into a layer.
+
+    Saved in the same transaction as each batch of features, so a retried
+    task can resume after the last committed batch.
+    """
+
+    task_id = models.CharField(max_length=255, primary_key=True)
+    layer = models.ForeignKey(
+        Layer, on_delete=models.CASCADE, related_name="ingest_checkpoints"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Offset of the next feature to read from the file
+    offset = models.BigIntegerField(default=0)
+    # SchemaInferrer state for the features loaded so far
+    schema = models.JSONField(default=dict)
+    # Set once the loaded features are in the layer's partition
+    finished = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Ingest {self.task_id} at {self.offset}"
+
+
 class LayerFeature(gis_models.Model):
-    geometry = gis_models.GeometryField()
-    layer = models.ForeignKey(Layer, on_delete=models.CASCADE, related_name="features")
+    # Both are indexed by the (layer, geometry) index alone
+    geometry = gis_models.GeometryField(spatial_index=False)
+    layer = models.ForeignKey(
+        Layer, on_delete=models.CASCADE, related_name="features", db_index=False
+    )
     properties = models.JSONField()
 
+    class Meta:
+        indexes = [
+            # Serves "features of layer X inside bbox Y" for tiles and views
+            GistIndex(fields=["layer", "geometry"], name="gis_feature_layer_geom_gist"),
+        ]
+
     def __str__(self):
         return f"Feature in {self.layer.name}"
 
 
+class LayerFeatureLevel(gis_models.Model):
+    """A simplified copy of a feature's geometry for low zoom tiles.
+
+    Geometries are stored in Web Mercator so tiles need no reprojection.
+    The table is partitioned by layer, like LayerFeature.
+    """
+
+    # Both are indexed by the (layer, level, geometry) index alone
+    layer = models.ForeignKey(
+        Layer, on_delete=models.CASCADE, related_name="feature_levels", db_index=False
+    )
+    feature_id = models.BigIntegerField()
+    level = models.PositiveSmallIntegerField()
+    geometry = gis_models.GeometryField(srid=3857, spatial_index=False)
+
+    class Meta:
+        indexes = [
+            GistIndex(
+                fields=["layer", "level", "geometry"],
+                name="gis_feature_level_geom_gist",
+            ),
+        ]
+
+
 class LayerProperty(models.Model):
     LAYER_PROPERTY_TYPES = [
         ("string", "String"),
@@ -81,6 +162,7 @@ class LayerProperty(models.Model):
     )
     name = models.CharField(max_length=255)
     type = models.CharField(max_length=50, choices=LAYER_PROPERTY_TYPES)
+    indexed = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
@@ -0,0 +1,135 @@
+from django.db import connection
+
+from gis.models import LayerFeature, LayerFeatureLevel
+
+FEATURE_TABLE = LayerFeature._meta.db_table
+LEVEL_TABLE = LayerFeatureLevel._meta.db_table
+# The tables with one partition per layer
+PARTITIONED_TABLES = (FEATURE_TABLE, LEVEL_TABLE)
+
+
+def partition_name(layer_id, table=FEATURE_TABLE):
+    """Returns the name of the partition of ``table`` holding a layer."""
+    return f"{table}_l{int(layer_id)}"
+
+
+def partition_exists(layer_id):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [partition_name(layer_id)])
+        return cursor.fetchone()[0]
+
+
+def create_layer_partition(layer_id) -> None:
+    """Creates an empty, attached partition for a layer if it has none."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(layer_id)}
+            PARTITION OF {FEATURE_TABLE} FOR VALUES IN ({int(layer_id)})
+        """
+        )
+
+
+def create_detached_partition(layer_id, parent=FEATURE_TABLE) -> str:
+    """Creates a standalone table shaped like the feature table, or
+    ``parent``.
+
+    Loading into a table that is not yet part of the partitioned table, and
+    that has no indexes, is the fastest way to bulk load a layer. Call
+    ``attach_layer_partition`` once it is loaded.
+    """
+    table = partition_name(layer_id, parent)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TABLE {table}
+            (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        """
+        )
+    return table
+
+
+def attach_layer_partition(layer_id, parent=FEATURE_TABLE) -> None:
+    """Attaches a loaded standalone table as the layer's partition.
+
+    The CHECK constraint proves every row belongs to the layer, so ATTACH
+    skips its validation scan. Indexes defined on the feature table are
+    built on the partition as part of the attach.
+    """
+    table = partition_name(layer_id, parent)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            ALTER TABLE {table}
+            ADD CONSTRAINT {table}_layer_check CHECK (layer_id = {int(layer_id)})
+        """
+        )
+        cursor.execute(
+            f"""
+            ALTER TABLE {parent}
+            ATTACH PARTITION {table} FOR VALUES IN ({int(layer_id)})
+        """
+        )
+
+
+def detach_layer_partition(layer_id, parent=FEATURE_TABLE) -> bool:
+    """Detaches a layer's partition from the feature table, or ``parent``,
+    if attached.
+
+    DETACH CONCURRENTLY only takes a SHARE UPDATE EXCLUSIVE lock on the
+    parent, where a plain DETACH, or dropping an attached partition, takes
+    an ACCESS EXCLUSIVE lock that blocks reads of every layer. It cannot
+    run in a transaction, so returns False without detaching when called in
+    one. A detach left pending by an interrupted run is finalized.
+    """
+    if connection.in_atomic_block:
+        return False
+    table = partition_name(layer_id, parent)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass(%s)",
+            [table],
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            mode = "FINALIZE" if row[0] else "CONCURRENTLY"
+            cursor.execute(f"ALTER TABLE {parent} DETACH PARTITION {table} {mode}")
+    return True
+
+
+def drop_layer_partition(layer_id) -> None:
+    """Drops a layer's partitions and its feature view.
+
+    This replaces a cascading DELETE of the layer's rows from the shared
+    tables, and leaves no dead tuples behind for VACUUM. A partition still
+    attached is dropped under a lock on its whole table, so
+    ``delete_layers`` detaches them first.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP VIEW IF EXISTS layer_{int(layer_id)}_features")
+        for parent in PARTITIONED_TABLES:
+            cursor.execute(f"DROP TABLE IF EXISTS {partition_name(layer_id, parent)}")
+
+
+def drop_level_partition(layer_id) -> None:
+    """Detaches and drops a layer's simplified levels, if it has any."""
+    detach_layer_partition(layer_id, LEVEL_TABLE)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {partition_name(layer_id, LEVEL_TABLE)}")
+
+
+def delete_layers(layers) -> None:
+    """Deletes a queryset of layers without blocking other layers' reads.
+
+    Each layer's partitions are detached concurrently and dropped before
+    the layer is deleted, outside the delete's transaction. Within a
+    transaction, the partitions are dropped by the ``pre_delete`` signal
+    instead, as they are when layers are deleted any other way.
+    """
+    for layer_id in layers.values_list("id", flat=True):
+        detached = [
+            detach_layer_partition(layer_id, parent) for parent in PARTITIONED_TABLES
+        ]
+        if all(detached):
+            drop_layer_partition(layer_id)
+    layers.delete()
@@ -0,0 +1,72 @@
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+# When this process last published each running task's progress. Chunks
+# of a parallel task never see its final status, so the entries they leave
+# are dropped wholesale past this many.
+last_published = {}
+MAX_TRACKED_TASKS = 10_000
+
+
+def owner_key(task_id):
+    return f"{task_id}:owner"
+
+
+def events_channel(user_id):
+    """The Redis pub/sub channel of a user's task events."""
+    return f"task-events:{user_id}"
+
+
+def start_task(task, user_id, *args, queue=None, **kwargs):
+    """Dispatches a task whose status changes are pushed to a user.
+
+    The task id is chosen up front, so the owner is known before the task
+    can report anything. ``queue`` overrides the task's route.
+    """
+    task_id = str(uuid.uuid4())
+    cache.set(owner_key(task_id), user_id, timeout=settings.TASK_OWNER_TIMEOUT)
+    options = {"task_id": task_id}
+    if queue is not None:
+        options["queue"] = queue
+    return task.apply_async(args, kwargs, **options)
+
+
+def should_publish(task_id, status):
+    """Throttles progress events to one per ``TASK_EVENT_INTERVAL`` seconds
+    per task, while always letting the final status through."""
+    now = time.monotonic()
+    if status["status"] != "processing":
+        last_published.pop(task_id, None)
+        return True
+    previous = last_published.get(task_id)
+    if previous is not None:
+        published_at, progress = previous
+        if progress == status.get("progress"):
+            return False
+        if now - published_at < settings.TASK_EVENT_INTERVAL:
+            return False
+    elif len(last_published) >= MAX_TRACKED_TASKS:
+        last_published.clear()
+    last_published[task_id] = (now, status.get("progress"))
+    return True
+
+
+def set_task_status(task_id, status):
+    """Writes a task's status for polling, and publishes it to its owner.
+
+    Tasks not started with ``start_task`` have no owner, and are only
+    polled.
+    """
+    cache.set(task_id, status)
+    if not should_publish(task_id, status):
+        return
+    user_id = cache.get(owner_key(task_id))
+    if user_id is not None:
+        get_redis_connection("default").publish(
+            events_channel(user_id), json.dumps({"task_id": task_id, **status})
+        )
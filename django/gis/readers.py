@@ -0,0 +1,519 @@
+import csv
+import io
+import itertools
+import json
+import math
+import os
+import zipfile
+from contextlib import ExitStack
+from pathlib import Path
+
+import fiona
+import ijson
+import shapely
+from fiona.drvsupport import supported_drivers
+from pyproj import CRS
+
+from gis.reproject import TARGET_CRS
+
+# GDAL can read KML, but Fiona does not enable the driver by default
+supported_drivers.setdefault("KML", "r")
+
+# Column names recognized in CSV files, compared case-insensitively
+CSV_WKT_COLUMNS = ("wkt", "geometry", "geom", "the_geom")
+CSV_LATITUDE_COLUMNS = ("latitude", "lat", "y")
+CSV_LONGITUDE_COLUMNS = ("longitude", "lon", "lng", "long", "x")
+
+
+def json_value(value):
+    """Converts an attribute value to a JSON-serializable value."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def file_size(file_obj):
+    position = file_obj.tell()
+    size = file_obj.seek(0, os.SEEK_END)
+    file_obj.seek(position)
+    return size or 1
+
+
+class FeatureReader:
+    """Reads the features of one file format as a stream.
+
+    ``features`` yields GeoJSON-like features whose geometry is a mapping
+    or an object with ``__geo_interface__``. ``start`` and ``stop`` select a
+    range of offsets into the file. While iterating, ``progress`` is the
+    percentage of the file read, ``position`` the offset after the last
+    feature read, and ``source_crs`` the CRS of the geometries. Offsets
+    count every record in the file, including those skipped for having no
+    geometry, unless a reader says otherwise, so ``position`` can be passed
+    back as ``start`` to resume reading.
+
+    Readers that are ``splittable`` can start reading at an offset without
+    reading the file before it, and ``split`` the file into ranges to load
+    in parallel. The others are only read from the start, one range at a
+    time.
+
+    ``file_obj`` is a seekable binary stream of the file, and ``path``,
+    if given, a path GDAL can open the same file at.
+    """
+
+    extensions = ()
+    splittable = False
+
+    def __init__(self, file_obj, path=None):
+        self.file_obj = file_obj
+        self.path = path
+        self.source_crs = TARGET_CRS
+        self.progress = 0
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def count(self):
+        raise NotImplementedError
+
+    def features(self, start=0, stop=None):
+        raise NotImplementedError
+
+    def split(self, chunk_size):
+        """Returns ``(start, stop)`` ranges covering the file, of about
+        ``chunk_size`` features each."""
+        raise NotImplementedError
+
+
+def record_ranges(total, chunk_size):
+    """Splits ``total`` records into ranges of ``chunk_size`` records."""
+    return [
+        (start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)
+    ] or [(0, 0)]
+
+
+class GeoJSONReader(FeatureReader):
+    """Reads a FeatureCollection with an iterative parser.
+
+    The ``crs`` member is picked up from the parse events as it goes by,
+    so it must precede ``features`` in the document (as GDAL and QGIS
+    write it). A ``crs`` after the features is an error unless it is
+    already the CRS read with, since the features before it were not
+    reprojected. Progress is measured in bytes consumed from the file.
+    """
+
+    extensions = (".geojson", ".json")
+
+    def count(self):
+        self.file_obj.seek(0)
+        return sum(
+            1
+            for prefix, event, _ in ijson.parse(self.file_obj)
+            if prefix == "features.item" and event == "start_map"
+        )
+
+    def features(self, start=0, stop=None):
+        self.file_obj.seek(0)
+        features = itertools.islice(self.iter_features(), start, stop)
+        for self.position, feature in enumerate(features, start=start + 1):
+            if feature["geometry"] is None:
+                continue
+            yield feature
+
+    def iter_features(self):
+        total_bytes = file_size(self.file_obj)
+        parsed = 0
+
+        def sniff_crs(events):
+            for prefix, event, value in events:
+                if prefix == "crs.properties.name" and event == "string":
+                    if parsed and not CRS(value).equals(
+                        CRS(self.source_crs), ignore_axis_order=True
+                    ):
+                        raise ValueError(
+                            "The GeoJSON crs member must come before the features."
+                        )
+                    self.source_crs = value
+                yield prefix, event, value
+
+        events = sniff_crs(ijson.parse(self.file_obj, use_float=True))
+        for feature in ijson.items(events, "features.item"):
+            parsed += 1
+            self.progress = int(min(self.file_obj.tell() / total_bytes, 1) * 100)
+            yield {
+                "type": "Feature",
+                "geometry": feature.get("geometry"),
+                "properties": feature.get("properties") or {},
+            }
+
+
+class NDJSONReader(FeatureReader):
+    """Reads newline-delimited GeoJSON, one feature per line.
+
+    Also reads GeoJSON text sequences (RFC 8142), whose lines start with a
+    record separator. Geometries are in EPSG:4326, as RFC 7946 requires.
+    Offsets are byte offsets of line starts, so a range is read by seeking
+    straight to it.
+    """
+
+    extensions = (".ndjson", ".geojsonl", ".geojsons", ".jsonl")
+    splittable = True
+    # Lines read to estimate the size of a feature when splitting
+    sample_lines = 1000
+
+    def lines(self, start=0, stop=None):
+        """Yields the lines starting in ``[start, stop)``, stripped, and sets
+        ``position`` to the offset after each."""
+        self.file_obj.seek(start)
+        self.position = start
+        while stop is None or self.position < stop:
+            line = self.file_obj.readline()
+            if not line:
+                break
+            self.position += len(line)
+            line = line.strip().lstrip(b"\x1e")
+            if line:
+                yield line
+
+    def count(self):
+        return sum(1 for _ in self.lines())
+
+    def split(self, chunk_size):
+        total_bytes = file_size(self.file_obj)
+        sample = list(itertools.islice(self.lines(), self.sample_lines))
+        if not sample:
+            return [(0, 0)]
+        chunk_bytes = max(self.position // len(sample) * chunk_size, 1)
+        starts = [0]
+        for offset in range(chunk_bytes, total_bytes, chunk_bytes):
+            # Moves each boundary to the start of the next line
+            self.file_obj.seek(offset - 1)
+            self.file_obj.readline()
+            start = self.file_obj.tell()
+            if starts[-1] < start < total_bytes:
+                starts.append(start)
+        return list(zip(starts, starts[1:] + [total_bytes]))
+
+    def features(self, start=0, stop=None):
+        total_bytes = file_size(self.file_obj)
+        for line in self.lines(start, stop):
+            self.progress = int(min(self.position / total_bytes, 1) * 100)
+            feature = json.loads(line)
+            if feature.get("geometry") is None:
+                continue
+            yield {
+                "type": "Feature",
+                "geometry": feature["geometry"],
+                "properties": feature.get("properties") or {},
+            }
+
+
+class CSVReader(FeatureReader):
+    """Reads a CSV file with a WKT column, or latitude and longitude columns.
+
+    Every other column becomes a property. Values are kept as text, and
+    their types are inferred during ingest. Geometries are assumed to be
+    in EPSG:4326.
+    """
+
+    extensions = (".csv",)
+
+    def rows(self):
+        self.file_obj.seek(0)
+        text = io.TextIOWrapper(self.file_obj, encoding="utf-8-sig", newline="")
+        try:
+            yield from csv.DictReader(text)
+        finally:
+            # Leaves the underlying file open for the next pass
+            if not self.file_obj.closed:
+                text.detach()
+
+    def geometry_columns(self, fieldnames):
+        columns = {name.lower(): name for name in fieldnames}
+        for name in CSV_WKT_COLUMNS:
+            if name in columns:
+                return columns[name], None
+        latitude = next(
+            (columns[n] for n in CSV_LATITUDE_COLUMNS if n in columns), None
+        )
+        longitude = next(
+            (columns[n] for n in CSV_LONGITUDE_COLUMNS if n in columns), None
+        )
+        if latitude and longitude:
+            return longitude, latitude
+        raise ValueError(
+            "CSV files need a WKT column or latitude and longitude columns."
+        )
+
+    def count(self):
+        return sum(1 for _ in self.rows())
+
+    def features(self, start=0, stop=None):
+        total_bytes = file_size(self.file_obj)
+        columns = None
+        rows = itertools.islice(self.rows(), start, stop)
+        for self.position, row in enumerate(rows, start=start + 1):
+            if columns is None:
+                columns = self.geometry_columns(list(row))
+            self.progress = int(min(self.file_obj.tell() / total_bytes, 1) * 100)
+            x, y = (row.pop(column) if column else None for column in columns)
+            if not x or (columns[1] and not y):
+                continue
+            if columns[1]:
+                geometry = {"type": "Point", "coordinates": (float(x), float(y))}
+            else:
+                geometry = shapely.from_wkt(x)
+            yield {"type": "Feature", "geometry": geometry, "properties": row}
+
+
+class FionaReader(FeatureReader):
+    """Reads every layer of a file with a Fiona (OGR) driver.
+
+    Features of all layers are read as one stream. When a file holds more
+    than one layer, each feature's layer name is kept in a ``source_layer``
+    property. The layers must share one CRS.
+    """
+
+    driver = None
+    splittable = True
+
+    def __init__(self, file_obj, path=None):
+        super().__init__(file_obj, path)
+        self.stack = ExitStack()
+        try:
+            path = self.open_path()
+            collections = [
+                self.stack.enter_context(
+                    fiona.open(path, layer=name, driver=self.driver)
+                )
+                for name in fiona.listlayers(path)
+            ]
+            # Attribute-only tables in a GeoPackage have no geometry
+            self.collections = [
+                collection
+                for collection in collections
+                if collection.schema.get("geometry") not in (None, "None")
+            ]
+            crs = {collection.crs_wkt or TARGET_CRS for collection in self.collections}
+            if len(crs) > 1:
+                raise ValueError("All layers of the file must have the same CRS.")
+            self.source_crs = crs.pop() if crs else TARGET_CRS
+        except Exception:
+            self.stack.close()
+            raise
+
+    def open_path(self):
+        """Returns a path GDAL can open for the file."""
+        return self.path or self.file_obj.name
+
+    def close(self):
+        self.stack.close()
+
+    def count(self):
+        return sum(len(collection) for collection in self.collections)
+
+    def split(self, chunk_size):
+        return record_ranges(self.count(), chunk_size)
+
+    def features(self, start=0, stop=None):
+        total_records = self.count() or 1
+        offset = 0
+        multiple = len(self.collections) > 1
+        for collection in self.collections:
+            length = len(collection)
+            # The part of [start, stop) that falls in this layer
+            layer_start = max(start - offset, 0)
+            layer_stop = length if stop is None else min(stop - offset, length)
+            if layer_start < layer_stop:
+                records = collection.filter(layer_start, layer_stop)
+                for index, feature in enumerate(records, start=offset + layer_start):
+                    self.position = index + 1
+                    self.progress = int(self.position / total_records * 100)
+                    if feature["geometry"] is None:
+                        continue
+                    properties = {
+                        key: json_value(value)
+                        for key, value in feature["properties"].items()
+                    }
+                    if multiple:
+                        properties["source_layer"] = collection.name
+                    yield {
+                        "type": "Feature",
+                        "geometry": feature["geometry"],
+                        "properties": properties,
+                    }
+            offset += length
+
+
+class GeoPackageReader(FionaReader):
+    extensions = (".gpkg",)
+    driver = "GPKG"
+
+
+class FlatGeobufReader(FionaReader):
+    extensions = (".fgb",)
+    driver = "FlatGeobuf"
+
+
+class KMLReader(FionaReader):
+    """Reads KML, with one layer per folder.
+
+    KML is parsed from the start to reach any feature, so it is not split.
+    """
+
+    extensions = (".kml",)
+    driver = "KML"
+    splittable = False
+
+
+class ShapefileReader(FionaReader):
+    """Reads a zipped shapefile in place, through GDAL's /vsizip/."""
+
+    extensions = (".zip",)
+    driver = "ESRI Shapefile"
+
+    def open_path(self):
+        # Only the archive's central directory is read here
+        with zipfile.ZipFile(self.file_obj, "r") as zip_ref:
+            shapefile = next(
+                (name for name in zip_ref.namelist() if name.endswith(".shp")),
+                None,
+            )
+        if shapefile is None:
+            raise ValueError("No shapefile found in the .zip archive")
+        return f"/vsizip/{super().open_path()}/{shapefile}"
+
+
+class GeoParquetReader(FeatureReader):
+    """Reads GeoParquet with WKB geometries, one record batch at a time.
+
+    Only the row groups overlapping a range are read, and the file is
+    split at row group boundaries.
+    """
+
+    extensions = (".parquet", ".geoparquet")
+    splittable = True
+    batch_size = 10_000
+
+    def __init__(self, file_obj, path=None):
+        # pyarrow is large and only needed here
+        import pyarrow.parquet as pq
+
+        super().__init__(file_obj, path)
+        self.parquet = pq.ParquetFile(file_obj)
+        metadata = self.parquet.schema_arrow.metadata or {}
+        if b"geo" not in metadata:
+            raise ValueError("The Parquet file has no GeoParquet metadata.")
+        geo = json.loads(metadata[b"geo"])
+        self.geometry_column = geo["primary_column"]
+        column = geo["columns"][self.geometry_column]
+        if column.get("encoding", "WKB").upper() != "WKB":
+            raise ValueError("Only WKB encoded GeoParquet geometries are supported.")
+        # A missing crs means OGC:CRS84, and a null one an unknown CRS
+        crs = column.get("crs", "OGC:CRS84")
+        if isinstance(crs, dict):
+            self.source_crs = CRS.from_json_dict(crs).to_wkt()
+        elif crs is not None:
+            self.source_crs = crs
+
+    def count(self):
+        return self.parquet.metadata.num_rows
+
+    def row_group_offsets(self):
+        """Returns the offset of each row group's first row, and the row count."""
+        metadata = self.parquet.metadata
+        offsets = [0]
+        for index in range(metadata.num_row_groups):
+            offsets.append(offsets[-1] + metadata.row_group(index).num_rows)
+        return offsets
+
+    def split(self, chunk_size):
+        offsets = self.row_group_offsets()
+        starts = [0]
+        for offset in offsets[1:-1]:
+            if offset - starts[-1] >= chunk_size:
+                starts.append(offset)
+        return list(zip(starts, starts[1:] + [offsets[-1]]))
+
+    def features(self, start=0, stop=None):
+        total_rows = self.count() or 1
+        offsets = self.row_group_offsets()
+        row_groups = [
+            index
+            for index in range(len(offsets) - 1)
+            if offsets[index + 1] > start and (stop is None or offsets[index] < stop)
+        ]
+        if not row_groups:
+            return
+        offset = offsets[row_groups[0]]
+        batches = self.parquet.iter_batches(
+            batch_size=self.batch_size, row_groups=row_groups
+        )
+        for batch in batches:
+            batch_offset = offset
+            offset += batch.num_rows
+            if offset <= start:
+                continue
+            if stop is not None and batch_offset >= stop:
+                break
+            # The part of [start, stop) that falls in this batch
+            low = max(start - batch_offset, 0)
+            high = (
+                batch.num_rows
+                if stop is None
+                else min(stop - batch_offset, batch.num_rows)
+            )
+            batch = batch.slice(low, high - low)
+            self.progress = int(min(offset / total_rows, 1) * 100)
+            geoms = shapely.from_wkb(
+                batch.column(self.geometry_column).to_numpy(zero_copy_only=False)
+            )
+            properties = batch.drop_columns([self.geometry_column]).to_pylist()
+            rows = enumerate(zip(geoms, properties), start=batch_offset + low + 1)
+            for self.position, (geom, values) in rows:
+                if geom is None:
+                    continue
+                yield {
+                    "type": "Feature",
+                    "geometry": geom,
+                    "properties": {
+                        key: json_value(value) for key, value in values.items()
+                    },
+                }
+
+
+READERS = {
+    extension: reader
+    for reader in (
+        GeoJSONReader,
+        NDJSONReader,
+        CSVReader,
+        ShapefileReader,
+        GeoPackageReader,
+        FlatGeobufReader,
+        KMLReader,
+        GeoParquetReader,
+    )
+    for extension in reader.extensions
+}
+
+
+def get_reader(file_name):
+    """Returns the reader class for a file name, by its extension."""
+    extension = Path(file_name).suffix.lower()
+    try:
+        return READERS[extension]
+    except KeyError:
+        raise ValueError(f"Unsupported file type: {extension}")
@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from pyproj import CRS, Transformer
+
+TARGET_CRS = "EPSG:4326"
+
+
+@lru_cache(maxsize=64)
+def get_transformer(source_crs):
+    """Returns a cached Transformer from ``source_crs`` to EPSG:4326.
+
+    Building a Transformer is expensive, so one is kept per source CRS for
+    the lifetime of the worker process. ``source_crs`` must be hashable, e.g.
+    an authority string or WKT.
+    """
+    return Transformer.from_crs(CRS(source_crs), CRS(TARGET_CRS), always_xy=True)
+
+
+@lru_cache(maxsize=64)
+def needs_transform(source_crs):
+    """Returns True if geometries in ``source_crs`` must be reprojected."""
+    return not CRS(source_crs).equals(CRS(TARGET_CRS), ignore_axis_order=True)
+
+
+def transform_geoms(transformer, geoms):
+    """Reprojects an array of shapely geometries with one transform call.
+
+    shapely gathers the coordinates of every geometry in the array into a
+    single NumPy array, which is transformed in one vectorized call and
+    written back, instead of calling the transformer once per vertex.
+    """
+
+    def transform_coords(coords):
+        x, y = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack([x, y])
+
+    return shapely.transform(geoms, transform_coords)
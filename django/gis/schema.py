@@ -0,0 +1,264 @@
+import hashlib
+import json
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, NullIf
+from django.db.models.lookups import Exact, IsNull
+
+from gis.models import LayerProperty
+from gis.partitions import partition_name
+
+INTEGER_RE = re.compile(r"^[+-]?\d+$")
+FLOAT_RE = re.compile(r"^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$")
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?")
+BOOLEAN_VALUES = {"true", "false"}
+
+# A string property with at most this many distinct values is a category
+CATEGORY_MAX_VALUES = 50
+
+NUMERIC_TYPES = {"integer", "float"}
+
+
+def value_type(value):
+    """Returns the LayerProperty type of a single property value.
+
+    Strings are parsed, since shapefile attributes and converted CSVs often
+    carry numbers, booleans and dates as text. Returns None for empty values.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, (dict, list)):
+        return "json"
+    value = str(value).strip()
+    if value.lower() in BOOLEAN_VALUES:
+        return "boolean"
+    if INTEGER_RE.match(value):
+        return "integer"
+    if FLOAT_RE.match(value):
+        return "float"
+    if DATE_RE.match(value):
+        return "date"
+    if DATETIME_RE.match(value):
+        return "datetime"
+    return "string"
+
+
+def merge_types(a, b):
+    """Returns the narrowest type that can hold values of both types."""
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if {a, b} == {"integer", "float"}:
+        return "float"
+    if {a, b} == {"date", "datetime"}:
+        return "datetime"
+    return "string"
+
+
+class SchemaInferrer:
+    """Infers LayerProperty types from batches of features during ingest.
+
+    Only the running type, a count and up to ``CATEGORY_MAX_VALUES + 1``
+    distinct values are kept per property, so memory does not grow with the
+    number of features.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.counts = {}
+        self.values = {}
+
+    def observe(self, feature_batch):
+        for feature in feature_batch:
+            for name, value in feature["properties"].items():
+                self.observe_value(name, value)
+
+    def observe_value(self, name, value):
+        type_ = value_type(value)
+        self.types[name] = merge_types(self.types.get(name), type_)
+        if type_ is None:
+            return
+        self.counts[name] = self.counts.get(name, 0) + 1
+        values = self.values.setdefault(name, set())
+        if len(values) <= CATEGORY_MAX_VALUES:
+            values.add(str(value))
+
+    def merge(self, state):
+        """Merges the state of another inferrer, as returned by ``state``."""
+        for name, type_ in state["types"].items():
+            self.types[name] = merge_types(self.types.get(name), type_)
+        for name, count in state["counts"].items():
+            self.counts[name] = self.counts.get(name, 0) + count
+        for name, values in state["values"].items():
+            merged = self.values.setdefault(name, set())
+            for value in values:
+                if len(merged) > CATEGORY_MAX_VALUES:
+                    break
+                merged.add(value)
+
+    def state(self):
+        """Returns a JSON-serializable snapshot of the inferred schema."""
+        return {
+            "types": self.types,
+            "counts": self.counts,
+            "values": {name: sorted(values) for name, values in self.values.items()},
+        }
+
+    def property_types(self):
+        """Returns a mapping of property name to final LayerProperty type."""
+        types = {}
+        for name, type_ in self.types.items():
+            if type_ is None:
+                type_ = "string"
+            elif type_ == "string":
+                # Few distinct values, each repeated, make a category
+                distinct = len(self.values.get(name, ()))
+                if (
+                    distinct <= CATEGORY_MAX_VALUES
+                    and distinct * 2 <= self.counts[name]
+                ):
+                    type_ = "category"
+            types[name] = type_
+        return types
+
+    def save(self, layer_id):
+        """Creates or updates the layer's LayerProperty rows."""
+        existing = {
+            prop.name: prop for prop in LayerProperty.objects.filter(layer_id=layer_id)
+        }
+        created, updated = [], []
+        for name, type_ in self.property_types().items():
+            if name in existing:
+                existing[name].type = type_
+                updated.append(existing[name])
+            else:
+                created.append(LayerProperty(name=name, type=type_, layer_id=layer_id))
+        LayerProperty.objects.bulk_create(created)
+        LayerProperty.objects.bulk_update(updated, ["type"])
+
+
+def property_expression(prop):
+    """Returns the expression used to sort and index a property.
+
+    Numeric properties are cast so they compare as numbers. Queries must use
+    this same expression for PostgreSQL to match the expression index.
+    """
+    expression = KeyTextTransform(prop.name, "properties")
+    if prop.type in NUMERIC_TYPES:
+        return Cast(NullIf(expression, Value("")), FloatField())
+    return expression
+
+
+def property_index_sql(prop):
+    """Returns ``property_expression`` as SQL for an index definition."""
+    if prop.type in NUMERIC_TYPES:
+        return "(NULLIF((properties ->> %s), ''))::double precision"
+    return "(properties ->> %s)"
+
+
+def property_index_name(prop):
+    digest = hashlib.md5(prop.name.encode()).hexdigest()[:8]
+    return f"{partition_name(prop.layer_id)}_p{digest}"
+
+
+def properties_gin_index_name(layer_id):
+    return f"{partition_name(layer_id)}_props_gin"
+
+
+def create_property_index(prop):
+    """Creates the indexes for a property marked as ``indexed``.
+
+    Each indexed property gets an expression index for sorting and
+    filters, built on the layer's own partition only.
+    """
+    table = partition_name(prop.layer_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS {property_index_name(prop)}
+            ON {table} (({property_index_sql(prop)}))
+        """,
+            [prop.name],
+        )
+
+
+def drop_property_index(prop):
+    """Drops a property's expression index, and the GIN index earlier
+    versions built for the layer once no property of it is indexed any
+    more."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP INDEX IF EXISTS {property_index_name(prop)}")
+        if (
+            not LayerProperty.objects.filter(layer_id=prop.layer_id, indexed=True)
+            .exclude(id=prop.id)
+            .exists()
+        ):
+            cursor.execute(
+                f"DROP INDEX IF EXISTS {properties_gin_index_name(prop.layer_id)}"
+            )
+
+
+def filter_features(queryset, properties, filters):
+    """Applies attribute filters to a LayerFeature queryset.
+
+    ``filters`` maps property names to values. Values are compared through
+    ``property_expression``, so the property's expression index serves the
+    filter, and ``5`` matches a value stored as ``"5"`` like it sorts with
+    it. ``None`` matches missing and empty values.
+    """
+    if not isinstance(filters, dict):
+        raise ValueError("Filters must be an object of property names to values.")
+    by_name = {prop.name: prop for prop in properties}
+    unknown = set(filters) - set(by_name)
+    if unknown:
+        raise ValueError(f"Unknown properties: {', '.join(sorted(unknown))}")
+    for name, value in filters.items():
+        prop = by_name[name]
+        expression = property_expression(prop)
+        if value is None:
+            queryset = queryset.filter(IsNull(expression, True))
+            continue
+        if prop.type in NUMERIC_TYPES:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be filtered by a number.")
+        elif not isinstance(value, str):
+            # Matches the text ->> gives for a JSON boolean or number
+            value = json.dumps(value)
+        queryset = queryset.filter(Exact(expression, Value(value)))
+    return queryset
+
+
+def parse_sort(properties, sort):
+    """Returns the property and direction of a ``name`` or ``-name`` sort."""
+    descending = sort.startswith("-")
+    name = sort[1:] if descending else sort
+    prop = next((prop for prop in properties if prop.name == name), None)
+    if prop is None:
+        raise ValueError(f"Unknown property: {name}")
+    return prop, descending
+
+
+def sort_features(queryset, properties, sort):
+    """Orders a LayerFeature queryset by a property, ``-name`` for descending.
+
+    The ordering uses ``property_expression`` so an indexed property is read
+    in index order, with the feature id as a tie-breaker.
+    """
+    prop, descending = parse_sort(properties, sort)
+    expression = property_expression(prop)
+    if descending:
+        return queryset.order_by(expression.desc(), "-id")
+    return queryset.order_by(expression.asc(), "id")
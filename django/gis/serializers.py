@@ -1,6 +1,8 @@
 # serializers.py
 from rest_framework import serializers
-from .models import Layer, Project, ProjectLayer, Directory
+from .models import Layer, LayerProperty, Project, ProjectLayer, Directory
+from .readers import get_reader
+from .stats import get_layer_stats
 
 
 class LayerSerializer(serializers.ModelSerializer):
@@ -9,6 +11,13 @@ class LayerSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class LayerPropertySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LayerProperty
+        fields = ["id", "layer", "name", "type", "indexed"]
+        read_only_fields = ["layer", "name", "type"]
+
+
 class ProjectLayerSerializer(serializers.ModelSerializer):
     layer = LayerSerializer(read_only=True)
     layer_id = serializers.PrimaryKeyRelatedField(
@@ -56,16 +65,63 @@ class ProjectSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class LayerSummarySerializer(serializers.ModelSerializer):
+    """A layer with the stats a map needs to place it and build its legend."""
+
+    stats = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Layer
+        fields = ["id", "name", "directory", "modified_at", "generalized", "stats"]
+
+    def get_stats(self, obj):
+        stats = get_layer_stats(obj)
+        return {
+            "feature_count": stats.feature_count,
+            "extent": stats.extent,
+            "extent_3857": stats.extent_3857,
+            "geometry_types": stats.geometry_types,
+            "properties": stats.properties,
+        }
+
+
+class ProjectLayerSummarySerializer(serializers.ModelSerializer):
+    layer = LayerSummarySerializer(read_only=True)
+
+    class Meta:
+        model = ProjectLayer
+        fields = ["id", "order", "layer", "group", "style", "basemap", "visible"]
+
+
+class ProjectBootstrapSerializer(serializers.ModelSerializer):
+    """A project with everything the map page needs to open it."""
+
+    project_layers = ProjectLayerSummarySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Project
+        fields = "__all__"
+
+
 class FileUploadSerializer(serializers.Serializer):
     file = serializers.FileField()
 
     def validate_file(self, value):
-        # You can add custom validation here if necessary
-        if not value.name.endswith((".zip", ".geojson")):
+        try:
+            get_reader(value.name)
+        except ValueError:
             raise serializers.ValidationError("Unsupported file type.")
         return value
 
 
+class DirectoryNodeSerializer(serializers.ModelSerializer):
+    """A directory without its contents, for trees nested in memory."""
+
+    class Meta:
+        model = Directory
+        fields = ["id", "name", "parent", "user"]
+
+
 class DirectorySerializer(serializers.ModelSerializer):
     subdirectories = serializers.SerializerMethodField()
     layers = serializers.SerializerMethodField()
@@ -0,0 +1,76 @@
+import os
+
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from gis.loaders import drop_staging_tables
+from gis.models import (
+    Directory,
+    Layer,
+    LayerProperty,
+    LayerStats,
+    Project,
+    ProjectLayer,
+)
+from gis.partitions import drop_layer_partition
+from gis.tiles import archive_path
+from gis.versions import (
+    bump_versions,
+    invalidate_projects,
+    invalidate_projects_with_layers,
+    layer_scope,
+    project_scope,
+    user_scope,
+)
+
+
+@receiver(pre_delete, sender=Layer)
+def drop_layer_features(sender, instance, **kwargs):
+    # Dropping the partition first leaves nothing for the cascading DELETE.
+    # Already done, without locking the feature table, by delete_layers.
+    drop_layer_partition(instance.id)
+    drop_staging_tables(instance.id)
+
+
+@receiver(pre_delete, sender=Layer)
+def remove_layer_tile_archive(sender, instance, **kwargs):
+    path = archive_path(instance.id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@receiver(post_save, sender=Directory)
+@receiver(post_delete, sender=Directory)
+def invalidate_directory(sender, instance, **kwargs):
+    bump_versions(user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Layer)
+@receiver(post_delete, sender=Layer)
+def invalidate_layer(sender, instance, **kwargs):
+    bump_versions(user_scope(instance.user_id), layer_scope(instance.id))
+    invalidate_projects_with_layers([instance.id])
+
+
+@receiver(post_save, sender=LayerStats)
+def invalidate_layer_stats(sender, instance, **kwargs):
+    bump_versions(layer_scope(instance.layer_id))
+    invalidate_projects_with_layers([instance.layer_id])
+
+
+@receiver(post_save, sender=LayerProperty)
+@receiver(post_delete, sender=LayerProperty)
+def invalidate_layer_property(sender, instance, **kwargs):
+    bump_versions(layer_scope(instance.layer_id))
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project(sender, instance, **kwargs):
+    bump_versions(project_scope(instance.id), user_scope(instance.owner_id))
+
+
+@receiver(post_save, sender=ProjectLayer)
+@receiver(post_delete, sender=ProjectLayer)
+def invalidate_project_layer(sender, instance, **kwargs):
+    invalidate_projects([instance.project_id])
@@ -0,0 +1,130 @@
+import logging
+from functools import lru_cache
+
+from django.db import connection
+from pyproj import Transformer
+
+from gis.models import IngestCheckpoint, LayerFeature, LayerProperty, LayerStats
+from gis.tiles import MAX_LATITUDE
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def get_mercator_transformer():
+    return Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+
+
+def clamp_extent(extent):
+    """Clamps an EPSG:4326 extent to the range Web Mercator can represent."""
+    minx, miny, maxx, maxy = extent
+    minx, maxx = min(minx, maxx), max(minx, maxx)
+    miny, maxy = min(miny, maxy), max(miny, maxy)
+    if minx < -180 or maxx > 180:
+        logger.error("Longitude values are out of range. Adjusting to valid range.")
+        minx = max(min(minx, 180), -180)
+        maxx = max(min(maxx, 180), -180)
+    miny = max(min(miny, MAX_LATITUDE), -MAX_LATITUDE)
+    maxy = max(min(maxy, MAX_LATITUDE), -MAX_LATITUDE)
+    return [minx, miny, maxx, maxy]
+
+
+def mercator_extent(extent):
+    minx, miny, maxx, maxy = clamp_extent(extent)
+    transformer = get_mercator_transformer()
+    minx, miny = transformer.transform(minx, miny)
+    maxx, maxy = transformer.transform(maxx, maxy)
+    return [minx, miny, maxx, maxy]
+
+
+def compute_layer_stats(layer_id):
+    """Returns a layer's stats, unsaved, with one scan of its partition."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT
+                GeometryType(geometry),
+                count(*),
+                ST_XMin(ST_Extent(geometry)),
+                ST_YMin(ST_Extent(geometry)),
+                ST_XMax(ST_Extent(geometry)),
+                ST_YMax(ST_Extent(geometry))
+            FROM {LayerFeature._meta.db_table}
+            WHERE layer_id = %s
+            GROUP BY 1
+        """,
+            [layer_id],
+        )
+        rows = cursor.fetchall()
+
+    geometry_types = {type_: count for type_, count, *_ in rows}
+    extent = None
+    if rows:
+        extent = [
+            min(row[2] for row in rows),
+            min(row[3] for row in rows),
+            max(row[4] for row in rows),
+            max(row[5] for row in rows),
+        ]
+    properties = [
+        {"name": name, "type": type_}
+        for name, type_ in LayerProperty.objects.filter(layer_id=layer_id)
+        .order_by("id")
+        .values_list("name", "type")
+    ]
+    return LayerStats(
+        layer_id=layer_id,
+        feature_count=sum(geometry_types.values()),
+        extent=extent,
+        extent_3857=mercator_extent(extent) if extent else None,
+        geometry_types=geometry_types,
+        properties=properties,
+    )
+
+
+def refresh_layer_stats(layer_id):
+    """Recomputes and saves a layer's stats.
+
+    Run whenever a layer's features or properties change, so that reads of
+    the stats never touch the features.
+    """
+    computed = compute_layer_stats(layer_id)
+    stats, _ = LayerStats.objects.update_or_create(
+        layer_id=layer_id,
+        defaults={
+            "feature_count": computed.feature_count,
+            "extent": computed.extent,
+            "extent_3857": computed.extent_3857,
+            "geometry_types": computed.geometry_types,
+            "properties": computed.properties,
+        },
+    )
+    return stats
+
+
+def get_layer_stats(layer):
+    """Returns a layer's stats, computing them for layers ingested before
+    stats were kept.
+
+    A layer with an ingest checkpoint is still being loaded, so its stats
+    are computed without being saved. They are saved once the ingest
+    finishes.
+    """
+    try:
+        return layer.stats
+    except LayerStats.DoesNotExist:
+        if IngestCheckpoint.objects.filter(layer_id=layer.id).exists():
+            return compute_layer_stats(layer.id)
+        return refresh_layer_stats(layer.id)
+
+
+def stats_properties(stats):
+    """Returns unsaved LayerProperty objects for the properties in stats.
+
+    They carry the name and type that filtering and sorting need, without
+    querying LayerProperty.
+    """
+    return [
+        LayerProperty(layer_id=stats.layer_id, name=prop["name"], type=prop["type"])
+        for prop in stats.properties
+    ]
@@ -1,34 +1,123 @@
 import json
 import logging
+import os
 import tempfile
-import zipfile
+from contextlib import contextmanager
+from datetime import timedelta
 from pathlib import Path
 
 import fiona
-from celery import shared_task
-from google.cloud import storage
+import numpy as np
+from celery import group, shared_task
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+from google.api_core.exceptions import ServerError, TooManyRequests
 from django.conf import settings
-from django.contrib.gis.geos import GEOSGeometry
 from django.core.cache import cache
-from django.db import connection, close_old_connections, IntegrityError
-
-from pyproj import CRS, Transformer
-
-from gis.models import Layer, LayerFeature, LayerProperty
+from django.db import (
+    connection,
+    close_old_connections,
+    IntegrityError,
+    InterfaceError,
+    OperationalError,
+    transaction,
+)
+
+from gis.exports import export_layer
+from gis.generalize import build_feature_levels
+from gis.limits import acquire_slot, defer_task, release_slot
+from gis.loaders import get_loader
+from gis.maintenance import analyze_features, cluster_features
+from gis.mbtiles import MBTiles
+from gis.models import IngestCheckpoint, Layer, LayerProperty, ProjectLayer
+from gis.partitions import create_layer_partition, delete_layers, partition_name
+from gis.progress import set_task_status
+from gis.readers import get_reader
+from gis.schema import (
+    SchemaInferrer,
+    create_property_index,
+    drop_property_index,
+)
+from gis.reproject import (
+    get_transformer,
+    needs_transform,
+    transform_geoms,
+)
+from gis.storage import get_storage, get_storage_client
+from gis.stats import get_layer_stats, refresh_layer_stats
+from gis.tiles import (
+    archive_path,
+    covered_tiles,
+    covering_bands,
+    invalidate_layer_tiles,
+    render_tile,
+    tile_version,
+)
 from accounts.models import User
 
 logger = logging.getLogger(__name__)
 
+# Lost database or storage connections, worth retrying an ingest for, as
+# opposed to errors in the file itself
+RETRYABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    InterfaceError,
+    OperationalError,
+    ServerError,
+    TooManyRequests,
+)
+
+# Long tasks are acknowledged only once they finish, so one whose worker
+# dies is redelivered rather than lost. Workers prefetch one task at a time
+# (CELERY_WORKER_PREFETCH_MULTIPLIER), so a queued task never waits behind
+# a long one on a busy worker while another worker is idle.
+LONG_TASK_OPTIONS = {"acks_late": True, "reject_on_worker_lost": True}
+
+# A redelivered ingest task resumes from its checkpoint like a retry
+INGEST_TASK_OPTIONS = {
+    "bind": True,
+    **LONG_TASK_OPTIONS,
+    "autoretry_for": RETRYABLE_ERRORS,
+    "max_retries": settings.INGEST_MAX_RETRIES,
+    "retry_backoff": True,
+}
+
+# How long a parent task's finalization stays claimed, well beyond the time
+# its chunks can take to report
+FINALIZE_CLAIM_TIMEOUT = int(timedelta(days=1).total_seconds())
 
-class FileIngestor:
 
-    def __init__(self, gcs_path, layer_name, directory, user_email, task_id):
+class FileIngestor:
+    batch_size = 1000
+
+    def __init__(
+        self,
+        gcs_path,
+        layer_name,
+        directory,
+        user_email,
+        task_id,
+        loader="copy",
+        checkpoint_id=None,
+    ):
         self.gcs_path = gcs_path
         self.layer_name = layer_name
         self.directory = directory
         self.user_email = user_email
         self.task_id = task_id
+        # Chunks report progress under the parent task but resume on their own
+        self.checkpoint_id = checkpoint_id or task_id
+        self.checkpoint = None
+        self.loader_class = get_loader(loader)
+        self.reader_class = get_reader(gcs_path)
+        self.reader = None
+        self.schema = SchemaInferrer()
+        self.track_properties = True
+        self.chunk_index = None
+        self.chunk_count = None
         self.bucket_name, self.blob_name = self.parse_gcs_path()
+        self.storage = get_storage(self.bucket_name)
 
     def parse_gcs_path(self):
         """Parses a GCS path into bucket name and blob name."""
@@ -41,178 +130,244 @@ class FileIngestor:
             )
         return parts[0], parts[1]
 
-    def download_from_gcs(self, local_file_path):
-        """Downloads a file from GCS to a local file path."""
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(self.bucket_name)
-        blob = bucket.blob(self.blob_name)
-        blob.download_to_filename(local_file_path)
-
-    def ingest_file_to_db(self):
-        """Ingests a file into the specified database table."""
-        with tempfile.NamedTemporaryFile(delete=True) as temp_file:
-            self.download_from_gcs(temp_file.name)
-            temp_file.seek(0)  # Ensure the file pointer is at the beginning
-            file_extension = Path(self.gcs_path).suffix.lower()
-
-            if file_extension == ".geojson":
-                # Read the GeoJSON file
-                geojson_data = json.load(temp_file)
-                crs = (
-                    geojson_data.get("crs", {})
-                    .get("properties", {})
-                    .get("name", "EPSG:4326")
-                )
-                if crs != "EPSG:4326":
-                    transformer = Transformer.from_crs(
-                        CRS(crs), CRS("EPSG:4326"), always_xy=True
-                    )
-                    features = [
-                        {
-                            **feature,
-                            "geometry": self.transform_geom(
-                                transformer, feature["geometry"]
-                            ),
-                        }
-                        for feature in geojson_data["features"]
-                    ]
-                else:
-                    features = geojson_data["features"]
-            elif file_extension == ".zip":
-                # Handle shapefile in a .zip file
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    with zipfile.ZipFile(temp_file, "r") as zip_ref:
-                        zip_ref.extractall(temp_dir)
-                        shapefile_path = next(
-                            (
-                                Path(temp_dir) / name
-                                for name in zip_ref.namelist()
-                                if name.endswith(".shp")
-                            ),
-                            None,
-                        )
-                        if shapefile_path is None:
-                            raise ValueError("No shapefile found in the .zip archive")
-
-                        with fiona.open(shapefile_path) as shapefile:
-                            crs = CRS(shapefile.crs)
-                            transformer = Transformer.from_crs(
-                                crs, CRS("EPSG:4326"), always_xy=True
-                            )
-                            features = []
-                            for feature in shapefile:
-                                # Example: Convert custom object to dict or str if necessary
-                                properties = {
-                                    key: (
-                                        value.to_dict()
-                                        if hasattr(value, "to_dict")
-                                        else str(value)
-                                    )
-                                    for key, value in feature["properties"].items()
-                                }
-
-                                geom = feature["geometry"]
-                                if crs != CRS("EPSG:4326"):
-                                    geom = self.transform_geom(transformer, geom)
-                                features.append(
-                                    {
-                                        "type": "Feature",
-                                        "geometry": geom,
-                                        "properties": properties,
-                                    }
-                                )
-
+    def create_layer(self):
+        """Creates the Layer, incrementing the name until it is unique."""
         user = User.objects.get(email=self.user_email)
-        # Create or get the Layer instance
 
         def increment_name(name, prev=0):
             try:
-                if prev == 0:
+                # A savepoint, so a name clash can be retried in a transaction
+                with transaction.atomic():
+                    if prev == 0:
+                        return Layer.objects.create(
+                            name=self.layer_name, user=user, directory_id=self.directory
+                        )
+                    inc_name = Path(name).stem + f"({prev})" + Path(name).suffix
                     return Layer.objects.create(
-                        name=self.layer_name, user=user, directory_id=self.directory
+                        name=inc_name,
+                        user=user,
+                        directory_id=self.directory,
                     )
-                inc_name = Path(name).stem + f"({prev})" + Path(name).suffix
-                return Layer.objects.create(
-                    name=inc_name,
-                    user=user,
-                    directory_id=self.directory,
-                )
             except IntegrityError:
                 return increment_name(name, prev + 1)
 
-        layer = increment_name(self.layer_name)
-        logger.info(self.layer_name)
-        logger.info(f"Layer created: {layer.id}: {layer.name}")
+        return increment_name(self.layer_name)
 
-        total_features = len(features)
-        processed_features = 0
-        batch_size = 100
+    @contextmanager
+    def open_reader(self):
+        """Yields a reader for the file, streaming it from storage.
 
-        # Batch process for LayerFeature creation
-        for i in range(0, total_features, batch_size):
-            feature_batch = features[i : i + batch_size]
+        Nothing is downloaded up front: the file is read in ranges as it is
+        parsed, by Python or through GDAL's virtual file systems.
+        """
+        with fiona.Env(**self.storage.gdal_options()):
+            with self.storage.open(self.blob_name) as file_obj:
+                path = self.storage.gdal_path(self.blob_name)
+                with self.reader_class(file_obj, path) as reader:
+                    self.reader = reader
+                    yield reader
 
-            # Create LayerFeature instances in batches
-            feature_instance_batch = [
-                LayerFeature(
-                    geometry=GEOSGeometry(json.dumps(feature["geometry"])),
-                    layer=layer,
-                    properties=feature["properties"],
+    def ingest_file_to_db(self):
+        """Streams a file into the database in fixed-size batches.
+
+        Features are read one at a time and flushed every ``batch_size``
+        features, so peak memory is bounded by the batch size rather than
+        the size of the file. Each batch is committed with the task's
+        checkpoint, so a retried task loads into the same layer, starting
+        after the last committed batch.
+        """
+        with self.open_reader() as reader:
+            checkpoint = self.get_checkpoint()
+            if not checkpoint.finished:
+                self.load_features(checkpoint.layer, reader.features(checkpoint.offset))
+
+        return checkpoint.layer_id
+
+    def get_checkpoint(self, layer_id=None, start=0):
+        """Returns the task's checkpoint and restores the schema inferred so far.
+
+        On the task's first run the checkpoint is created at ``start``,
+        together with a new layer unless ``layer_id`` is given.
+        """
+        checkpoint = (
+            IngestCheckpoint.objects.select_related("layer")
+            .filter(task_id=self.checkpoint_id)
+            .first()
+        )
+        if checkpoint is None:
+            with transaction.atomic():
+                if layer_id is None:
+                    layer = self.create_layer()
+                    logger.info(f"Layer created: {layer.id}: {layer.name}")
+                else:
+                    layer = Layer.objects.get(id=layer_id)
+                checkpoint = IngestCheckpoint.objects.create(
+                    task_id=self.checkpoint_id, layer=layer, offset=start
                 )
-                for feature in feature_batch
-            ]
-            LayerFeature.objects.bulk_create(feature_instance_batch)
+        elif not checkpoint.finished:
+            logger.info(
+                f"Resuming layer {checkpoint.layer_id} at feature {checkpoint.offset}"
+            )
 
-            unique_properties = set(
-                key for feature in feature_batch for key in feature["properties"]
+        self.checkpoint = checkpoint
+        self.schema = SchemaInferrer()
+        if checkpoint.schema:
+            self.schema.merge(checkpoint.schema)
+        return checkpoint
+
+    def ingest_chunk(self, layer_id, chunk_index, chunk_count, start, stop):
+        """Loads the features at offsets ``start`` to ``stop`` of the file into
+        a layer.
+
+        Used by the parallel ingest, where several chunks load into the same
+        layer at once. The chunk's inferred schema is left in the cache for
+        the finalizer, and progress is aggregated across all chunks of the
+        parent task.
+        """
+        self.chunk_index = chunk_index
+        self.chunk_count = chunk_count
+        self.chunk_start = start
+        self.chunk_length = max(stop - start, 1)
+        self.track_properties = False
+        with self.open_reader() as reader:
+            checkpoint = self.get_checkpoint(layer_id, start)
+            if not checkpoint.finished:
+                features = reader.features(checkpoint.offset, stop)
+                self.load_features(checkpoint.layer, features)
+        cache.set(
+            f"{self.task_id}:schema:{chunk_index}", self.schema.state(), timeout=None
+        )
+
+    def load_features(self, layer, features):
+        """Writes an iterable of features to the layer in batches.
+
+        What is loaded stays in place if this fails, for a retry to resume
+        from. Deleting the layer removes it.
+        """
+        self.loader = self.loader_class(layer, self.chunk_index)
+        batch = []
+        for feature in features:
+            batch.append(feature)
+            if len(batch) >= self.batch_size:
+                self.flush_batch(layer, batch)
+                batch = []
+        if batch:
+            self.flush_batch(layer, batch)
+        self.finish_load(layer)
+
+    def flush_batch(self, layer, feature_batch):
+        """Writes one batch of features and records their property types."""
+        geoms = self.reproject(
+            np.array(
+                [feature_geometry(feature) for feature in feature_batch], dtype=object
             )
+        )
+        self.schema.observe(feature_batch)
+        self.write_batch(feature_batch, geoms)
+        self.report_progress()
+
+    def reproject(self, geoms):
+        """Transforms an array of geometries from the file's CRS to EPSG:4326."""
+        source_crs = self.reader.source_crs
+        if needs_transform(source_crs):
+            geoms = transform_geoms(get_transformer(source_crs), geoms)
+        return geoms
+
+    def write_batch(self, feature_batch, geoms):
+        """Writes a batch and moves the checkpoint past it, in one transaction."""
+        with transaction.atomic():
+            self.loader.write_batch(feature_batch, geoms)
+            self.checkpoint.offset = self.reader.position
+            self.checkpoint.schema = self.schema.state()
+            self.checkpoint.save(update_fields=["offset", "schema", "updated_at"])
+
+    def finish_load(self, layer):
+        """Moves the loaded features into place and marks the load finished."""
+        with transaction.atomic():
+            self.loader.finish()
+            if self.track_properties:
+                self.schema.save(layer.id)
+            self.checkpoint.finished = True
+            self.checkpoint.save(update_fields=["finished", "updated_at"])
+
+    def report_progress(self):
+        """Writes the task progress to the cache.
+
+        For a chunk of a parallel ingest, the chunk's own progress, how far
+        the reader is through the chunk's range, is stored under its own key
+        and the parent task's progress is the mean over all chunks.
+        """
+        if self.chunk_index is None:
+            set_task_status(
+                self.task_id, {"status": "processing", "progress": self.reader.progress}
+            )
+            return
 
-            properties = [
-                LayerProperty(name=key, type="string", layer=layer)
-                for key in unique_properties
-            ]
-            LayerProperty.objects.bulk_create(properties)
-
-            # Update the number of processed features and calculate progress
-            processed_features += len(feature_batch)
-            progress = int((processed_features / total_features) * 100)
-
-            # Update cache with progress
-            cache.set(self.task_id, {"status": "processing", "progress": progress})
-
-        return layer.id
-
-    @staticmethod
-    def transform_geom(transformer, geom):
-        """Transforms the geometry to EPSG:4326."""
-
-        def transform_coords(coords):
-            if isinstance(coords[0], (list, tuple)):
-                return [transform_coords(c) for c in coords]
-            else:
-                return transformer.transform(coords[0], coords[1])
-
-        geom_type = geom["type"]
-        if geom_type == "Point":
-            x, y = transformer.transform(geom["coordinates"][0], geom["coordinates"][1])
-            return {"type": "Point", "coordinates": [x, y]}
-        elif geom_type == "LineString":
-            coords = [transformer.transform(x, y) for x, y in geom["coordinates"]]
-            return {"type": "LineString", "coordinates": coords}
-        elif geom_type == "Polygon":
-            coords = [transform_coords(ring) for ring in geom["coordinates"]]
-            return {"type": "Polygon", "coordinates": coords}
-        elif geom_type == "MultiPoint":
-            coords = [transformer.transform(x, y) for x, y in geom["coordinates"]]
-            return {"type": "MultiPoint", "coordinates": coords}
-        elif geom_type == "MultiLineString":
-            coords = [transform_coords(line) for line in geom["coordinates"]]
-            return {"type": "MultiLineString", "coordinates": coords}
-        elif geom_type == "MultiPolygon":
-            coords = [transform_coords(polygon) for polygon in geom["coordinates"]]
-            return {"type": "MultiPolygon", "coordinates": coords}
-        else:
-            raise ValueError(f"Unsupported geometry type: {geom_type}")
+        cache.set(
+            f"{self.task_id}:chunk:{self.chunk_index}",
+            int(
+                min((self.reader.position - self.chunk_start) / self.chunk_length, 1)
+                * 100
+            ),
+            timeout=None,
+        )
+        chunk_progress = cache.get_many(
+            [f"{self.task_id}:chunk:{index}" for index in range(self.chunk_count)]
+        )
+        progress = sum(chunk_progress.values()) // self.chunk_count
+        set_task_status(self.task_id, {"status": "processing", "progress": progress})
+
+
+def feature_geometry(feature):
+    """Returns a feature's geometry as a shapely geometry."""
+    geometry = feature["geometry"]
+    if isinstance(geometry, BaseGeometry):
+        return geometry
+    return shape(geometry)
+
+
+def abandon_ingest(task_id) -> None:
+    """Deletes the layer a failed ingest task was loading into."""
+    delete_layers(Layer.objects.filter(ingest_checkpoints__task_id=task_id))
+
+
+def should_retry(task, error):
+    """Returns whether autoretry_for will retry a task for an error."""
+    return (
+        isinstance(error, RETRYABLE_ERRORS) and task.request.retries < task.max_retries
+    )
+
+
+def create_property_schema(layer_id, schema_states) -> None:
+    """Creates LayerProperty rows from the schemas inferred by each chunk."""
+    schema = SchemaInferrer()
+    for state in schema_states:
+        schema.merge(state)
+    schema.save(layer_id)
+
+
+def index_properties(layer_id, names) -> None:
+    """Marks the named properties as indexed and builds their indexes."""
+    properties = LayerProperty.objects.filter(layer_id=layer_id, name__in=names)
+    for prop in properties:
+        prop.indexed = True
+        prop.save(update_fields=["indexed"])
+        create_property_index(prop)
+
+
+def finish_layer(layer_id, indexed_properties=None) -> None:
+    """Prepares a freshly loaded layer for reads.
+
+    Builds the requested property indexes and the feature view, refreshes
+    statistics and stats and invalidates the layer's cached tiles. The
+    simplified levels are built afterwards by ``build_feature_levels_task``.
+    """
+    if indexed_properties:
+        index_properties(layer_id, indexed_properties)
+    create_feature_view(layer_id)
+    analyze_features(layer_id)
+    refresh_layer_stats(layer_id)
+    invalidate_layer_tiles(layer_id)
 
 
 def create_feature_view(layer_id) -> None:
@@ -222,19 +377,41 @@ def create_feature_view(layer_id) -> None:
             f"""
             CREATE OR REPLACE VIEW {view_name} AS
             SELECT f.id, f.geometry, l.name AS layer_name
-            FROM gis_layerfeature f
+            FROM {partition_name(layer_id)} f
             JOIN gis_layer l ON f.layer_id = l.id
-            WHERE f.layer_id = %s
-        """,
-            [layer_id],
+        """
         )
     close_old_connections()
 
 
-@shared_task(bind=True)
-def ingest_file_to_db_task(self, file_name, layer_name, directory, user_email):
-    """Task to ingest a file into the specified database table."""
-    cache.set(self.request.id, {"status": "processing", "progress": 0})
+@shared_task(**INGEST_TASK_OPTIONS)
+def ingest_file_to_db_task(
+    self,
+    file_name,
+    layer_name,
+    directory,
+    user_email,
+    user_id,
+    loader="copy",
+    indexed_properties=None,
+):
+    """Task to ingest a file into the specified database table.
+
+    ``loader`` selects how features are written: ``"copy"`` streams them
+    with PostgreSQL COPY, ``"orm"`` falls back to ``bulk_create``.
+    ``indexed_properties`` names properties to index once the load is done.
+
+    Connection errors are retried, resuming from the last committed batch.
+    Any other error, or running out of retries, deletes the layer. A user
+    runs at most ``USER_INGEST_CONCURRENCY`` ingests at once, and further
+    ones wait in the queue.
+    """
+    set_task_status(self.request.id, {"status": "processing", "progress": 0})
+    if not acquire_slot(
+        "ingest", user_id, self.request.id, settings.USER_INGEST_CONCURRENCY
+    ):
+        defer_task(self)
+        return
 
     try:
         # Initialize the file ingestor
@@ -244,14 +421,16 @@ def ingest_file_to_db_task(self, file_name, layer_name, directory, user_email):
             directory,
             user_email,
             task_id=self.request.id,
+            loader=loader,
         )
 
         # Process the file and get the layer ID
         layer_id = ingestor.ingest_file_to_db()
-        create_feature_view(layer_id)
+        finish_layer(layer_id, indexed_properties)
+        IngestCheckpoint.objects.filter(task_id=self.request.id).delete()
 
         # Set the task progress to 100% and mark it as completed
-        cache.set(
+        set_task_status(
             self.request.id,
             {
                 "status": "completed",
@@ -259,11 +438,507 @@ def ingest_file_to_db_task(self, file_name, layer_name, directory, user_email):
                 "progress": 100,
             },
         )
+        build_feature_levels_task.delay(layer_id)
+        return layer_id
 
     except Exception as e:
+        if should_retry(self, e):
+            raise
         # Handle errors by marking the task as failed
-        cache.set(self.request.id, {"status": "error", "error": str(e)})
+        abandon_ingest(self.request.id)
+        set_task_status(self.request.id, {"status": "error", "error": str(e)})
+    finally:
+        release_slot("ingest", user_id, self.request.id)
+        close_old_connections()
+
+
+def claim_finalization(parent_task_id):
+    """Returns True for the one caller allowed to finalize a parent task.
+
+    ``cache.add`` only sets a missing key, atomically, so however many of
+    the chunks try to finalize, the finalizer is only queued once.
+    """
+    return cache.add(
+        f"{parent_task_id}:finalizing", True, timeout=FINALIZE_CLAIM_TIMEOUT
+    )
+
+
+@shared_task(bind=True)
+def ingest_file_in_chunks_task(
+    self,
+    file_name,
+    layer_name,
+    directory,
+    user_email,
+    user_id,
+    loader="copy",
+    indexed_properties=None,
+    chunk_size=100_000,
+):
+    """Task to ingest a large file in parallel chunks.
+
+    The reader splits the file into ranges of about ``chunk_size``
+    features, the layer is created, and one ``ingest_chunk_task`` per range
+    is dispatched as a group. Only ``splittable`` formats can be ingested
+    this way, since each chunk must read its range without reading the
+    file before it. The last chunk to finish runs
+    ``finalize_chunked_ingest_task``.
+    Progress for the whole file is reported under this task's id, and the
+    user's ingest slot is held until the finalizer runs.
+    """
+    set_task_status(self.request.id, {"status": "processing", "progress": 0})
+    if not acquire_slot(
+        "ingest", user_id, self.request.id, settings.USER_INGEST_CONCURRENCY
+    ):
+        defer_task(self)
+        return
+
+    try:
+        ingestor = FileIngestor(
+            f"gs://spatiallab/{file_name}",
+            layer_name,
+            directory,
+            user_email,
+            task_id=self.request.id,
+            loader=loader,
+        )
+        with ingestor.open_reader() as reader:
+            chunks = reader.split(chunk_size)
+        # The checkpoint marks the layer as ingesting until the finalizer
+        # deletes it with the chunks' checkpoints
+        layer = ingestor.get_checkpoint().layer
+        create_layer_partition(layer.id)
+
+        cache.set(f"{self.request.id}:chunks", len(chunks), timeout=None)
+        group(
+            ingest_chunk_task.s(
+                file_name,
+                layer.id,
+                directory,
+                user_id,
+                self.request.id,
+                index,
+                len(chunks),
+                start,
+                stop,
+                loader,
+                indexed_properties,
+            )
+            for index, (start, stop) in enumerate(chunks)
+        ).apply_async()
+
+    except Exception as e:
+        release_slot("ingest", user_id, self.request.id)
+        set_task_status(self.request.id, {"status": "error", "error": str(e)})
     finally:
         close_old_connections()
 
-    return layer_id
+
+@shared_task(**INGEST_TASK_OPTIONS)
+def ingest_chunk_task(
+    self,
+    file_name,
+    layer_id,
+    directory,
+    user_id,
+    parent_task_id,
+    chunk_index,
+    chunk_count,
+    start,
+    stop,
+    loader="copy",
+    indexed_properties=None,
+):
+    """Task to load one range of features into a layer being ingested.
+
+    Like ``ingest_file_to_db_task``, a retried chunk resumes from its last
+    committed batch. The chunk only counts as done once it has loaded or
+    failed for good.
+    """
+    try:
+        ingestor = FileIngestor(
+            f"gs://spatiallab/{file_name}",
+            None,
+            directory,
+            None,
+            task_id=parent_task_id,
+            loader=loader,
+            checkpoint_id=self.request.id,
+        )
+        ingestor.ingest_chunk(layer_id, chunk_index, chunk_count, start, stop)
+    except Exception as e:
+        if should_retry(self, e):
+            close_old_connections()
+            raise
+        logger.exception(f"Chunk {chunk_index} of layer {layer_id} failed")
+        cache.set(f"{parent_task_id}:error", str(e), timeout=None)
+    close_old_connections()
+
+    try:
+        remaining = cache.decr(f"{parent_task_id}:chunks")
+    except Exception:
+        # Without the counter no chunk can tell it is the last, so the
+        # ingest is failed rather than left running forever
+        logger.exception(f"Lost the chunk count of ingest {parent_task_id}")
+        if claim_finalization(parent_task_id):
+            finalize_chunked_ingest_task.delay(
+                parent_task_id,
+                layer_id,
+                directory,
+                user_id,
+                chunk_count,
+                indexed_properties,
+                error="The ingest lost track of its chunks.",
+            )
+        return
+
+    if remaining == 0 and claim_finalization(parent_task_id):
+        finalize_chunked_ingest_task.delay(
+            parent_task_id,
+            layer_id,
+            directory,
+            user_id,
+            chunk_count,
+            indexed_properties,
+        )
+
+
+@shared_task
+def finalize_chunked_ingest_task(
+    parent_task_id,
+    layer_id,
+    directory,
+    user_id,
+    chunk_count,
+    indexed_properties=None,
+    error=None,
+):
+    """Task to finish a parallel ingest once every chunk has run.
+
+    Creates the property schema, property indexes and the feature view, or
+    removes the layer if any chunk failed or ``error`` is given.
+    """
+    error = error or cache.get(f"{parent_task_id}:error")
+    try:
+        if error is not None:
+            delete_layers(Layer.objects.filter(id=layer_id))
+            set_task_status(parent_task_id, {"status": "error", "error": error})
+            return
+
+        schema_keys = [
+            f"{parent_task_id}:schema:{index}" for index in range(chunk_count)
+        ]
+        create_property_schema(layer_id, cache.get_many(schema_keys).values())
+        finish_layer(layer_id, indexed_properties)
+        IngestCheckpoint.objects.filter(layer_id=layer_id).delete()
+        set_task_status(
+            parent_task_id,
+            {
+                "status": "completed",
+                "data": {"layer_id": layer_id, "directory_id": directory},
+                "progress": 100,
+            },
+        )
+        build_feature_levels_task.delay(layer_id)
+    finally:
+        cache.delete_many(
+            [f"{parent_task_id}:chunks", f"{parent_task_id}:error"]
+            + [f"{parent_task_id}:chunk:{index}" for index in range(chunk_count)]
+            + [f"{parent_task_id}:schema:{index}" for index in range(chunk_count)]
+        )
+        release_slot("ingest", user_id, parent_task_id)
+        close_old_connections()
+
+
+@shared_task
+def build_feature_levels_task(layer_id):
+    """Task to build a layer's simplified levels once its ingest is done.
+
+    Runs on the maintenance queue, so a large layer's levels do not hold up
+    its ingest or other users' ingests. Tiles are read at full resolution
+    until the levels are built.
+    """
+    try:
+        if build_feature_levels(layer_id):
+            invalidate_layer_tiles(layer_id)
+    finally:
+        close_old_connections()
+
+
+@shared_task
+def update_property_index_task(property_id):
+    """Task to create or drop a property's indexes to match ``indexed``."""
+    try:
+        prop = LayerProperty.objects.get(id=property_id)
+        if prop.indexed:
+            create_property_index(prop)
+        else:
+            drop_property_index(prop)
+    finally:
+        close_old_connections()
+
+
+@shared_task
+def optimize_features_task(cluster=False):
+    """Task to refresh feature table statistics, optionally clustering first.
+
+    Meant to be scheduled off-peak with django-celery-beat, since CLUSTER
+    locks the table.
+    """
+    try:
+        if cluster:
+            cluster_features()
+        analyze_features()
+    finally:
+        close_old_connections()
+
+
+@shared_task(bind=True, **LONG_TASK_OPTIONS)
+def export_layer_task(self, layer_id, format, user_id):
+    """Task to export a layer to a file and upload it for download.
+
+    The file is written to a temporary directory, uploaded to the bucket
+    under ``exports/``, and a signed download URL is returned in the task
+    status. A user runs at most ``USER_EXPORT_CONCURRENCY`` exports at once.
+    """
+    set_task_status(self.request.id, {"status": "processing", "progress": 0})
+    if not acquire_slot(
+        "export", user_id, self.request.id, settings.USER_EXPORT_CONCURRENCY
+    ):
+        defer_task(self)
+        return
+
+    try:
+        layer = Layer.objects.get(id=layer_id)
+        stats = get_layer_stats(layer)
+
+        def report_progress(written):
+            progress = int(95 * written / max(stats.feature_count, 1))
+            set_task_status(
+                self.request.id, {"status": "processing", "progress": progress}
+            )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = export_layer(layer, stats, format, directory, report_progress)
+            file_name = os.path.basename(path)
+            client = get_storage_client()
+            blob = client.bucket(settings.GCS_BUCKET_NAME).blob(
+                f"exports/{self.request.id}/{file_name}"
+            )
+            blob.upload_from_filename(path)
+
+        url = blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(minutes=settings.EXPORT_URL_EXPIRATION_MINUTES),
+            method="GET",
+            response_disposition=f'attachment; filename="{file_name}"',
+        )
+        set_task_status(
+            self.request.id,
+            {
+                "status": "completed",
+                "data": {"layer_id": layer_id, "file_name": file_name, "url": url},
+                "progress": 100,
+            },
+        )
+    except Exception as e:
+        logger.exception(f"Export of layer {layer_id} to {format} failed")
+        set_task_status(self.request.id, {"status": "error", "error": str(e)})
+    finally:
+        release_slot("export", user_id, self.request.id)
+        close_old_connections()
+
+
+def tile_shard_path(parent_task_id, chunk_index):
+    return os.path.join(
+        settings.TILE_ARCHIVE_DIR, f"{parent_task_id}.{chunk_index}.mbtiles"
+    )
+
+
+@shared_task(bind=True)
+def seed_tiles_task(self, layer_id, min_zoom=0, max_zoom=None):
+    """Task to pre-render a layer's tiles into an MBTiles archive.
+
+    The tiles touched by a feature bounding box are counted in PostGIS and
+    split into bands of columns, which are rendered in parallel by
+    ``seed_tile_chunk_task``, each into its own archive shard. The last
+    chunk to finish runs ``finalize_tile_seed_task``, which merges the
+    shards into the archive the tile endpoint reads.
+    """
+    set_task_status(self.request.id, {"status": "processing", "progress": 0})
+    if max_zoom is None:
+        max_zoom = settings.TILE_SEED_MAX_ZOOM
+
+    try:
+        layer = Layer.objects.get(id=layer_id)
+        bands = covering_bands(
+            layer_id, range(min_zoom, max_zoom + 1), settings.TILE_SEED_CHUNK_SIZE
+        )
+        logger.info(f"Seeding layer {layer_id} in {len(bands)} chunks")
+
+        os.makedirs(settings.TILE_ARCHIVE_DIR, exist_ok=True)
+        if not bands:
+            finalize_tile_seed_task.delay(
+                self.request.id, layer_id, tile_version(layer), 0, min_zoom, max_zoom
+            )
+            return
+
+        cache.set(f"{self.request.id}:chunks", len(bands), timeout=None)
+        cache.set(f"{self.request.id}:done", 0, timeout=None)
+        group(
+            seed_tile_chunk_task.s(
+                self.request.id,
+                layer_id,
+                tile_version(layer),
+                layer.generalized,
+                index,
+                len(bands),
+                band,
+                min_zoom,
+                max_zoom,
+            )
+            for index, band in enumerate(bands)
+        ).apply_async()
+
+    except Exception as e:
+        set_task_status(self.request.id, {"status": "error", "error": str(e)})
+    finally:
+        close_old_connections()
+
+
+@shared_task(**LONG_TASK_OPTIONS)
+def seed_tile_chunk_task(
+    parent_task_id,
+    layer_id,
+    version,
+    generalized,
+    chunk_index,
+    chunk_count,
+    band,
+    min_zoom,
+    max_zoom,
+):
+    """Task to render one band of a layer's tiles into an archive shard.
+
+    ``band`` is a ``(z, x_start, x_stop)`` range of columns, whose covered
+    tiles are read from PostGIS as they are rendered.
+    """
+    remaining = None
+    try:
+        with MBTiles(tile_shard_path(parent_task_id, chunk_index), "w") as shard:
+            for z, x, y in covered_tiles(layer_id, *band):
+                tile = render_tile(layer_id, z, x, y, generalized)
+                # A bounding box can touch a tile the geometry misses
+                if tile:
+                    shard.put_tile(z, x, y, tile)
+        done = cache.incr(f"{parent_task_id}:done")
+        set_task_status(
+            parent_task_id,
+            {"status": "processing", "progress": int(99 * done / chunk_count)},
+        )
+    except Exception as e:
+        logger.exception(f"Tile chunk {chunk_index} of layer {layer_id} failed")
+        cache.set(f"{parent_task_id}:error", str(e), timeout=None)
+    finally:
+        close_old_connections()
+        try:
+            remaining = cache.decr(f"{parent_task_id}:chunks")
+        except Exception:
+            # Without the counter no chunk can tell it is the last, so the
+            # seed is failed rather than left running forever
+            logger.exception(f"Lost the chunk count of tile seed {parent_task_id}")
+            if claim_finalization(parent_task_id):
+                finalize_tile_seed_task.delay(
+                    parent_task_id,
+                    layer_id,
+                    version,
+                    chunk_count,
+                    min_zoom,
+                    max_zoom,
+                    error="The tile seed lost track of its chunks.",
+                )
+
+    if remaining == 0 and claim_finalization(parent_task_id):
+        finalize_tile_seed_task.delay(
+            parent_task_id, layer_id, version, chunk_count, min_zoom, max_zoom
+        )
+
+
+@shared_task
+def finalize_tile_seed_task(
+    parent_task_id, layer_id, version, chunk_count, min_zoom, max_zoom, error=None
+):
+    """Task to merge the shards of a tile seed into the layer's archive.
+
+    The archive is written next to the current one and moved into place, so
+    the tile endpoint never reads a partial archive. ``error`` fails the
+    seed, like a chunk's error does.
+    """
+    error = error or cache.get(f"{parent_task_id}:error")
+    shards = [tile_shard_path(parent_task_id, index) for index in range(chunk_count)]
+    try:
+        if error is not None:
+            set_task_status(parent_task_id, {"status": "error", "error": error})
+            return
+
+        layer = Layer.objects.get(id=layer_id)
+        extent = get_layer_stats(layer).extent
+        path = archive_path(layer_id)
+        with MBTiles(f"{path}.{parent_task_id}", "w") as archive:
+            archive.write_metadata(
+                {
+                    "name": layer.name,
+                    "format": "pbf",
+                    "minzoom": min_zoom,
+                    "maxzoom": max_zoom,
+                    "bounds": ",".join(str(value) for value in extent or ()),
+                    "version": version,
+                    "json": json.dumps(
+                        {
+                            "vector_layers": [
+                                {
+                                    "id": "features",
+                                    "fields": {"id": "Number"},
+                                    "minzoom": min_zoom,
+                                    "maxzoom": max_zoom,
+                                }
+                            ]
+                        }
+                    ),
+                }
+            )
+            for shard in shards:
+                archive.merge(shard)
+        os.replace(f"{path}.{parent_task_id}", path)
+        set_task_status(
+            parent_task_id,
+            {"status": "completed", "data": {"layer_id": layer_id}, "progress": 100},
+        )
+    except Exception as e:
+        set_task_status(parent_task_id, {"status": "error", "error": str(e)})
+    finally:
+        for shard in shards:
+            if os.path.exists(shard):
+                os.remove(shard)
+        cache.delete_many(
+            [
+                f"{parent_task_id}:chunks",
+                f"{parent_task_id}:done",
+                f"{parent_task_id}:error",
+            ]
+        )
+        close_old_connections()
+
+
+@shared_task
+def seed_project_tiles_task(project_id, min_zoom=0, max_zoom=None):
+    """Task to seed the tiles of every layer in a project."""
+    try:
+        # Basemap rows have no layer
+        layer_ids = ProjectLayer.objects.filter(
+            project_id=project_id, layer__isnull=False
+        ).values_list("layer_id", flat=True)
+        for layer_id in set(layer_ids):
+            seed_tiles_task.delay(layer_id, min_zoom, max_zoom)
+    finally:
+        close_old_connections()
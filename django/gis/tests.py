@@ -1,3 +1,1588 @@
-from django.test import TestCase
+import csv
+import io
+import datetime
+import gzip
+import json
+import tempfile
+import zipfile
+from contextlib import nullcontext
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import fiona
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from django.contrib.gis.geos import GEOSGeometry, Point
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from gis.directories import build_directory_tree, get_directory_tree
+from gis.events import event_stream, task_events
+from gis.exports import (
+    EXPORT_FETCH_SIZE,
+    export_layer,
+    export_value,
+    get_exporter,
+    gzip_stream,
+    iter_geojson,
+)
+from gis.generalize import LEVEL_MAX_ZOOMS, level_for_zoom
+from gis.limits import acquire_slot, defer_task, release_slot
+from gis.loaders import CopyLoader, staging_table_name
+from gis.mbtiles import MBTiles
+from gis.models import (
+    Directory,
+    IngestCheckpoint,
+    Layer,
+    LayerFeature,
+    LayerProperty,
+    LayerStats,
+)
+from gis.pagination import after, decode_cursor, encode_cursor
+from gis.partitions import create_layer_partition, partition_exists
+from gis.progress import (
+    last_published,
+    owner_key,
+    set_task_status,
+    should_publish,
+    start_task,
+)
+from gis.readers import (
+    CSVReader,
+    FlatGeobufReader,
+    GeoJSONReader,
+    GeoPackageReader,
+    GeoParquetReader,
+    KMLReader,
+    NDJSONReader,
+    ShapefileReader,
+    get_reader,
+)
+from gis.schema import (
+    CATEGORY_MAX_VALUES,
+    SchemaInferrer,
+    filter_features,
+    property_index_sql,
+)
+from gis.reproject import get_transformer, needs_transform, transform_geoms
+from gis.stats import (
+    clamp_extent,
+    compute_layer_stats,
+    get_layer_stats,
+    mercator_extent,
+)
+from gis.tasks import (
+    FileIngestor,
+    export_layer_task,
+    finalize_tile_seed_task,
+    ingest_chunk_task,
+    seed_tile_chunk_task,
+    tile_shard_path,
+)
+from gis.tiles import (
+    MAX_LATITUDE,
+    archive_path,
+    column_tile_counts,
+    covered_tiles,
+    get_tile,
+    invalidate_layer_tiles,
+    read_archived_tile,
+    tile_bands,
+    tile_columns,
+    tile_etag,
+    tile_rows,
+    tile_version,
+)
+from gis.versions import version_key, versioned_response
+
+# Tests get their own cache rather than the shared Redis
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+def create_point_layer(user, count, name="points"):
+    """Creates a layer of ``count`` points numbered by their ``n`` property."""
+    layer = Layer.objects.create(name=name, user=user)
+    create_layer_partition(layer.id)
+    LayerFeature.objects.bulk_create(
+        LayerFeature(layer=layer, geometry=Point(n, n, srid=4326), properties={"n": n})
+        for n in range(count)
+    )
+    LayerProperty.objects.create(layer=layer, name="n", type="integer")
+    return layer
+
+
+def point_feature(n, geometry=True):
+    """Returns a GeoJSON feature numbered ``n``, with a null geometry unless
+    ``geometry``."""
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [n, n]} if geometry else None,
+        "properties": {"n": n},
+    }
+
+
+def ndjson(features):
+    return b"".join(json.dumps(feature).encode() + b"\n" for feature in features)
+
+
+def numbers(features):
+    return [feature["properties"]["n"] for feature in features]
+
+
+# Features 0 to 6, where feature 3 has no geometry
+FEATURES = [point_feature(n, geometry=n != 3) for n in range(7)]
+LOADED = [0, 1, 2, 4, 5, 6]
+
+
+def point_geoms(features):
+    return shapely.points([feature["geometry"]["coordinates"] for feature in features])
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip_keeps_a_null_sort_value(self):
+        position = {"id": 7, "sort": "name", "prev": False, "value": None}
+        self.assertEqual(decode_cursor(encode_cursor(position)), position)
+
+    def test_round_trip_without_sort(self):
+        position = {"id": 7, "sort": None, "prev": True}
+        self.assertEqual(decode_cursor(encode_cursor(position)), position)
+
+    def test_rejects_invalid_cursors(self):
+        for cursor in ["not a cursor", encode_cursor([1]), encode_cursor({"id": "1"})]:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_after_a_null_value_ascending_stays_in_the_nulls(self):
+        self.assertEqual(
+            after({"id": 7, "value": None}, descending=False),
+            Q(sort_key__isnull=True, id__gt=7),
+        )
+
+    def test_after_a_null_value_descending_moves_on_to_values(self):
+        self.assertEqual(
+            after({"id": 7, "value": None}, descending=True),
+            Q(sort_key__isnull=True, id__lt=7) | Q(sort_key__isnull=False),
+        )
+
+    def test_after_a_value_ascending_reaches_the_nulls(self):
+        self.assertEqual(
+            after({"id": 7, "value": "b"}, descending=False),
+            Q(sort_key__gt="b") | Q(sort_key="b", id__gt=7) | Q(sort_key__isnull=True),
+        )
+
+    def test_after_without_sort_seeks_on_id(self):
+        self.assertEqual(after({"id": 7}, descending=False), Q(id__gt=7))
+        self.assertEqual(after({"id": 7}, descending=True), Q(id__lt=7))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LayerDetailCursorTests(APITestCase):
+    """The feature table of LayerDetailView pages by cursor."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("pages@example.com")
+        self.client.force_authenticate(self.user)
+        self.layer = create_point_layer(self.user, 5)
+
+    def get(self, **params):
+        return self.client.get(reverse("layer-detail", args=[self.layer.id]), params)
+
+    def read_pages(self, **params):
+        """Follows ``next`` from the first page, returning the ``n`` values."""
+        values = []
+        cursor = ""
+        while cursor is not None:
+            response = self.get(cursor=cursor, page_size=2, **params)
+            self.assertEqual(response.status_code, 200)
+            values.extend(row["n"] for row in response.data["data"])
+            cursor = response.data["next"]
+        return values
+
+    def test_pages_cover_every_feature_once(self):
+        self.assertEqual(self.read_pages(), [0, 1, 2, 3, 4])
+
+    def test_pages_follow_a_property_sort(self):
+        self.assertEqual(self.read_pages(sort="-n"), [4, 3, 2, 1, 0])
+
+    def test_prev_returns_the_previous_page(self):
+        first = self.get(cursor="", page_size=2)
+        second = self.get(cursor=first.data["next"], page_size=2)
+        previous = self.get(cursor=second.data["prev"], page_size=2)
+        self.assertEqual(previous.data["data"], first.data["data"])
+        self.assertIsNone(first.data["prev"])
+
+    def test_rejects_an_invalid_cursor(self):
+        self.assertEqual(self.get(cursor="not a cursor").status_code, 400)
+
+    def test_rejects_a_cursor_for_another_sort(self):
+        first = self.get(cursor="", page_size=2, sort="n")
+        response = self.get(cursor=first.data["next"], page_size=2)
+        self.assertEqual(response.status_code, 400)
+
+    def test_hides_other_users_layers(self):
+        other = User.objects.create_user("other@example.com")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.get(cursor="").status_code, 404)
+
+
+class GeoJSONReaderTests(SimpleTestCase):
+    def reader(self, collection=None):
+        collection = collection or {"type": "FeatureCollection", "features": FEATURES}
+        return GeoJSONReader(io.BytesIO(json.dumps(collection).encode()))
+
+    def test_skips_null_geometries(self):
+        self.assertEqual(numbers(self.reader().features()), LOADED)
+
+    def test_reads_a_range_of_records(self):
+        reader = self.reader()
+        self.assertEqual(numbers(reader.features(2, 5)), [2, 4])
+        self.assertEqual(reader.position, 5)
+
+    def test_position_counts_skipped_records(self):
+        reader = self.reader()
+        features = reader.features()
+        for _ in range(3):
+            next(features)
+        self.assertEqual(reader.position, 3)
+        # Resuming at the position skips the null geometry and carries on
+        self.assertEqual(numbers(self.reader().features(reader.position)), [4, 5, 6])
+
+    def test_reads_a_leading_crs(self):
+        reader = self.reader(
+            {
+                "type": "FeatureCollection",
+                "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+                "features": FEATURES,
+            }
+        )
+        self.assertEqual(numbers(reader.features()), LOADED)
+        self.assertEqual(reader.source_crs, "EPSG:3857")
+
+    def test_rejects_a_crs_after_the_features(self):
+        reader = self.reader(
+            {
+                "type": "FeatureCollection",
+                "features": FEATURES,
+                "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+            }
+        )
+        with self.assertRaises(ValueError):
+            list(reader.features())
+
+
+class NDJSONReaderTests(SimpleTestCase):
+    def reader(self):
+        return NDJSONReader(io.BytesIO(ndjson(FEATURES)))
+
+    def test_skips_null_geometries(self):
+        self.assertEqual(numbers(self.reader().features()), LOADED)
+
+    def test_split_ranges_cover_every_feature_once(self):
+        reader = self.reader()
+        reader.sample_lines = 2
+        ranges = reader.split(2)
+        self.assertGreater(len(ranges), 1)
+        loaded = []
+        for start, stop in ranges:
+            loaded.extend(numbers(self.reader().features(start, stop)))
+        self.assertEqual(loaded, LOADED)
+
+    def test_resumes_at_a_byte_offset(self):
+        reader = self.reader()
+        features = reader.features()
+        next(features)
+        next(features)
+        self.assertEqual(numbers(self.reader().features(reader.position)), LOADED[2:])
+
+
+class CSVReaderTests(SimpleTestCase):
+    def reader(self):
+        rows = ["name,wkt"] + [
+            f"{n},POINT ({n} {n})" if n != 3 else f"{n}," for n in range(7)
+        ]
+        return CSVReader(io.BytesIO("\n".join(rows).encode()))
+
+    def test_skips_rows_without_geometry(self):
+        features = list(self.reader().features())
+        self.assertEqual([int(f["properties"]["name"]) for f in features], LOADED)
+
+    def test_reads_a_range_of_rows(self):
+        features = list(self.reader().features(2, 5))
+        self.assertEqual([int(f["properties"]["name"]) for f in features], [2, 4])
+
+
+class GeoPackageReaderTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / "layers.gpkg")
+        schema = {"geometry": "Point", "properties": {"n": "int"}}
+        # Two layers, of features 0 to 3 and 4 to 6
+        for name, features in [("first", FEATURES[:4]), ("second", FEATURES[4:])]:
+            with fiona.open(
+                self.path,
+                "w",
+                driver="GPKG",
+                layer=name,
+                schema=schema,
+                crs="EPSG:4326",
+            ) as collection:
+                collection.writerecords(
+                    fiona.Feature.from_dict(feature) for feature in features
+                )
+
+    def reader(self):
+        return GeoPackageReader(None, self.path)
+
+    def test_skips_null_geometries(self):
+        with self.reader() as reader:
+            features = list(reader.features())
+        self.assertEqual(numbers(features), LOADED)
+        self.assertEqual(features[-1]["properties"]["source_layer"], "second")
+
+    def test_reads_a_range_across_layers(self):
+        with self.reader() as reader:
+            self.assertEqual(numbers(reader.features(2, 6)), [2, 4, 5])
+            self.assertEqual(reader.position, 6)
+
+    def test_split_ranges_cover_every_feature_once(self):
+        with self.reader() as reader:
+            ranges = reader.split(3)
+            loaded = [
+                n
+                for start, stop in ranges
+                for n in numbers(reader.features(start, stop))
+            ]
+        self.assertEqual(ranges, [(0, 3), (3, 6), (6, 7)])
+        self.assertEqual(loaded, LOADED)
+
+
+class GeoParquetReaderTests(SimpleTestCase):
+    def reader(self, row_group_size=2):
+        geometries = [
+            shapely.to_wkb(shapely.geometry.shape(f["geometry"]))
+            if f["geometry"]
+            else None
+            for f in FEATURES
+        ]
+        table = pa.table({"n": list(range(7)), "geometry": geometries})
+        geo = {
+            "version": "1.0.0",
+            "primary_column": "geometry",
+            "columns": {"geometry": {"encoding": "WKB", "geometry_types": []}},
+        }
+        table = table.replace_schema_metadata({"geo": json.dumps(geo)})
+        file_obj = io.BytesIO()
+        pq.write_table(table, file_obj, row_group_size=row_group_size)
+        file_obj.seek(0)
+        return GeoParquetReader(file_obj)
+
+    def test_skips_null_geometries(self):
+        self.assertEqual(numbers(self.reader().features()), LOADED)
+
+    def test_reads_a_range_within_row_groups(self):
+        reader = self.reader()
+        self.assertEqual(numbers(reader.features(1, 5)), [1, 2, 4])
+        self.assertEqual(reader.position, 5)
+
+    def test_splits_at_row_group_boundaries(self):
+        reader = self.reader()
+        ranges = reader.split(3)
+        self.assertEqual(ranges, [(0, 4), (4, 7)])
+        loaded = [
+            n for start, stop in ranges for n in numbers(reader.features(start, stop))
+        ]
+        self.assertEqual(loaded, LOADED)
+
+    def test_rejects_parquet_without_geo_metadata(self):
+        file_obj = io.BytesIO()
+        pq.write_table(pa.table({"n": [1]}), file_obj)
+        file_obj.seek(0)
+        with self.assertRaises(ValueError):
+            GeoParquetReader(file_obj)
+
+
+class ReaderRegistryTests(SimpleTestCase):
+    def test_picks_the_reader_by_extension(self):
+        for file_name, reader in [
+            ("points.geojson", GeoJSONReader),
+            ("points.JSON", GeoJSONReader),
+            ("points.ndjson", NDJSONReader),
+            ("points.csv", CSVReader),
+            ("points.gpkg", GeoPackageReader),
+            ("points.fgb", FlatGeobufReader),
+            ("points.kml", KMLReader),
+            ("points.zip", ShapefileReader),
+            ("uploads/points.parquet", GeoParquetReader),
+        ]:
+            with self.subTest(file_name=file_name):
+                self.assertIs(get_reader(file_name), reader)
+
+    def test_rejects_unknown_extensions(self):
+        with self.assertRaises(ValueError):
+            get_reader("points.xlsx")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch("gis.tasks.close_old_connections")
+@mock.patch("gis.tasks.FileIngestor")
+@mock.patch("gis.tasks.finalize_chunked_ingest_task")
+class ChunkedIngestFinalizationTests(SimpleTestCase):
+    """A chunked ingest is finalized once, by its last chunk."""
+
+    def setUp(self):
+        cache.clear()
+
+    def run_chunks(self, indexes, count=3):
+        for index in indexes:
+            ingest_chunk_task("points.ndjson", 1, None, 7, "parent", index, count, 0, 1)
+
+    def test_the_last_chunk_finalizes(self, finalize, *mocks):
+        cache.set("parent:chunks", 3)
+        self.run_chunks([0, 1])
+        finalize.delay.assert_not_called()
+        self.run_chunks([2])
+        finalize.delay.assert_called_once_with("parent", 1, None, 7, 3, None)
+
+    def test_finalizes_once_when_the_chunk_count_is_lost(self, finalize, *mocks):
+        with self.assertLogs("gis.tasks", "ERROR"):
+            self.run_chunks([0, 1, 2])
+        finalize.delay.assert_called_once()
+        self.assertIn("error", finalize.delay.call_args.kwargs)
+
+
+class CopyLoaderEncodingTests(SimpleTestCase):
+    @mock.patch("gis.loaders.partition_exists", return_value=True)
+    @mock.patch("gis.loaders.connection")
+    def test_copies_hex_wkb_and_json_rows(self, connection, partition_exists):
+        features = [point_feature(1), point_feature(2)]
+        loader = CopyLoader(Layer(id=5), chunk_index=1)
+        loader.write_batch(features, point_geoms(features))
+
+        cursor = connection.cursor.return_value.__enter__.return_value
+        sql, buffer = cursor.copy_expert.call_args.args
+        self.assertIn("COPY layer_5_staging_1 (geometry, properties)", sql)
+        rows = list(csv.reader(io.StringIO(buffer.getvalue())))
+        self.assertEqual(
+            [shapely.from_wkb(bytes.fromhex(row[0][2:])) for row in rows],
+            list(point_geoms(features)),
+        )
+        self.assertEqual([json.loads(row[1]) for row in rows], [{"n": 1}, {"n": 2}])
+
+    def test_staging_tables_are_per_chunk(self):
+        self.assertEqual(staging_table_name(5), "layer_5_staging")
+        self.assertEqual(staging_table_name(5, 2), "layer_5_staging_2")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CopyLoaderTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("copy@example.com")
+        self.layer = Layer.objects.create(name="points", user=user)
+        self.features = [feature for feature in FEATURES if feature["geometry"]]
+
+    def write(self, loader, features):
+        loader.write_batch(features, point_geoms(features))
+
+    def loaded(self):
+        return sorted(
+            LayerFeature.objects.filter(layer=self.layer).values_list(
+                "properties__n", flat=True
+            )
+        )
+
+    def staged(self, chunk_index=None):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT to_regclass(%s)",
+                [staging_table_name(self.layer.id, chunk_index)],
+            )
+            return cursor.fetchone()[0] is not None
+
+    def test_loads_a_new_layer_into_an_attached_partition(self):
+        loader = CopyLoader(self.layer)
+        self.assertTrue(loader.attach)
+        self.write(loader, self.features[:3])
+        self.write(loader, self.features[3:])
+        loader.finish()
+
+        self.assertTrue(partition_exists(self.layer.id))
+        self.assertEqual(self.loaded(), LOADED)
+        self.assertFalse(self.staged())
+
+    def test_loads_chunks_through_an_existing_partition(self):
+        create_layer_partition(self.layer.id)
+        loaders = [CopyLoader(self.layer, chunk_index) for chunk_index in range(2)]
+        self.assertFalse(any(loader.attach for loader in loaders))
+        self.write(loaders[0], self.features[:3])
+        self.write(loaders[1], self.features[3:])
+        for loader in loaders:
+            loader.finish()
+
+        self.assertEqual(self.loaded(), LOADED)
+        self.assertFalse(self.staged(0) or self.staged(1))
+
+    def test_a_retried_chunk_keeps_the_batches_already_staged(self):
+        create_layer_partition(self.layer.id)
+        self.write(CopyLoader(self.layer, 0), self.features[:3])
+        retried = CopyLoader(self.layer, 0)
+        self.write(retried, self.features[3:])
+        retried.finish()
+        self.assertEqual(self.loaded(), LOADED)
+
+
+class TransformGeomsTests(SimpleTestCase):
+    def test_matches_a_per_vertex_transform(self):
+        transformer = get_transformer("EPSG:3857")
+        geoms = np.array(
+            [
+                shapely.Point(1_000_000, 2_000_000),
+                shapely.LineString([(0, 0), (500_000, 500_000)]),
+                shapely.Polygon(
+                    [(0, 0), (4e5, 0), (4e5, 4e5), (0, 4e5)],
+                    holes=[[(1e5, 1e5), (2e5, 1e5), (2e5, 2e5)]],
+                ),
+                shapely.MultiPoint([(-1e6, -1e6), (1e6, 1e6)]),
+            ],
+            dtype=object,
+        )
+        transformed = transform_geoms(transformer, geoms)
+        for geom, result in zip(geoms, transformed):
+            with self.subTest(geom=geom.geom_type):
+                expected = shapely.transform(
+                    geom,
+                    lambda coords: np.array(
+                        [transformer.transform(x, y) for x, y in coords]
+                    ),
+                )
+                self.assertEqual(result.geom_type, geom.geom_type)
+                self.assertTrue(shapely.equals_exact(result, expected, 1e-9))
+
+    def test_keeps_null_geometries(self):
+        geoms = np.array([None, shapely.Point(0, 0)], dtype=object)
+        transformed = transform_geoms(get_transformer("EPSG:3857"), geoms)
+        self.assertIsNone(transformed[0])
+        self.assertTrue(shapely.equals_exact(transformed[1], shapely.Point(0, 0), 1e-9))
+
+    def test_skips_crs_equal_to_the_target(self):
+        self.assertFalse(needs_transform("EPSG:4326"))
+        self.assertFalse(needs_transform("OGC:CRS84"))
+        self.assertTrue(needs_transform("EPSG:3857"))
+
+
+class SchemaInferrerTests(SimpleTestCase):
+    def infer(self, *values, name="value"):
+        schema = SchemaInferrer()
+        schema.observe([{"properties": {name: value}} for value in values])
+        return schema.property_types()[name]
+
+    def test_infers_types_from_text(self):
+        self.assertEqual(self.infer("1", "-2"), "integer")
+        self.assertEqual(self.infer("1.5", "2e3"), "float")
+        self.assertEqual(self.infer("true", "False"), "boolean")
+        self.assertEqual(self.infer("2024-01-31"), "date")
+        self.assertEqual(self.infer("2024-01-31T10:00:00"), "datetime")
+        self.assertEqual(self.infer({"a": 1}), "json")
+
+    def test_widens_mixed_types(self):
+        self.assertEqual(self.infer(1, 2.5), "float")
+        self.assertEqual(self.infer("2024-01-31", "2024-01-31 10:00"), "datetime")
+        self.assertEqual(self.infer(1, "x1", "x2", "x3"), "string")
+
+    def test_ignores_empty_values(self):
+        self.assertEqual(self.infer(None, "", 3), "integer")
+        self.assertEqual(self.infer(None, ""), "string")
+
+    def test_repeated_strings_are_a_category(self):
+        self.assertEqual(self.infer("a", "b", "a", "b"), "category")
+        self.assertEqual(self.infer("a", "b", "c"), "string")
+
+    def test_too_many_distinct_strings_are_not_a_category(self):
+        values = [f"v{n}" for n in range(CATEGORY_MAX_VALUES + 1)]
+        self.assertEqual(self.infer(*values, *values), "string")
+
+    def test_merged_states_match_one_inferrer(self):
+        batches = [
+            [{"properties": {"a": 1, "b": "x"}}, {"properties": {"a": "2", "b": "x"}}],
+            [{"properties": {"a": 2.5, "b": "x"}}, {"properties": {"b": "y"}}],
+        ]
+        whole = SchemaInferrer()
+        merged = SchemaInferrer()
+        for batch in batches:
+            whole.observe(batch)
+            part = SchemaInferrer()
+            part.observe(batch)
+            merged.merge(json.loads(json.dumps(part.state())))
+        self.assertEqual(merged.property_types(), whole.property_types())
+        self.assertEqual(merged.property_types(), {"a": "float", "b": "category"})
+
+
+class FilterFeaturesSQLTests(SimpleTestCase):
+    properties = [
+        LayerProperty(name="n", type="integer"),
+        LayerProperty(name="name", type="string"),
+    ]
+
+    def sql(self, filters):
+        """Returns the WHERE clause of a filter, with its string parameters
+        quoted in, and its parameters."""
+        queryset = filter_features(LayerFeature.objects.all(), self.properties, filters)
+        sql, params = queryset.query.sql_with_params()
+        where = sql.split(" WHERE ", 1)[1].replace('"gis_layerfeature"."', '"')
+        quoted = tuple(f"'{p}'" if isinstance(p, str) else "%s" for p in params)
+        return where.replace('"properties"', "properties") % quoted, params
+
+    def test_filters_through_the_index_expression(self):
+        for prop in self.properties:
+            with self.subTest(type=prop.type):
+                where, _ = self.sql({prop.name: "5"})
+                index = property_index_sql(prop) % f"'{prop.name}'"
+                self.assertTrue(where.startswith(f"{index} = "))
+
+    def test_casts_numeric_values(self):
+        self.assertEqual(self.sql({"n": "5"})[1][-1], 5.0)
+        with self.assertRaises(ValueError):
+            self.sql({"n": "five"})
+
+    def test_compares_other_values_as_text(self):
+        self.assertEqual(self.sql({"name": True})[1][-1], "true")
+
+    def test_none_matches_missing_values(self):
+        self.assertIn("IS NULL", self.sql({"name": None})[0])
+
+    def test_rejects_unknown_properties(self):
+        with self.assertRaises(ValueError):
+            self.sql({"missing": 1})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FilterFeaturesTests(TestCase):
+    def test_matches_numbers_stored_as_text(self):
+        user = User.objects.create_user("filters@example.com")
+        layer = create_point_layer(user, 3)
+        LayerFeature.objects.filter(layer=layer, properties__n=1).update(
+            properties={"n": "1"}
+        )
+        properties = list(layer.properties.all())
+        for value in [1, "1", 1.0]:
+            with self.subTest(value=value):
+                features = filter_features(
+                    LayerFeature.objects.filter(layer=layer), properties, {"n": value}
+                )
+                self.assertEqual(features.count(), 1)
+
+
+class PartitionMigrationTests(TransactionTestCase):
+    """The feature table keeps every row when it is partitioned by layer
+    and when that is reversed, and the level table is created partitioned."""
+
+    def migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("gis", name)])
+        return executor.loader.project_state([("gis", name)]).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def create_layer(self, apps):
+        user = apps.get_model("accounts", "User").objects.create(
+            email="partitions@example.com"
+        )
+        return apps.get_model("gis", "Layer").objects.create(name="layer", user=user)
+
+    def relkind(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [table])
+            return cursor.fetchone()[0]
+
+    def count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def indexes(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s", [table]
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_feature_partitioning(self):
+        apps = self.migrate("0018_layerfeature_layer_geom_gist")
+        layer = self.create_layer(apps)
+        LayerFeature = apps.get_model("gis", "LayerFeature")
+        for n in range(3):
+            LayerFeature.objects.create(
+                layer=layer, geometry=Point(n, n, srid=4326), properties={"n": n}
+            )
+
+        self.migrate("0019_partition_layerfeature_by_layer")
+        self.assertEqual(self.relkind("gis_layerfeature"), "p")
+        self.assertEqual(self.count(f"gis_layerfeature_l{layer.id}"), 3)
+        self.assertEqual(self.count(f"layer_{layer.id}_features"), 3)
+
+        apps = self.migrate("0018_layerfeature_layer_geom_gist")
+        self.assertEqual(self.relkind("gis_layerfeature"), "r")
+        self.assertEqual(self.count("gis_layerfeature"), 3)
+        self.assertLessEqual(
+            {
+                "gis_feature_pkey",
+                "gis_feature_layer_id_e1f0b77e",
+                "gis_feature_geometry_1aba6e40_id",
+                "gis_feature_layer_geom_gist",
+            },
+            self.indexes("gis_layerfeature"),
+        )
+        # The id sequence continues past the copied rows
+        apps.get_model("gis", "LayerFeature").objects.create(
+            layer_id=layer.id, geometry=Point(0, 0, srid=4326), properties={}
+        )
+        self.assertEqual(self.count("gis_layerfeature"), 4)
+
+    def test_level_table_is_created_partitioned(self):
+        self.migrate("0020_layer_generalization")
+        self.assertEqual(self.relkind("gis_layerfeaturelevel"), "p")
+        self.assertEqual(
+            self.indexes("gis_layerfeaturelevel"),
+            {"gis_layerfeaturelevel_pkey", "gis_feature_level_geom_gist"},
+        )
+
+        self.migrate("0019_partition_layerfeature_by_layer")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('gis_layerfeaturelevel')")
+            self.assertIsNone(cursor.fetchone()[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TILE_CACHE_TIMEOUT=60)
+@mock.patch("gis.tiles.read_archived_tile", return_value=None)
+@mock.patch("gis.tiles.render_tile")
+class GetTileTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.layer = Layer(
+            id=5, modified_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+        )
+
+    def test_renders_each_tile_once(self, render_tile, read_archived_tile):
+        render_tile.return_value = b"tile"
+        for _ in range(2):
+            self.assertEqual(get_tile(self.layer, 3, 1, 2), b"tile")
+        render_tile.assert_called_once_with(5, 3, 1, 2, False)
+
+    def test_caches_empty_tiles(self, render_tile, read_archived_tile):
+        render_tile.return_value = b""
+        for _ in range(2):
+            self.assertEqual(get_tile(self.layer, 3, 1, 2), b"")
+        render_tile.assert_called_once()
+
+    def test_a_new_version_renders_again(self, render_tile, read_archived_tile):
+        render_tile.return_value = b"tile"
+        get_tile(self.layer, 3, 1, 2)
+        self.layer.modified_at += datetime.timedelta(seconds=1)
+        get_tile(self.layer, 3, 1, 2)
+        self.assertEqual(render_tile.call_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TILE_MAX_AGE=60)
+@mock.patch("gis.views.get_tile", return_value=b"tile")
+class LayerTileViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("tiles@example.com")
+        self.client.force_authenticate(self.user)
+        self.layer = create_point_layer(self.user, 1)
+
+    def get(self, z=1, x=0, y=0, **headers):
+        return self.client.get(
+            reverse("layer-tile", args=[self.layer.id, z, x, y]), headers=headers
+        )
+
+    def test_serves_a_tile_with_its_etag(self, get_tile):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"tile")
+        self.assertEqual(response["ETag"], tile_etag(self.layer, 1, 0, 0))
+        self.assertEqual(response["Cache-Control"], "private, max-age=60")
+
+    def test_a_matching_etag_is_not_modified(self, get_tile):
+        etag = self.get()["ETag"]
+        get_tile.reset_mock()
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        get_tile.assert_not_called()
+
+    def test_a_changed_layer_gets_a_new_etag(self, get_tile):
+        etag = self.get()["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_layer_tiles(self.layer.id)
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_looks_the_layer_up_once(self, get_tile):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(x=1).status_code, 200)
+
+    def test_rejects_tiles_out_of_range(self, get_tile):
+        self.assertEqual(self.get(z=1, x=2).status_code, 400)
+
+    def test_hides_other_users_layers(self, get_tile):
+        self.client.force_authenticate(User.objects.create_user("other@example.com"))
+        self.assertEqual(self.get().status_code, 404)
+
+
+class MBTilesTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_stores_xyz_tiles_as_gzipped_tms_rows(self):
+        path = self.directory / "tiles.mbtiles"
+        with MBTiles(path, "w") as archive:
+            archive.put_tile(2, 1, 0, b"tile")
+        with MBTiles(path) as archive:
+            self.assertEqual(archive.get_tile(2, 1, 0), b"tile")
+            self.assertIsNone(archive.get_tile(2, 1, 1))
+            row = archive.db.execute("SELECT tile_row, tile_data FROM tiles").fetchone()
+        self.assertEqual(row[0], 3)
+        self.assertEqual(gzip.decompress(row[1]), b"tile")
+
+    def test_merges_shards(self):
+        for index, tile in enumerate([(0, 0, 0), (1, 1, 1)]):
+            with MBTiles(self.directory / f"shard{index}.mbtiles", "w") as shard:
+                shard.put_tile(*tile, b"tile")
+        with MBTiles(self.directory / "tiles.mbtiles", "w") as archive:
+            archive.write_metadata({"minzoom": 0})
+            for index in range(2):
+                archive.merge(str(self.directory / f"shard{index}.mbtiles"))
+            self.assertEqual(archive.metadata(), {"minzoom": "0"})
+            self.assertEqual(archive.get_tile(0, 0, 0), b"tile")
+            self.assertEqual(archive.get_tile(1, 1, 1), b"tile")
+
+
+class TileBandTests(SimpleTestCase):
+    def test_groups_columns_into_bands_of_about_the_chunk_size(self):
+        counts = [(0, 400), (1, 700), (4, 10), (6, 999), (7, 1)]
+        self.assertEqual(tile_bands(3, counts, 1000), [(3, 0, 2), (3, 4, 7), (3, 7, 8)])
+
+    def test_a_zoom_without_tiles_has_no_bands(self):
+        self.assertEqual(tile_bands(3, [], 1000), [])
+
+    def test_clamps_rows_to_web_mercator(self):
+        self.assertEqual(tile_rows(np.array([90.0, -90.0]), 2).tolist(), [0, 3])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CoveredTilesTests(TestCase):
+    def test_matches_the_tiles_of_the_feature_bounds(self):
+        user = User.objects.create_user("coverage@example.com")
+        layer = Layer.objects.create(name="lines", user=user)
+        create_layer_partition(layer.id)
+        lines = [[(-170, -80), (-100, 10)], [(5, 5), (6, 6)], [(120, 60), (179, 85)]]
+        LayerFeature.objects.bulk_create(
+            LayerFeature(
+                layer=layer,
+                geometry=GEOSGeometry(shapely.LineString(line).wkt, 4326),
+                properties={},
+            )
+            for line in lines
+        )
+        for z in range(4):
+            expected = set()
+            for line in lines:
+                (x0, x1), (y1, y0) = [
+                    tile_columns(np.array([line[0][0], line[1][0]]), z),
+                    tile_rows(np.array([line[0][1], line[1][1]]), z),
+                ]
+                expected.update(
+                    (z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)
+                )
+            with self.subTest(z=z):
+                self.assertEqual(
+                    sum(count for _, count in column_tile_counts(layer.id, z)),
+                    len(expected),
+                )
+                self.assertEqual(set(covered_tiles(layer.id, z, 0, 2**z)), expected)
+                # Bands split the coverage without overlap
+                half = 2**z // 2 or 1
+                self.assertEqual(
+                    set(covered_tiles(layer.id, z, 0, half))
+                    | set(covered_tiles(layer.id, z, half, 2**z)),
+                    expected,
+                )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch("gis.tasks.close_old_connections")
+@mock.patch("gis.tasks.set_task_status")
+class TileSeedTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archives = override_settings(TILE_ARCHIVE_DIR=directory.name)
+        archives.enable()
+        self.addCleanup(archives.disable)
+
+    @mock.patch("gis.tasks.finalize_tile_seed_task")
+    @mock.patch("gis.tasks.render_tile", return_value=b"tile")
+    @mock.patch("gis.tasks.covered_tiles")
+    def run_chunks(self, indexes, covered_tiles, render_tile, finalize, count=3):
+        covered_tiles.side_effect = lambda layer_id, z, x_start, x_stop: [
+            (z, x, 0) for x in range(x_start, x_stop)
+        ]
+        for index in indexes:
+            seed_tile_chunk_task(
+                "parent", 1, 123, False, index, count, [2, index, index + 1], 0, 2
+            )
+        return finalize
+
+    def test_the_last_chunk_finalizes(self, *mocks):
+        cache.set("parent:chunks", 3)
+        cache.set("parent:done", 0)
+        self.assertFalse(self.run_chunks([0, 1]).delay.called)
+        finalize = self.run_chunks([2])
+        finalize.delay.assert_called_once_with("parent", 1, 123, 3, 0, 2)
+        with MBTiles(tile_shard_path("parent", 2)) as shard:
+            self.assertEqual(shard.get_tile(2, 2, 0), b"tile")
+
+    def test_finalizes_once_when_the_chunk_count_is_lost(self, *mocks):
+        with self.assertLogs("gis.tasks", "ERROR"):
+            finalize = self.run_chunks([0, 1, 2])
+        finalize.delay.assert_called_once()
+        self.assertIn("error", finalize.delay.call_args.kwargs)
+
+    @mock.patch("gis.tasks.get_layer_stats")
+    @mock.patch("gis.tasks.Layer.objects.get")
+    def test_merges_the_shards_into_the_archive(
+        self, get_layer, get_layer_stats, set_task_status, *mocks
+    ):
+        get_layer.return_value = Layer(id=1, name="points")
+        get_layer_stats.return_value = LayerStats(extent=[0, 1, 2, 3])
+        for index in range(2):
+            with MBTiles(tile_shard_path("parent", index), "w") as shard:
+                shard.put_tile(1, index, 0, b"tile")
+
+        finalize_tile_seed_task("parent", 1, 123, 2, 0, 1)
+
+        with MBTiles(archive_path(1)) as archive:
+            self.assertEqual(archive.metadata()["bounds"], "0,1,2,3")
+            self.assertEqual(archive.get_tile(1, 1, 0), b"tile")
+        self.assertFalse(Path(tile_shard_path("parent", 0)).exists())
+        self.assertEqual(set_task_status.call_args.args[1]["status"], "completed")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReadArchivedTileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archives = override_settings(TILE_ARCHIVE_DIR=directory.name)
+        archives.enable()
+        self.addCleanup(archives.disable)
+        self.layer = Layer(
+            id=5, modified_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+        )
+        with MBTiles(archive_path(5), "w") as archive:
+            archive.write_metadata(
+                {"version": tile_version(self.layer), "minzoom": 0, "maxzoom": 2}
+            )
+            archive.put_tile(1, 0, 0, b"tile")
+
+    def test_reads_seeded_tiles(self):
+        self.assertEqual(read_archived_tile(self.layer, 1, 0, 0), b"tile")
+
+    def test_a_missing_seeded_tile_is_empty(self):
+        self.assertEqual(read_archived_tile(self.layer, 1, 1, 0), b"")
+
+    def test_ignores_other_versions_and_zooms(self):
+        self.assertIsNone(read_archived_tile(self.layer, 3, 0, 0))
+        self.layer.modified_at += datetime.timedelta(seconds=1)
+        self.assertIsNone(read_archived_tile(self.layer, 1, 0, 0))
+
+
+class LevelForZoomTests(SimpleTestCase):
+    def test_each_zoom_reads_the_coarsest_level_that_serves_it(self):
+        self.assertEqual(LEVEL_MAX_ZOOMS, [8, 5, 2])
+        self.assertEqual(
+            [level_for_zoom(z) for z in range(11)],
+            [2, 2, 2, 1, 1, 1, 0, 0, 0, None, None],
+        )
+
+
+class ExtentTests(SimpleTestCase):
+    def test_clamps_to_web_mercator(self):
+        with self.assertLogs("gis.stats", "ERROR"):
+            self.assertEqual(
+                clamp_extent([190, -90, -200, 90]),
+                [-180, -MAX_LATITUDE, 180, MAX_LATITUDE],
+            )
+
+    def test_projects_to_web_mercator(self):
+        minx, miny, maxx, maxy = mercator_extent([-180, 0, 0, MAX_LATITUDE])
+        self.assertAlmostEqual(minx, -20037508.34, places=2)
+        self.assertAlmostEqual(miny, 0, places=2)
+        self.assertAlmostEqual(maxx, 0, places=2)
+        self.assertAlmostEqual(maxy, 20037508.34, places=2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LayerStatsTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user("stats@example.com")
+        self.layer = create_point_layer(user, 3)
+
+    def test_computes_the_stats_in_one_scan(self):
+        stats = compute_layer_stats(self.layer.id)
+        self.assertFalse(LayerStats.objects.filter(layer=self.layer).exists())
+        self.assertEqual(stats.feature_count, 3)
+        self.assertEqual(stats.extent, [0, 0, 2, 2])
+        self.assertEqual(stats.geometry_types, {"POINT": 3})
+        self.assertEqual(stats.properties, [{"name": "n", "type": "integer"}])
+
+    def test_saves_missing_stats(self):
+        stats = get_layer_stats(self.layer)
+        self.assertEqual(LayerStats.objects.get(layer=self.layer), stats)
+        self.assertEqual(stats.feature_count, 3)
+
+    def test_reads_saved_stats_without_scanning(self):
+        get_layer_stats(self.layer)
+        layer = Layer.objects.select_related("stats").get(id=self.layer.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_layer_stats(layer).feature_count, 3)
+
+    def test_does_not_save_the_stats_of_an_ingesting_layer(self):
+        IngestCheckpoint.objects.create(task_id="task", layer=self.layer)
+        self.assertEqual(get_layer_stats(self.layer).feature_count, 3)
+        self.assertFalse(LayerStats.objects.filter(layer=self.layer).exists())
+
+
+class GeoJSONStreamTests(SimpleTestCase):
+    @mock.patch("gis.exports.transaction")
+    @mock.patch("gis.exports.connection")
+    def test_streams_a_feature_collection_in_batches(self, connection, transaction):
+        features = [json.dumps(point_feature(n)) for n in range(5)]
+        cursor = connection.chunked_cursor.return_value.__enter__.return_value
+        cursor.fetchmany.side_effect = [
+            [(feature,) for feature in features[:3]],
+            [(feature,) for feature in features[3:]],
+            [],
+        ]
+        chunks = list(iter_geojson(7))
+
+        self.assertEqual(cursor.execute.call_args.args[1], [7])
+        cursor.fetchmany.assert_called_with(EXPORT_FETCH_SIZE)
+        collection = json.loads("".join(chunks))
+        self.assertEqual(collection["type"], "FeatureCollection")
+        self.assertEqual(numbers(collection["features"]), list(range(5)))
+
+    @mock.patch("gis.exports.transaction")
+    @mock.patch("gis.exports.connection")
+    def test_streams_an_empty_layer(self, connection, transaction):
+        cursor = connection.chunked_cursor.return_value.__enter__.return_value
+        cursor.fetchmany.return_value = []
+        collection = json.loads("".join(iter_geojson(7)))
+        self.assertEqual(collection["features"], [])
+
+    def test_gzips_the_stream(self):
+        chunks = ['{"type": ', '"FeatureCollection"}']
+        self.assertEqual(
+            gzip.decompress(b"".join(gzip_stream(iter(chunks)))),
+            "".join(chunks).encode(),
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExportLayerAsGeoJSONTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("geojson@example.com")
+        self.client.force_authenticate(self.user)
+        self.layer = create_point_layer(self.user, 3, name="points.shp")
+
+    def get(self, **headers):
+        return self.client.get(
+            reverse("export_layer_geojson", args=[self.layer.id]), headers=headers
+        )
+
+    def test_streams_the_layer(self):
+        response = self.get()
+        self.assertEqual(
+            response["Content-Disposition"].split("=")[1], '"points.geojson"'
+        )
+        collection = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(numbers(collection["features"]), [0, 1, 2])
+
+    def test_gzips_when_accepted(self):
+        response = self.get(accept_encoding="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        collection = json.loads(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(numbers(collection["features"]), [0, 1, 2])
+
+
+@mock.patch("gis.exports.iter_feature_batches")
+class ExportLayerTests(SimpleTestCase):
+    properties = [
+        {"name": "n", "type": "integer"},
+        {"name": "name", "type": "string"},
+        {"name": "day", "type": "date"},
+    ]
+    # Ingest keeps values as they were in the file, so numbers may be text
+    batches = [
+        (
+            shapely.points([(0, 0), (1, 1)]),
+            [{"n": "0", "name": "a", "day": "2024-01-31"}, {"n": 1, "name": "b"}],
+        ),
+        (
+            np.array([shapely.MultiPoint([(2, 2), (3, 3)])], dtype=object),
+            [{"n": 2, "name": None, "day": ""}],
+        ),
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.layer = Layer(id=1, name="points.geojson")
+        self.stats = LayerStats(
+            properties=self.properties,
+            geometry_types={"POINT": 2, "MULTIPOINT": 1},
+            extent=[0, 0, 3, 3],
+        )
+
+    def export(self, iter_feature_batches, format, progress=None):
+        iter_feature_batches.return_value = iter(self.batches)
+        return export_layer(self.layer, self.stats, format, self.directory, progress)
+
+    def test_fiona_formats_promote_mixed_parts_and_type_values(
+        self, iter_feature_batches
+    ):
+        for format in ["gpkg", "fgb"]:
+            with self.subTest(format=format):
+                path = self.export(iter_feature_batches, format)
+                self.assertEqual(Path(path).name, f"points.{format}")
+                with fiona.open(path) as collection:
+                    self.assertEqual(collection.schema["geometry"], "MultiPoint")
+                    features = list(collection)
+                # FlatGeobuf stores features in the order of its spatial index
+                self.assertEqual(
+                    sorted(f["properties"]["n"] for f in features), [0, 1, 2]
+                )
+                self.assertEqual(
+                    [f["geometry"]["type"] for f in features], ["MultiPoint"] * 3
+                )
+
+    def test_shapefile_is_zipped_with_its_sidecars(self, iter_feature_batches):
+        path = self.export(iter_feature_batches, "shapefile")
+        with zipfile.ZipFile(path) as archive:
+            self.assertLessEqual(
+                {"points.shp", "points.shx", "points.dbf", "points.prj"},
+                set(archive.namelist()),
+            )
+        with fiona.open(f"zip://{path}") as collection:
+            self.assertEqual(len(collection), 3)
+
+    def test_csv_has_wkt_and_property_columns(self, iter_feature_batches):
+        path = self.export(iter_feature_batches, "csv")
+        with open(path, newline="") as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], ["WKT", "n", "name", "day"])
+        self.assertEqual(rows[1], ["POINT (0 0)", "0", "a", "2024-01-31"])
+        self.assertEqual(rows[3][1:], ["2", "", ""])
+
+    def test_geoparquet_has_typed_columns_and_geo_metadata(self, iter_feature_batches):
+        path = self.export(iter_feature_batches, "parquet")
+        table = pq.read_table(path)
+        self.assertEqual(table.column("n").to_pylist(), [0, 1, 2])
+        self.assertEqual(
+            table.column("day").to_pylist(), [datetime.date(2024, 1, 31), None, None]
+        )
+        geo = json.loads(table.schema.metadata[b"geo"])
+        self.assertEqual(geo["columns"]["geometry"]["bbox"], [0, 0, 3, 3])
+        self.assertEqual(
+            shapely.from_wkb(table.column("geometry")[2].as_py()).geom_type,
+            "MultiPoint",
+        )
+
+    def test_reports_progress_after_each_batch(self, iter_feature_batches):
+        progress = mock.Mock()
+        self.export(iter_feature_batches, "csv", progress)
+        self.assertEqual([c.args for c in progress.call_args_list], [(2,), (3,)])
+
+    def test_rejects_unknown_formats(self, iter_feature_batches):
+        with self.assertRaises(ValueError):
+            get_exporter("xlsx")
+
+
+class ExportValueTests(SimpleTestCase):
+    def test_converts_stored_values_to_their_column_type(self):
+        self.assertEqual(export_value("5", "integer"), 5)
+        self.assertEqual(export_value("2.5", "float"), 2.5)
+        self.assertIs(export_value("TRUE", "boolean"), True)
+        self.assertEqual(export_value({"a": 1}, "json"), '{"a": 1}')
+        self.assertEqual(
+            export_value("2024-01-31T10:00:00", "datetime"),
+            datetime.datetime(2024, 1, 31, 10),
+        )
+
+    def test_unparseable_and_empty_values_are_null(self):
+        self.assertIsNone(export_value("five", "integer"))
+        self.assertIsNone(export_value("", "string"))
+
+
+class CheckpointResumeTests(SimpleTestCase):
+    """A failed ingest resumes after its last committed batch."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        bucket = Path(directory.name) / "spatiallab"
+        bucket.mkdir()
+        (bucket / "points.ndjson").write_bytes(ndjson(FEATURES))
+
+        storage = override_settings(
+            STORAGE_BACKEND="local", LOCAL_STORAGE_DIR=directory.name
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+        for patcher in [
+            # The checkpoint and the batch are committed together, and the
+            # loader below fails before either is written
+            mock.patch("gis.tasks.transaction.atomic", nullcontext),
+            mock.patch.object(IngestCheckpoint, "save"),
+            mock.patch.object(FileIngestor, "report_progress"),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.checkpoint = IngestCheckpoint(task_id="task", offset=0)
+        self.written = []
+
+    def load(self, fail_on_batch=None):
+        """Runs the ingest from the checkpoint, failing to write the
+        ``fail_on_batch``th batch."""
+        written = self.written
+
+        class Loader:
+            def __init__(self, layer, chunk_index=None):
+                self.batches = 0
+
+            def write_batch(self, feature_batch, geoms):
+                if self.batches == fail_on_batch:
+                    raise OperationalError("The connection was lost.")
+                self.batches += 1
+                written.extend(numbers(feature_batch))
+
+            def finish(self):
+                pass
+
+        ingestor = FileIngestor(
+            "gs://spatiallab/points.ndjson", "points", None, None, task_id="task"
+        )
+        ingestor.batch_size = 2
+        ingestor.track_properties = False
+        ingestor.loader_class = Loader
+        ingestor.checkpoint = self.checkpoint
+        with ingestor.open_reader() as reader:
+            ingestor.load_features(None, reader.features(self.checkpoint.offset))
+
+    def test_resumes_after_the_last_written_batch(self):
+        with self.assertRaises(OperationalError):
+            self.load(fail_on_batch=1)
+        self.assertEqual(self.written, [0, 1])
+        self.assertGreater(self.checkpoint.offset, 0)
+
+        self.load()
+        self.assertEqual(self.written, LOADED)
+        self.assertTrue(self.checkpoint.finished)
+
+    def test_resumes_past_a_failure_in_the_last_batch(self):
+        with self.assertRaises(OperationalError):
+            self.load(fail_on_batch=2)
+        self.load()
+        self.assertEqual(self.written, LOADED)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DirectoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("tree@example.com")
+        self.maps = Directory.objects.create(name="maps", user=self.user)
+        self.roads = Directory.objects.create(
+            name="roads", parent=self.maps, user=self.user
+        )
+        self.parks = Directory.objects.create(
+            name="parks", parent=self.maps, user=self.user
+        )
+        Layer.objects.create(name="b", directory=self.parks, user=self.user)
+        Layer.objects.create(name="a", directory=self.parks, user=self.user)
+
+    def test_nests_directories_and_layers_sorted_by_name(self):
+        with self.assertNumQueries(2):
+            tree = build_directory_tree(self.user.id)
+        [maps] = tree
+        self.assertEqual(maps["id"], self.maps.id)
+        self.assertEqual(
+            [node["name"] for node in maps["subdirectories"]], ["parks", "roads"]
+        )
+        parks = maps["subdirectories"][0]
+        self.assertEqual([layer["name"] for layer in parks["layers"]], ["a", "b"])
+        self.assertEqual(maps["subdirectories"][1]["layers"], [])
+
+    def test_skips_nodes_under_another_users_directory(self):
+        other = User.objects.create_user("other@example.com")
+        foreign = Directory.objects.create(name="foreign", user=other)
+        Directory.objects.create(name="hidden", parent=foreign, user=self.user)
+        Layer.objects.create(name="hidden", directory=foreign, user=self.user)
+
+        tree = build_directory_tree(self.user.id)
+        self.assertEqual([node["name"] for node in tree], ["maps"])
+
+    def test_caches_the_tree_until_the_user_version_changes(self):
+        tree = get_directory_tree(self.user.id)
+        with self.captureOnCommitCallbacks(execute=False):
+            Directory.objects.create(name="lakes", user=self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_directory_tree(self.user.id), tree)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Directory.objects.create(name="rivers", user=self.user)
+        self.assertEqual(
+            [node["name"] for node in get_directory_tree(self.user.id)],
+            ["lakes", "maps", "rivers"],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class VersionedResponseTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.build = mock.Mock(side_effect=lambda: Response({"name": "roads"}))
+
+    def request(self, **headers):
+        request = RequestFactory().get("/api/layers/1/", headers=headers)
+        request.user = mock.Mock(id=1)
+        return request
+
+    def test_reuses_a_cached_response(self):
+        first = versioned_response(self.request(), ["layer:1"], self.build)
+        second = versioned_response(self.request(), ["layer:1"], self.build)
+        self.build.assert_called_once()
+        self.assertEqual(second.data, {"name": "roads"})
+        self.assertEqual(second["ETag"], first["ETag"])
+        self.assertEqual(second["Cache-Control"], "private, no-cache")
+
+    def test_matching_etag_is_not_modified(self):
+        etag = versioned_response(self.request(), ["layer:1"], self.build)["ETag"]
+        response = versioned_response(
+            self.request(If_None_Match=etag), ["layer:1"], self.build
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.build.assert_called_once()
+
+    def test_does_not_cache_an_error(self):
+        self.build.side_effect = lambda: Response(status=404)
+        versioned_response(self.request(), ["layer:1"], self.build)
+        response = versioned_response(self.request(), ["layer:1"], self.build)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_version_change_rebuilds_with_a_new_etag(self):
+        first = versioned_response(self.request(), ["layer:1"], self.build)
+        cache.incr(version_key("layer:1"))
+        response = versioned_response(
+            self.request(If_None_Match=first["ETag"]), ["layer:1"], self.build
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+        self.assertEqual(self.build.call_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TASK_EVENT_INTERVAL=60)
+class TaskProgressTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        last_published.clear()
+        patcher = mock.patch("gis.progress.get_redis_connection")
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def test_throttles_progress_events(self):
+        self.assertTrue(should_publish("t", {"status": "processing", "progress": 1}))
+        self.assertFalse(should_publish("t", {"status": "processing", "progress": 1}))
+        self.assertFalse(should_publish("t", {"status": "processing", "progress": 2}))
+        self.assertTrue(should_publish("t", {"status": "completed"}))
+        self.assertNotIn("t", last_published)
+
+    @override_settings(TASK_EVENT_INTERVAL=0)
+    def test_publishes_changed_progress_after_the_interval(self):
+        self.assertTrue(should_publish("t", {"status": "processing", "progress": 1}))
+        self.assertFalse(should_publish("t", {"status": "processing", "progress": 1}))
+        self.assertTrue(should_publish("t", {"status": "processing", "progress": 2}))
+
+    def test_start_task_records_the_owner(self):
+        task = mock.Mock()
+        start_task(task, 7, "layer.geojson", queue="ingest_large")
+        call = task.apply_async.call_args
+        self.assertEqual(call.args, (("layer.geojson",), {}))
+        options = call.kwargs
+        self.assertEqual(options["queue"], "ingest_large")
+        self.assertEqual(cache.get(owner_key(options["task_id"])), 7)
+
+    def test_publishes_status_to_the_owner(self):
+        cache.set(owner_key("t"), 7)
+        set_task_status("t", {"status": "completed"})
+        self.assertEqual(cache.get("t"), {"status": "completed"})
+        channel, message = self.redis.publish.call_args.args
+        self.assertEqual(channel, "task-events:7")
+        self.assertEqual(json.loads(message), {"task_id": "t", "status": "completed"})
+
+    def test_status_without_owner_is_only_polled(self):
+        set_task_status("t", {"status": "completed"})
+        self.assertEqual(cache.get("t"), {"status": "completed"})
+        self.redis.publish.assert_not_called()
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "redis://redis:6379/0",
+        }
+    }
+)
+class TaskEventsTests(SimpleTestCase):
+    async def test_rejects_an_invalid_token(self):
+        request = RequestFactory().get("/api/tasks/events/", {"token": "invalid"})
+        response = await task_events(request)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_streams_the_users_events(self):
+        token = AccessToken()
+        token["user_id"] = 7
+        request = RequestFactory().get("/api/tasks/events/", {"token": str(token)})
+        with mock.patch("gis.events.event_stream") as stream:
+            response = await task_events(request)
+        stream.assert_called_once_with(7)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(response["X-Accel-Buffering"], "no")
+
+    async def test_event_stream_yields_messages_and_keepalives(self):
+        pubsub = mock.AsyncMock()
+        pubsub.get_message.side_effect = [
+            {"data": b'{"task_id": "t"}'},
+            None,
+        ]
+        client = mock.AsyncMock()
+        client.pubsub = mock.Mock(return_value=pubsub)
+        with mock.patch("gis.events.redis.from_url", return_value=client):
+            stream = event_stream(7)
+            events = [await anext(stream) for _ in range(3)]
+            await stream.aclose()
+
+        pubsub.subscribe.assert_awaited_once_with("task-events:7")
+        self.assertEqual(
+            events,
+            [
+                "retry: 3000\n\n",
+                'event: task\ndata: {"task_id": "t"}\n\n',
+                ": keepalive\n\n",
+            ],
+        )
+        pubsub.unsubscribe.assert_awaited_once()
+        client.aclose.assert_awaited_once()
+
+
+@override_settings(TASK_SLOT_LEASE=60, TASK_DEFER_SECONDS=10)
+class TaskSlotTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch("gis.limits.get_redis_connection")
+        self.redis = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.script = self.redis.register_script.return_value
+
+    def test_acquires_a_slot_keyed_by_user(self):
+        self.script.return_value = 1
+        self.assertTrue(acquire_slot("ingest", 7, "task", 2))
+        keys = self.script.call_args.kwargs["keys"]
+        now, limit, holder, expires, lease = self.script.call_args.kwargs["args"]
+        self.assertEqual(keys, ["slots:ingest:7"])
+        self.assertEqual((limit, holder, lease), (2, "task", 60))
+        self.assertEqual(expires, now + 60)
+
+    def test_reports_no_free_slot(self):
+        self.script.return_value = 0
+        self.assertFalse(acquire_slot("export", 7, "task", 2))
+
+    def test_releases_the_holders_slot(self):
+        release_slot("export", 7, "task")
+        self.redis.zrem.assert_called_once_with("slots:export:7", "task")
+
+    def test_defers_a_task_with_its_id_and_retries(self):
+        task = mock.Mock()
+        task.request.args = [1, "geojson", 7]
+        task.request.kwargs = {}
+        task.request.id = "task"
+        task.request.retries = 2
+        task.request.delivery_info = {"routing_key": "export"}
+        defer_task(task)
+        options = task.apply_async.call_args.kwargs
+        self.assertEqual(task.apply_async.call_args.args, ([1, "geojson", 7], {}))
+        self.assertEqual(options["task_id"], "task")
+        self.assertEqual(options["retries"], 2)
+        self.assertEqual(options["queue"], "export")
+        self.assertTrue(5 <= options["countdown"] <= 15)
+
+    @override_settings(USER_EXPORT_CONCURRENCY=2)
+    def test_export_without_a_slot_is_deferred(self):
+        with (
+            mock.patch("gis.tasks.set_task_status"),
+            mock.patch("gis.tasks.acquire_slot", return_value=False) as acquire,
+            mock.patch("gis.tasks.defer_task") as defer,
+            mock.patch("gis.tasks.Layer") as layers,
+        ):
+            export_layer_task.apply(args=[1, "geojson", 7], task_id="task")
+        acquire.assert_called_once_with("export", 7, "task", 2)
+        defer.assert_called_once()
+        layers.objects.get.assert_not_called()
+
+
+class ExportLayerViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("exports@example.com")
+        self.layer = Layer.objects.create(name="roads", user=self.user)
+        self.client.force_authenticate(self.user)
+
+    def test_starts_the_export_for_the_user(self):
+        with mock.patch("gis.views.start_task") as start:
+            start.return_value.id = "task"
+            response = self.client.post(
+                reverse("export_layer", args=[self.layer.id, "geojson"])
+            )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["task_id"], "task")
+        start.assert_called_once_with(
+            export_layer_task, self.user.id, self.layer.id, "geojson", self.user.id
+        )
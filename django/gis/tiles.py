@@ -0,0 +1,271 @@
+import math
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from gis.generalize import level_for_zoom
+from gis.mbtiles import open_archive
+from gis.models import Layer, LayerFeature, LayerFeatureLevel
+from gis.versions import invalidate_layers
+
+# Tile extent and clipping buffer, in tile pixels, as used by pg_tileserv
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 24
+
+# Web Mercator cannot represent the poles
+MAX_LATITUDE = 85.0511287798
+
+TILE_SQL = """
+    WITH bounds AS (
+        SELECT
+            ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS tile,
+            ST_TileEnvelope(
+                %(z)s, %(x)s, %(y)s, margin => {margin}
+            ) AS query
+    )
+    SELECT ST_AsMVT(mvt, 'features', {extent}, 'geom', 'id')
+    FROM (
+        SELECT
+            f.{id} AS id,
+            ST_AsMVTGeom({geometry}, bounds.tile, {extent}, {buffer}) AS geom
+        FROM {table} f, bounds
+        WHERE f.layer_id = %(layer_id)s AND {where}
+    ) AS mvt
+    WHERE mvt.geom IS NOT NULL
+"""
+
+# Full resolution geometries are stored in EPSG:4326
+FEATURE_TILE_SQL = TILE_SQL.format(
+    margin=TILE_BUFFER / TILE_EXTENT,
+    extent=TILE_EXTENT,
+    buffer=TILE_BUFFER,
+    id="id",
+    geometry="ST_Transform(f.geometry, 3857)",
+    table=LayerFeature._meta.db_table,
+    where="f.geometry && ST_Transform(bounds.query, 4326)",
+)
+
+# Generalized geometries are stored in EPSG:3857
+LEVEL_TILE_SQL = TILE_SQL.format(
+    margin=TILE_BUFFER / TILE_EXTENT,
+    extent=TILE_EXTENT,
+    buffer=TILE_BUFFER,
+    id="feature_id",
+    geometry="f.geometry",
+    table=LayerFeatureLevel._meta.db_table,
+    where="f.level = %(level)s AND f.geometry && bounds.query",
+)
+
+
+def is_valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2**z and 0 <= y < 2**z
+
+
+def tile_version(layer):
+    """Returns the layer's tile version, which changes whenever it is edited."""
+    return int(layer.modified_at.timestamp() * 1_000_000)
+
+
+def tile_cache_key(layer, z, x, y):
+    # The version is part of the key, so bumping it orphans every cached
+    # tile of the layer at once and Redis evicts them as they go cold
+    return f"tile:{layer.id}:{tile_version(layer)}:{z}:{x}:{y}"
+
+
+def tile_etag(layer, z, x, y):
+    return f'"{layer.id}-{tile_version(layer)}-{z}-{x}-{y}"'
+
+
+def render_tile(layer_id, z, x, y, generalized=False):
+    """Renders a Mapbox Vector Tile for a layer with a single query.
+
+    The layer_id filter prunes the query down to the layer's partition, and
+    the bbox test is served by the (layer, geometry) GiST index. Low zoom
+    tiles of a generalized layer are read from the matching simplified level.
+    """
+    params = {"layer_id": layer_id, "z": z, "x": x, "y": y}
+    level = level_for_zoom(z) if generalized else None
+    with connection.cursor() as cursor:
+        if level is None:
+            cursor.execute(FEATURE_TILE_SQL, params)
+        else:
+            cursor.execute(LEVEL_TILE_SQL, {**params, "level": level})
+        return bytes(cursor.fetchone()[0])
+
+
+def archive_path(layer_id):
+    """Returns the path of a layer's pre-seeded MBTiles archive."""
+    return os.path.join(settings.TILE_ARCHIVE_DIR, f"layer_{int(layer_id)}.mbtiles")
+
+
+def read_archived_tile(layer, z, x, y):
+    """Returns a tile from the layer's seeded archive.
+
+    Returns None when there is no archive for the layer's current version or
+    the zoom level was not seeded. Seeding skips empty tiles, so a tile
+    missing from a matching archive is empty.
+    """
+    archive = open_archive(archive_path(layer.id))
+    if archive is None:
+        return None
+    with archive:
+        metadata = archive.metadata()
+        if metadata.get("version") != str(tile_version(layer)):
+            return None
+        if not int(metadata["minzoom"]) <= z <= int(metadata["maxzoom"]):
+            return None
+        tile = archive.get_tile(z, x, y)
+    return b"" if tile is None else tile
+
+
+def get_tile(layer, z, x, y):
+    """Returns a layer's tile from the cache, the seeded archive, or PostGIS.
+
+    Empty tiles are cached too, since they are the most common tiles and
+    cost as much to compute as full ones.
+    """
+    key = tile_cache_key(layer, z, x, y)
+    tile = cache.get(key)
+    if tile is None:
+        tile = read_archived_tile(layer, z, x, y)
+        if tile is None:
+            tile = render_tile(layer.id, z, x, y, layer.generalized)
+        cache.set(key, tile, timeout=settings.TILE_CACHE_TIMEOUT)
+    return tile
+
+
+def tile_column_sql(lon):
+    return f"least(greatest(floor(({lon} + 180) / 360 * %(n)s)::bigint, 0), %(n)s - 1)"
+
+
+def tile_row_sql(lat):
+    lat = f"radians(least(greatest({lat}, -{MAX_LATITUDE}), {MAX_LATITUDE}))"
+    y = f"(1 - ln(tan({lat}) + 1 / cos({lat})) / pi()) / 2 * %(n)s"
+    return f"least(greatest(floor({y})::bigint, 0), %(n)s - 1)"
+
+
+# The tiles of one zoom touched by a feature bounding box, within a band of
+# columns. The boxes are read from the geometry headers, so no geometry is
+# decoded, and the band's bbox test is served by the (layer, geometry) index.
+COVERED_TILES_SQL = f"""
+    SELECT DISTINCT x, y
+    FROM (
+        SELECT
+            {tile_column_sql("ST_XMin(box)")} AS x0,
+            {tile_column_sql("ST_XMax(box)")} AS x1,
+            {tile_row_sql("ST_YMax(box)")} AS y0,
+            {tile_row_sql("ST_YMin(box)")} AS y1
+        FROM (
+            SELECT geometry::box2d AS box
+            FROM {LayerFeature._meta.db_table}
+            WHERE layer_id = %(layer_id)s
+                AND geometry && ST_MakeEnvelope(%(west)s, -90, %(east)s, 90, 4326)
+        ) AS features
+    ) AS spans
+    CROSS JOIN LATERAL generate_series(
+        greatest(x0, %(x_start)s), least(x1, %(x_stop)s - 1)
+    ) AS x
+    CROSS JOIN LATERAL generate_series(y0, y1) AS y
+"""
+
+COLUMN_TILE_COUNTS_SQL = f"""
+    SELECT x, count(*)
+    FROM ({COVERED_TILES_SQL}) AS tiles
+    GROUP BY x
+    ORDER BY x
+"""
+
+
+def band_params(layer_id, z, x_start, x_stop):
+    n = 2**z
+    return {
+        "layer_id": layer_id,
+        "n": n,
+        "x_start": x_start,
+        "x_stop": x_stop,
+        "west": x_start / n * 360 - 180,
+        "east": x_stop / n * 360 - 180,
+    }
+
+
+def column_tile_counts(layer_id, z):
+    """Returns ``(x, tiles)`` for every column of a zoom with covered tiles.
+
+    The tiles are counted in PostGIS, so at most one row per column of the
+    zoom reaches Python, however many features or tiles the layer has.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(COLUMN_TILE_COUNTS_SQL, band_params(layer_id, z, 0, 2**z))
+        return cursor.fetchall()
+
+
+def tile_bands(z, column_counts, chunk_size):
+    """Groups the covered columns of a zoom into bands of about ``chunk_size``
+    tiles.
+
+    Returns ``(z, x_start, x_stop)`` bands, with ``x_stop`` exclusive, from
+    ``(x, tiles)`` pairs sorted by column.
+    """
+    bands = []
+    x_start = None
+    tiles = 0
+    for x, count in column_counts:
+        if x_start is None:
+            x_start = x
+        tiles += count
+        if tiles >= chunk_size:
+            bands.append((z, x_start, x + 1))
+            x_start, tiles = None, 0
+    if x_start is not None:
+        bands.append((z, x_start, x + 1))
+    return bands
+
+
+def covering_bands(layer_id, zooms, chunk_size):
+    """Returns the bands of columns that cover a layer's features, zoom by
+    zoom.
+
+    Tiles that no feature's bounding box touches are never part of a band's
+    coverage, so seeding does not render the empty tiles inside a layer's
+    extent.
+    """
+    bands = []
+    for z in zooms:
+        bands.extend(tile_bands(z, column_tile_counts(layer_id, z), chunk_size))
+    return bands
+
+
+def covered_tiles(layer_id, z, x_start, x_stop):
+    """Yields every (z, x, y) tile of a band that a feature bounding box
+    touches."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{COVERED_TILES_SQL} ORDER BY x, y",
+            band_params(layer_id, z, x_start, x_stop),
+        )
+        for x, y in cursor:
+            yield z, x, y
+
+
+def tile_columns(lon, z):
+    n = 2**z
+    return np.clip(np.floor((lon + 180) / 360 * n), 0, n - 1).astype(np.int64)
+
+
+def tile_rows(lat, z):
+    n = 2**z
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * n
+    return np.clip(np.floor(y), 0, n - 1).astype(np.int64)
+
+
+def invalidate_layer_tiles(layer_id) -> None:
+    """Moves a layer to a new tile version after its features change."""
+    layers = Layer.objects.filter(id=layer_id)
+    layers.update(modified_at=timezone.now())
+    invalidate_layers(layers)
@@ -1,13 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .events import task_events
 from .views import (
     LayerListView,
     LayerDetailView,
+    LayerPropertyDetailView,
+    LayerTileView,
     ProjectViewSet,
     ProjectLayerViewSet,
     FileUploadView,
     DirectoryViewSet,
     ExportLayerAsGeoJSON,
+    ExportLayerView,
     GenerateSignedUrlView,
     StartIngestTaskView,
     CheckTaskStatusView,
@@ -26,11 +30,26 @@ urlpatterns = [
     path("upload/", FileUploadView.as_view(), name="upload"),
     path("layers/", LayerListView.as_view(), name="layer-list"),
     path("layer/<int:pk>/", LayerDetailView.as_view(), name="layer-detail"),
+    path(
+        "layer/<int:pk>/tiles/<int:z>/<int:x>/<int:y>.pbf",
+        LayerTileView.as_view(),
+        name="layer-tile",
+    ),
+    path(
+        "layer-property/<int:pk>/",
+        LayerPropertyDetailView.as_view(),
+        name="layer-property-detail",
+    ),
     path(
         "export/layer/<int:layer_id>/",
         ExportLayerAsGeoJSON.as_view(),
         name="export_layer_geojson",
     ),
+    path(
+        "export/layer/<int:layer_id>/<str:format>/",
+        ExportLayerView.as_view(),
+        name="export_layer",
+    ),
     path("", include(router.urls)),
     path(
         "generate-signed-url/",
@@ -43,6 +62,7 @@ urlpatterns = [
         CheckTaskStatusView.as_view(),
         name="check-task-status",
     ),
+    path("task-events/", task_events, name="task-events"),
     path("project-layer/<int:pk>/move-up/", move_model_up, name="move_model_up"),
     path("project-layer/<int:pk>/move-down/", move_model_down, name="move_model_down"),
     path(
@@ -0,0 +1,123 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponseNotModified
+from rest_framework.response import Response
+
+from gis.models import Project, ProjectLayer
+
+
+def version_key(scope):
+    return f"version:{scope}"
+
+
+def get_version(scope):
+    """Returns the version of a scope of cached data, such as a user's
+    layers and directories, a layer or a project.
+
+    A missing counter starts from the clock rather than 1, so a counter
+    evicted from Redis never comes back at a version already cached.
+    """
+    return cache.get_or_set(version_key(scope), time.time_ns, timeout=None)
+
+
+def bump_versions(*scopes):
+    """Moves scopes to new versions once the current transaction commits.
+
+    Bumping before the commit would let a concurrent request cache the old
+    data under the new version.
+    """
+
+    def bump():
+        for scope in scopes:
+            try:
+                cache.incr(version_key(scope))
+            except ValueError:
+                cache.set(version_key(scope), time.time_ns(), timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def user_scope(user_id):
+    """A user's directories, layers and projects, as listed."""
+    return f"user:{user_id}"
+
+
+def layer_scope(layer_id):
+    """A layer with its features, properties and stats."""
+    return f"layer:{layer_id}"
+
+
+def project_scope(project_id):
+    """A project with its layers and their stats."""
+    return f"project:{project_id}"
+
+
+def invalidate_projects(project_ids):
+    """Bumps the versions of projects and of their owners' project lists."""
+    owner_ids = (
+        Project.objects.filter(id__in=project_ids)
+        .values_list("owner_id", flat=True)
+        .distinct()
+    )
+    bump_versions(
+        *(project_scope(project_id) for project_id in project_ids),
+        *(user_scope(owner_id) for owner_id in owner_ids),
+    )
+
+
+def invalidate_projects_with_layers(layer_ids):
+    """Bumps the versions of the projects showing any of the layers."""
+    project_ids = (
+        ProjectLayer.objects.filter(layer_id__in=layer_ids)
+        .values_list("project_id", flat=True)
+        .distinct()
+    )
+    invalidate_projects(list(project_ids))
+
+
+def invalidate_layers(layers):
+    """Bumps the versions of everything showing a queryset of layers, for
+    changes made with ``update()``, which sends no signals."""
+    rows = list(layers.values_list("id", "user_id"))
+    bump_versions(
+        *(layer_scope(layer_id) for layer_id, _ in rows),
+        *(user_scope(user_id) for user_id in {user_id for _, user_id in rows}),
+    )
+    invalidate_projects_with_layers([layer_id for layer_id, _ in rows])
+
+
+def versioned_response(request, scopes, build):
+    """Returns a response cached until any of ``scopes`` changes version.
+
+    The ETag is derived from the versions, the user and the full path, so
+    it is known before any data is read. An ``If-None-Match`` matching a
+    cached response gets a 304 without querying the database. Only a
+    successful ``build()`` is cached, so a cached response also proves the
+    user was allowed to see it at that version.
+    """
+    versions = ":".join(str(get_version(scope)) for scope in scopes)
+    tag = hashlib.sha1(
+        f"{request.user.id}:{versions}:{request.get_full_path()}".encode()
+    ).hexdigest()
+    etag = f'"{tag}"'
+    key = f"response:{tag}"
+
+    if etag in request.headers.get("If-None-Match", "") and cache.has_key(key):
+        response = HttpResponseNotModified()
+    else:
+        data = cache.get(key)
+        if data is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, timeout=settings.VERSIONED_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+    response["ETag"] = etag
+    # Responses are per user, and must be revalidated before each reuse
+    response["Cache-Control"] = "private, no-cache"
+    return response
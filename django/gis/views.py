@@ -2,17 +2,15 @@ import json
 import logging
 import uuid
 from datetime import timedelta
+from functools import partial
 from pathlib import Path
 
 from django.conf import settings
 from django.core.cache import cache
-from django.contrib.gis.db.models import Extent
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.http import JsonResponse, HttpResponse
-from google.cloud import storage
-from pyproj import Transformer
+from django.http import Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from rest_framework import generics, viewsets
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -32,14 +30,49 @@ from gis.serializers import (
     ProjectLayerSerializer,
     FileUploadSerializer,
     DirectorySerializer,
+    LayerPropertySerializer,
+)
+from gis.directories import find_directory, get_directory_tree, subtree_ids
+from gis.exports import get_exporter, gzip_stream, iter_geojson
+from gis.pagination import estimated_count, paginate_by_cursor, parse_page_size
+from gis.partitions import delete_layers
+from gis.progress import start_task
+from gis.projects import build_project_bootstrap, project_layers_prefetch
+from gis.readers import get_reader
+from gis.schema import filter_features, sort_features
+from gis.stats import get_layer_stats, stats_properties
+from gis.storage import get_storage, get_storage_client
+from gis.tiles import get_tile, is_valid_tile, tile_etag
+from gis.tasks import (
+    export_layer_task,
+    ingest_file_to_db_task,
+    ingest_file_in_chunks_task,
+    update_property_index_task,
 )
-from gis.tasks import ingest_file_to_db_task
 from gis.permissions import IsOwner, IsProjectOwner
+from gis.versions import (
+    get_version,
+    layer_scope,
+    project_scope,
+    user_scope,
+    versioned_response,
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+def feature_rows(features):
+    """Returns features as feature table rows of their id and properties."""
+    return [
+        {
+            "Feature ID": feature.id,
+            **feature.properties,
+        }
+        for feature in features
+    ]
+
+
 class FileUploadView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -51,7 +84,7 @@ class FileUploadView(APIView):
             logger.info("Uploading file to GCS")
 
             # Google Cloud Storage upload
-            client = storage.Client(credentials=settings.GCS_CREDENTIALS)
+            client = get_storage_client()
             bucket = client.bucket(settings.GCS_BUCKET_NAME)
             file_path = Path(file.name)
             file_name = f"{file_path.stem}_{uuid.uuid4()}{file_path.suffix}"
@@ -67,6 +100,7 @@ class FileUploadView(APIView):
                 layer_name=file_name,
                 directory=directory_id,
                 user_email=request.user.email,
+                user_id=request.user.id,
             )
 
             self.create_feature_view(layer_id)
@@ -82,7 +116,7 @@ class GenerateSignedUrlView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
-        client = storage.Client(credentials=settings.GCS_CREDENTIALS)
+        client = get_storage_client()
         bucket = client.bucket(settings.GCS_BUCKET_NAME)
         file_name = f"{uuid.uuid4()}.{request.data['extension']}"
         blob = bucket.blob(file_name)
@@ -103,8 +137,12 @@ class LayerListView(generics.ListAPIView):
         return self.request.user.layers.all()
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
+        return versioned_response(
+            request, [user_scope(request.user.id)], self.build_list
+        )
+
+    def build_list(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
         return Response({"layers": serializer.data})
 
 
@@ -113,49 +151,67 @@ class LayerDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return self.request.user.layers.all()
+        return self.request.user.layers.select_related("stats")
+
+    def perform_destroy(self, instance):
+        delete_layers(Layer.objects.filter(id=instance.id))
 
     def retrieve(self, request, *args, **kwargs):
+        return versioned_response(
+            request,
+            [layer_scope(kwargs["pk"])],
+            lambda: self.build_retrieve(request),
+        )
+
+    def build_retrieve(self, request):
         layer = self.get_object()
 
-        unique_keys = (
-            LayerProperty.objects.filter(layer=layer)
-            .values_list("name", flat=True)
-            .distinct()
-        )
-        extent = LayerFeature.objects.filter(layer=layer).aggregate(Extent("geometry"))[
-            "geometry__extent"
-        ]
-        if extent:
-            minx = float(extent[0])
-            maxx = float(extent[2])
-            miny = float(extent[1])
-            maxy = float(extent[3])
-            minx, maxx = min(minx, maxx), max(minx, maxx)
-            miny, maxy = min(miny, maxy), max(miny, maxy)
-            if minx < -180 or minx > 180 or maxx < -180 or maxx > 180:
-                logger.error(
-                    "Longitude values are out of range. Adjusting to valid range."
-                )
-                minx = max(min(minx, 180), -180)
-                maxx = max(min(maxx, 180), -180)
-            if miny < -90 or miny > 90 or maxy < -90 or maxy > 90:
-                logger.error(
-                    "Latitude values are out of range. Adjusting to valid range."
-                )
-                miny = max(min(miny, 90), -90)
-                maxy = max(min(maxy, 90), -90)
-            transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-            minx, miny = transformer.transform(minx, miny)
-            maxx, maxy = transformer.transform(maxx, maxy)
-            transformed_extent = [minx, miny, maxx, maxy]
-        else:
-            transformed_extent = None
+        stats = get_layer_stats(layer)
+        properties = stats_properties(stats)
+        unique_keys = list(dict.fromkeys(prop.name for prop in properties))
+        transformed_extent = stats.extent_3857
 
         page = request.GET.get("page", 1)
         page_size = request.GET.get("page_size", 10)
-        features = LayerFeature.objects.filter(layer=layer)
+        features = LayerFeature.objects.filter(layer=layer).order_by("id")
+        try:
+            if request.GET.get("filter"):
+                features = filter_features(
+                    features, properties, json.loads(request.GET["filter"])
+                )
+            if "cursor" in request.GET:
+                # Keyset pagination for deep pages of large layers
+                page_features, next_cursor, prev_cursor = paginate_by_cursor(
+                    features,
+                    request.GET["cursor"],
+                    page_size,
+                    properties,
+                    request.GET.get("sort"),
+                )
+                return Response(
+                    {
+                        "headers": unique_keys,
+                        "property_types": {prop.name: prop.type for prop in properties},
+                        "data": feature_rows(page_features),
+                        "extent": transformed_extent,
+                        "page_size": parse_page_size(page_size),
+                        "next": next_cursor,
+                        "prev": prev_cursor,
+                        "estimated_total_features": (
+                            estimated_count(features)
+                            if request.GET.get("filter")
+                            else stats.feature_count
+                        ),
+                    }
+                )
+            if request.GET.get("sort"):
+                features = sort_features(features, properties, request.GET["sort"])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         paginator = Paginator(features, page_size)
+        if not request.GET.get("filter"):
+            # Skips the COUNT(*) over the layer
+            paginator.count = stats.feature_count
 
         try:
             features_page = paginator.page(page)
@@ -164,17 +220,12 @@ class LayerDetailView(generics.RetrieveUpdateDestroyAPIView):
         except EmptyPage:
             features_page = paginator.page(paginator.num_pages)
 
-        table_data = [
-            {
-                "Feature ID": feature.id,
-                **feature.properties,
-            }
-            for feature in features_page
-        ]
+        table_data = feature_rows(features_page)
 
         return Response(
             {
-                "headers": list(unique_keys),
+                "headers": unique_keys,
+                "property_types": {prop.name: prop.type for prop in properties},
                 "data": table_data,
                 "extent": transformed_extent,
                 "page": features_page.number,
@@ -193,6 +244,61 @@ class LayerDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Response(serializer.data)
 
 
+class LayerPropertyDetailView(generics.RetrieveUpdateAPIView):
+    serializer_class = LayerPropertySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return LayerProperty.objects.filter(layer__user=self.request.user)
+
+    def perform_update(self, serializer):
+        was_indexed = serializer.instance.indexed
+        prop = serializer.save()
+        if prop.indexed != was_indexed:
+            # Index builds on large layers are too slow for a request
+            update_property_index_task.delay(prop.id)
+
+
+class LayerTileView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_layer(self, request, pk):
+        """Returns the user's layer, with only what serving its tiles needs.
+
+        A map requests many tiles at once, so the layer is cached under its
+        version and the database is only queried on the first tile after
+        each change. Layers the user does not own are never cached.
+        """
+        key = f"tile-layer:{request.user.id}:{pk}:{get_version(layer_scope(pk))}"
+        layer = cache.get(key)
+        if layer is None:
+            layer = generics.get_object_or_404(
+                request.user.layers.only("id", "modified_at", "generalized"), pk=pk
+            )
+            cache.set(key, layer, timeout=settings.VERSIONED_CACHE_TIMEOUT)
+        return layer
+
+    def get(self, request, pk, z, x, y):
+        layer = self.get_layer(request, pk)
+        if not is_valid_tile(z, x, y):
+            return Response(
+                {"error": "Tile out of range."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        etag = tile_etag(layer, z, x, y)
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                get_tile(layer, z, x, y),
+                content_type="application/vnd.mapbox-vector-tile",
+            )
+        response["ETag"] = etag
+        # Tiles are per user, so only the browser may cache them
+        response["Cache-Control"] = f"private, max-age={settings.TILE_MAX_AGE}"
+        return response
+
+
 class ProjectViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated, IsOwner]
@@ -203,7 +309,35 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return context
 
     def get_queryset(self):
-        return Project.objects.filter(owner=self.request.user)
+        projects = Project.objects.filter(owner=self.request.user)
+        if self.action == "bootstrap":
+            # Its layers are only loaded when the cached payload is stale
+            return projects
+        return projects.prefetch_related(project_layers_prefetch())
+
+    def list(self, request, *args, **kwargs):
+        return versioned_response(
+            request,
+            [user_scope(request.user.id)],
+            partial(super().list, request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return versioned_response(
+            request,
+            [project_scope(kwargs["pk"])],
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    @action(detail=True, methods=["get"])
+    def bootstrap(self, request, pk=None):
+        """Returns the project with its ordered layers, their styles and
+        stats, so the map page opens with one request."""
+        return versioned_response(
+            request,
+            [project_scope(pk)],
+            lambda: Response(build_project_bootstrap(self.get_object())),
+        )
 
 
 class ProjectLayerViewSet(viewsets.ModelViewSet):
@@ -220,9 +354,7 @@ class DirectoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Directory.objects.filter(user=self.request.user).prefetch_related(
-            "layers", "subdirectories"
-        )
+        return Directory.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -230,10 +362,27 @@ class DirectoryViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        # Deleting the layers inside first drops their partitions concurrently
+        delete_layers(Layer.objects.filter(directory_id__in=subtree_ids(instance.id)))
+        instance.delete()
+
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset().filter(parent__isnull=True).order_by("name")
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return versioned_response(
+            request,
+            [user_scope(request.user.id)],
+            lambda: Response(get_directory_tree(request.user.id)),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            directory_id = int(kwargs["pk"])
+        except ValueError:
+            raise Http404
+        node = find_directory(get_directory_tree(request.user.id), directory_id)
+        if node is None:
+            raise Http404
+        return Response(node)
 
 
 class ExportLayerAsGeoJSON(APIView):
@@ -244,23 +393,20 @@ class ExportLayerAsGeoJSON(APIView):
             # Retrieve the Layer and associated Features
             layer = Layer.objects.get(id=layer_id, user=request.user)
 
-            # Serialize features to GeoJSON
-            geojson = {
-                "type": "FeatureCollection",
-                "features": [
-                    {
-                        "type": "Feature",
-                        "geometry": json.loads(feature.geometry.geojson),
-                        "properties": feature.properties,
-                    }
-                    for feature in layer.features.all()
-                ],
-            }
-
             filename = Path(layer.name).stem + ".geojson"
 
-            # Create HTTP response with GeoJSON content
-            response = Response(geojson, content_type="application/json")
+            # Stream the GeoJSON as PostGIS renders it
+            chunks = iter_geojson(layer.id)
+            if "gzip" in request.headers.get("Accept-Encoding", ""):
+                response = StreamingHttpResponse(
+                    gzip_stream(chunks), content_type="application/geo+json"
+                )
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = StreamingHttpResponse(
+                    chunks, content_type="application/geo+json"
+                )
+            response["Vary"] = "Accept-Encoding"
             response["Content-Disposition"] = f'attachment; filename="{filename}"'
             return response
 
@@ -271,6 +417,27 @@ class ExportLayerAsGeoJSON(APIView):
             )
 
 
+class ExportLayerView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, layer_id, format):
+        layer = generics.get_object_or_404(request.user.layers.all(), pk=layer_id)
+        try:
+            get_exporter(format)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Exports of large layers outlast a request, so they run in Celery
+        task = start_task(
+            export_layer_task, request.user.id, layer.id, format, request.user.id
+        )
+
+        return Response(
+            {"task_id": task.id, "message": "Task started successfully"},
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
 class StartIngestTaskView(APIView):
     def post(self, request, *args, **kwargs):
         file_name = request.data.get("file_name")
@@ -287,9 +454,32 @@ class StartIngestTaskView(APIView):
                 {"error": "Missing required fields"}, status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Large uploads go to their own queue, so they don't hold up small
+        # ones, and the largest are split into chunks and loaded in parallel
+        # if their format can be read from the middle
+        size = get_storage(settings.GCS_BUCKET_NAME).size(file_name) or 0
+        try:
+            splittable = get_reader(file_name).splittable
+        except ValueError:
+            # Left to the ingest task to report
+            splittable = False
+        if size >= settings.INGEST_FAN_OUT_MIN_BYTES and splittable:
+            ingest_task, queue = ingest_file_in_chunks_task, "ingest-large"
+        elif size >= settings.INGEST_LARGE_MIN_BYTES:
+            ingest_task, queue = ingest_file_to_db_task, "ingest-large"
+        else:
+            ingest_task, queue = ingest_file_to_db_task, "ingest-small"
+
         # Trigger the Celery task
-        task = ingest_file_to_db_task.delay(
-            file_name, layer_name, directory, user_email
+        task = start_task(
+            ingest_task,
+            request.user.id,
+            file_name,
+            layer_name,
+            directory,
+            user_email,
+            request.user.id,
+            queue=queue,
         )
 
         return Response(
@@ -359,6 +549,24 @@ class LayerFeatureByIdListView(APIView):
         page = request.GET.get("page", 1)
         page_size = request.GET.get("page_size", 10)
 
+        if "cursor" in request.GET:
+            try:
+                page_features, next_cursor, prev_cursor = paginate_by_cursor(
+                    features, request.GET["cursor"], page_size
+                )
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(
+                {
+                    "data": feature_rows(page_features),
+                    "page_size": parse_page_size(page_size),
+                    "next": next_cursor,
+                    "prev": prev_cursor,
+                    "estimated_total_features": estimated_count(features),
+                },
+                status=status.HTTP_200_OK,
+            )
+
         # Paginate the features
         paginator = Paginator(features, page_size)
 
@@ -370,13 +578,7 @@ class LayerFeatureByIdListView(APIView):
             paginated_features = paginator.page(paginator.num_pages)
 
         # Create a list of features with all properties
-        table_data = [
-            {
-                "Feature ID": feature.id,
-                **feature.properties,
-            }
-            for feature in paginated_features
-        ]
+        table_data = feature_rows(paginated_features)
 
         # Return the list of features with pagination metadata
         response_data = {
@@ -0,0 +1,8 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "spatiallab.settings")
+
+# Serves the task event stream, whose connections stay open for as long as
+# the app does. Everything else is served by the WSGI application.
+application = get_asgi_application()
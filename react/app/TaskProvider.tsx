@@ -1,12 +1,30 @@
 'use client';
-import React, { createContext, useContext, useState, ReactNode } from 'react';
-import { Task } from './types';
+import React, {
+  createContext,
+  useContext,
+  useEffect,
+  useRef,
+  useState,
+  ReactNode,
+} from 'react';
+import api from './api';
+import { Task, TaskStatus } from './types';
+
+// How often a task is polled while the event stream is down, and while it
+// is up, to catch events sent before the task was watched
+const POLL_INTERVAL_MS = 1000;
+const STREAMING_POLL_INTERVAL_MS = 10000;
+const RECONNECT_DELAY_MS = 5000;
 
 interface TasksContextType {
   tasks: Task[];
   addTask: (task: Task) => void;
   removeTask: (task_id: string) => void;
   updateTask: (task: Task) => void;
+  watchTask: (
+    task_id: string,
+    onProgress: (progress: number) => void,
+  ) => Promise<TaskStatus>;
 }
 
 const TasksContext = createContext<TasksContextType | undefined>(undefined);
@@ -21,6 +39,48 @@ export const useTasks = () => {
 
 export const TasksProvider = ({ children }: { children: ReactNode }) => {
   const [tasks, setTasks] = useState<Task[]>([]);
+  const listeners = useRef(new Map<string, (status: TaskStatus) => void>());
+  const streaming = useRef(false);
+
+  // One event stream per user carries the status of all their tasks
+  useEffect(() => {
+    if (typeof EventSource === 'undefined') return;
+    let source: EventSource | null = null;
+    let reconnect: ReturnType<typeof setTimeout> | undefined;
+
+    const connect = () => {
+      const token = localStorage.getItem('access_token');
+      if (!token) {
+        reconnect = setTimeout(connect, RECONNECT_DELAY_MS);
+        return;
+      }
+      source = new EventSource(
+        `${api.defaults.baseURL}/gis/task-events/?token=${encodeURIComponent(token)}`,
+      );
+      source.onopen = () => {
+        streaming.current = true;
+      };
+      source.addEventListener('task', (event) => {
+        const status: TaskStatus = JSON.parse((event as MessageEvent).data);
+        listeners.current.get(status.task_id)?.(status);
+      });
+      source.onerror = () => {
+        streaming.current = false;
+        // Dropped connections are retried by EventSource itself, but an
+        // error response, such as for an expired token, closes it for good
+        if (source?.readyState === EventSource.CLOSED) {
+          reconnect = setTimeout(connect, RECONNECT_DELAY_MS);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      clearTimeout(reconnect);
+      source?.close();
+      streaming.current = false;
+    };
+  }, []);
 
   const addTask = (task: Task) => {
     setTasks((tasks) => [...tasks, task]);
@@ -38,8 +98,53 @@ export const TasksProvider = ({ children }: { children: ReactNode }) => {
     );
   };
 
+  // Resolves with a task's final status, reporting its progress on the way
+  const watchTask = (
+    task_id: string,
+    onProgress: (progress: number) => void,
+  ) =>
+    new Promise<TaskStatus>((resolve) => {
+      let done = false;
+      let timer: ReturnType<typeof setTimeout> | undefined;
+
+      const handleStatus = (status: TaskStatus) => {
+        if (done) return;
+        if (status.status === 'processing') {
+          onProgress(status.progress ?? 0);
+          return;
+        }
+        done = true;
+        clearTimeout(timer);
+        listeners.current.delete(task_id);
+        resolve(status);
+      };
+
+      const poll = async () => {
+        try {
+          const response = await api.get(`/gis/check-task-status/${task_id}/`);
+          handleStatus({ ...response.data, task_id });
+        } catch (error) {
+          console.error('Error checking task status:', error);
+        }
+        schedulePoll();
+      };
+
+      const schedulePoll = () => {
+        if (done) return;
+        timer = setTimeout(
+          poll,
+          streaming.current ? STREAMING_POLL_INTERVAL_MS : POLL_INTERVAL_MS,
+        );
+      };
+
+      listeners.current.set(task_id, handleStatus);
+      schedulePoll();
+    });
+
   return (
-    <TasksContext.Provider value={{ tasks, addTask, removeTask, updateTask }}>
+    <TasksContext.Provider
+      value={{ tasks, addTask, removeTask, updateTask, watchTask }}
+    >
       {children}
     </TasksContext.Provider>
   );
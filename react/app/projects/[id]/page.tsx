@@ -67,7 +67,7 @@ export default function Page({ params }: PageProps) {
     });
 
     setMap(newMap);
-    api.get(`/gis/projects/${params.id}/`).then((response) => {
+    api.get(`/gis/projects/${params.id}/bootstrap/`).then((response) => {
       setProject({
         name: response.data.name,
         id: response.data.id,
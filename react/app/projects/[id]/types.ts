@@ -1,7 +1,16 @@
+export interface LayerStats {
+  feature_count: number;
+  extent: number[] | null;
+  extent_3857: number[] | null;
+  geometry_types: Record<string, number>;
+  properties: { name: string; type: string }[];
+}
+
 export interface Layer {
   id: number;
   name: string;
   extent?: number[];
+  stats?: LayerStats;
 }
 
 export interface Basemap {
@@ -4,3 +4,11 @@ export type Task = {
   data: object;
   progress: number;
 };
+
+export type TaskStatus = {
+  task_id: string;
+  status: 'processing' | 'completed' | 'error';
+  progress?: number;
+  data?: any;
+  error?: string;
+};
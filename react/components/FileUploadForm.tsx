@@ -30,7 +30,7 @@ const FileUploadForm: React.FC<FileUploadFormProps> = ({
 }) => {
   const [file, setFile] = useState<File | null>(null);
   const [directory, setDirectory] = useState<number | null>(null);
-  const { addTask, updateTask, removeTask } = useTasks();
+  const { addTask, updateTask, removeTask, watchTask } = useTasks();
 
   const router = useRouter();
 
@@ -83,7 +83,6 @@ const FileUploadForm: React.FC<FileUploadFormProps> = ({
             directory_id: directory,
           });
           const { task_id } = await taskResponse.data;
-          let status = 'processing';
           const task = {
             task_id,
             name: `Processing: ${file.name}`,
@@ -92,61 +91,49 @@ const FileUploadForm: React.FC<FileUploadFormProps> = ({
           };
           addTask(task);
 
-          while (status === 'processing') {
-            const statusResponse = await api.get(
-              `/gis/check-task-status/${task_id}/`,
-            );
-            const statusData = await statusResponse.data;
-            updateTask({ ...task, progress: statusData.progress });
-            status = statusData.status;
-            if (status === 'completed') {
-              const newLayerId = statusData.data.layer_id;
-              removeTask(task_id);
-              const response = await api.get(`/gis/layer/${newLayerId}/`);
-              const newLayer = response.data;
-              if (directory) {
-                const updateDirectories = (
-                  dirs: Directory[],
-                  directoryId: number,
-                  newLayer: Layer,
-                ): Directory[] => {
-                  return dirs.map((dir) => {
-                    if (dir.id === directoryId) {
-                      return {
-                        ...dir,
-                        layers: sortLayers([...dir.layers, newLayer]),
-                      };
-                    }
-                    if (dir.subdirectories) {
-                      return {
-                        ...dir,
-                        subdirectories: updateDirectories(
-                          dir.subdirectories,
-                          directoryId,
-                          newLayer,
-                        ),
-                      };
-                    }
-                    return dir;
-                  });
-                };
-                setDirectories((prevDirectories) =>
-                  updateDirectories(prevDirectories, directory, newLayer),
-                );
-              } else {
-                setHomeLayers(sortLayers([...homeLayers, newLayer]));
-              }
-              router.push(`/data?selected-layer=${newLayerId}`);
-
-              break;
-            } else if (status === 'error') {
-              console.error('Error processing file:', statusData.error);
-              removeTask(task_id);
-              break;
+          const statusData = await watchTask(task_id, (progress) =>
+            updateTask({ ...task, progress }),
+          );
+          removeTask(task_id);
+          if (statusData.status === 'completed') {
+            const newLayerId = statusData.data.layer_id;
+            const response = await api.get(`/gis/layer/${newLayerId}/`);
+            const newLayer = response.data;
+            if (directory) {
+              const updateDirectories = (
+                dirs: Directory[],
+                directoryId: number,
+                newLayer: Layer,
+              ): Directory[] => {
+                return dirs.map((dir) => {
+                  if (dir.id === directoryId) {
+                    return {
+                      ...dir,
+                      layers: sortLayers([...dir.layers, newLayer]),
+                    };
+                  }
+                  if (dir.subdirectories) {
+                    return {
+                      ...dir,
+                      subdirectories: updateDirectories(
+                        dir.subdirectories,
+                        directoryId,
+                        newLayer,
+                      ),
+                    };
+                  }
+                  return dir;
+                });
+              };
+              setDirectories((prevDirectories) =>
+                updateDirectories(prevDirectories, directory, newLayer),
+              );
+            } else {
+              setHomeLayers(sortLayers([...homeLayers, newLayer]));
             }
-
-            // Update progress indicator on the UI
-            await new Promise((resolve) => setTimeout(resolve, 1000));
+            router.push(`/data?selected-layer=${newLayerId}`);
+          } else {
+            console.error('Error processing file:', statusData.error);
           }
         } else {
           console.error('Upload failed', xhr.statusText);